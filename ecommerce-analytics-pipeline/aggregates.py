@@ -0,0 +1,177 @@
+# aggregates.py - PRE-AGGREGATED SUMMARY TABLES FOR DASHBOARDS
+import pandas as pd
+from sqlalchemy import text, bindparam
+from bulk_loader import bulk_load
+from date_dimension import date_keys
+
+IN_BATCH_SIZE = 1000  # ids per "WHERE ... IN (...)" query
+
+# Summary tables: grain (key columns) and additive measures as (source column, aggregation)
+SALES_MEASURES = {
+    'revenue': ('line_total', 'sum'),
+    'profit': ('profit', 'sum'),
+    'quantity': ('quantity', 'sum'),
+    'order_lines': ('order_id', 'size'),
+}
+AGGREGATES = {
+    'agg_sales_daily_category': {'keys': ['date_key', 'category'], 'measures': SALES_MEASURES},
+    'agg_sales_monthly_city': {'keys': ['month_key', 'city'], 'measures': SALES_MEASURES},
+    # An order lives in exactly one (date, status) cell and is always replaced as a whole,
+    # so per-batch distinct counts stay additive
+    'agg_orders_daily_status': {'keys': ['date_key', 'order_status'],
+                                'measures': {'order_count': ('order_id', 'nunique')}},
+}
+# Dimension columns the cells are keyed by: a sale counts under the version its fact row points to (SCD Type 2)
+VERSION_ATTRIBUTES = {'dim_customer': ['city'], 'dim_product': ['category']}
+KEY_COLUMN_TYPES = {'date_key': 'INT', 'month_key': 'INT', 'category': 'VARCHAR(50)',
+                    'city': 'VARCHAR(50)', 'order_status': 'VARCHAR(20)'}
+MEASURE_COLUMN_TYPES = {'revenue': 'DECIMAL(14,2)', 'profit': 'DECIMAL(14,2)', 'quantity': 'BIGINT',
+                        'order_lines': 'BIGINT', 'order_count': 'BIGINT'}
+
+def create_aggregate_tables(conn, full_refresh=True, suffix=''):
+    """CREATE the summary tables next to the star schema (suffix: staging copies of them)"""
+    for table, spec in AGGREGATES.items():
+        table += suffix
+        if full_refresh:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        columns = [f"{key} {KEY_COLUMN_TYPES[key]} NOT NULL" for key in spec['keys']]
+        columns += [f"{measure} {MEASURE_COLUMN_TYPES[measure]} NOT NULL" for measure in spec['measures']]
+        columns.append(f"PRIMARY KEY ({', '.join(spec['keys'])})")
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})"))
+
+def aggregate_sales(sales_df, sign=1):
+    """Vectorized groupby of sales rows into every summary table (sign=-1 gives retractions)"""
+    sales_df = sales_df.assign(date_key=date_keys(sales_df['order_date']) if 'date_key' not in sales_df
+                               else sales_df['date_key'])
+    sales_df = sales_df.assign(month_key=sales_df['date_key'] // 100)
+    if 'order_status' not in sales_df:
+        sales_df = sales_df.assign(order_status=sales_df['status'])
+    # Categorical labels (lean transform) need the fill value as a category first
+    for column in ['category', 'city', 'order_status']:
+        if isinstance(sales_df[column].dtype, pd.CategoricalDtype) and 'Unknown' not in sales_df[column].cat.categories:
+            sales_df[column] = sales_df[column].cat.add_categories('Unknown')
+    sales_df = sales_df.fillna({'category': 'Unknown', 'city': 'Unknown', 'order_status': 'Unknown'})
+
+    aggregates = {}
+    for table, spec in AGGREGATES.items():
+        # Money in integer cents (lean transform) is summed exactly and converted once per cell
+        measures = {}
+        cents_measures = []
+        for measure, (column, how) in spec['measures'].items():
+            if column + '_cents' in sales_df:
+                measures[measure] = (column + '_cents', how)
+                cents_measures.append(measure)
+            else:
+                measures[measure] = (column, how)
+        aggregated = sales_df.groupby(spec['keys'], as_index=False, sort=False, observed=True).agg(**measures)
+        for measure in spec['measures']:
+            aggregated[measure] = aggregated[measure] * sign
+        for measure in cents_measures:
+            aggregated[measure] = aggregated[measure] / 100
+        aggregates[table] = aggregated
+    return aggregates
+
+def aggregate_fact_rows(fact_sales_data, customer_versions, product_versions):
+    """Aggregate keyed fact_sales rows under the city/category of the dimension versions they point to
+
+    Once the rows are stored, read_fact_rows and rebuild_aggregate_months put them in the same cells,
+    so later deltas retract them from the cells they were added to.
+    """
+    return aggregate_sales(fact_sales_data.assign(
+        category=product_versions.attribute(fact_sales_data['product_key'], 'category'),
+        city=customer_versions.attribute(fact_sales_data['customer_key'], 'city')))
+
+def combine_aggregates(*aggregate_sets):
+    """Add several sets of aggregate deltas together (e.g. chunk results, or new minus old rows)"""
+    combined = {}
+    for table, spec in AGGREGATES.items():
+        frames = [aggregates[table] for aggregates in aggregate_sets if table in aggregates]
+        combined[table] = (pd.concat(frames, ignore_index=True)
+                           .groupby(spec['keys'], as_index=False, sort=False, observed=True)[list(spec['measures'])].sum())
+    return combined
+
+def load_aggregates(connectable, aggregates, suffix=''):
+    """Append freshly computed aggregates (full rebuild)"""
+    for table, aggregated in aggregates.items():
+        bulk_load(aggregated.round({'revenue': 2, 'profit': 2}), table + suffix, connectable)
+
+def read_existing_cells(conn, table, keys, delta):
+    """Current rows of the summary cells touched by a delta"""
+    first_key = keys[0]
+    values = sorted(set(delta[first_key].tolist()))
+    query = text(f"SELECT * FROM {table} WHERE {first_key} IN :values").bindparams(
+        bindparam('values', expanding=True))
+    frames = []
+    for start in range(0, len(values), IN_BATCH_SIZE):
+        frames.append(pd.read_sql(query, conn, params={'values': values[start:start + IN_BATCH_SIZE]}))
+    existing = pd.concat(frames or [pd.DataFrame(columns=delta.columns)], ignore_index=True)
+    existing = existing[list(delta.columns)].astype(delta.dtypes.to_dict())
+    # Only cells that are actually in the delta
+    return existing.merge(delta[keys], on=keys, how='inner')
+
+# Stored fact rows with the category/city they are aggregated under
+FACT_ROWS_QUERY = """
+    SELECT f.date_key, f.order_id, f.quantity, f.line_total, f.profit, f.order_status, p.category, c.city
+    FROM fact_sales f
+    LEFT JOIN dim_product p ON p.product_key = f.product_key
+    LEFT JOIN dim_customer c ON c.customer_key = f.customer_key
+    WHERE {where}
+"""
+FACT_ROW_COLUMNS = ['date_key', 'order_id', 'quantity', 'line_total', 'profit', 'order_status', 'category', 'city']
+
+def typed_fact_rows(frames):
+    # Seed an empty frame only when nothing was read: an empty object-typed frame in the concat
+    # would turn every measure into object dtype
+    fact_rows = pd.concat(frames or [pd.DataFrame(columns=FACT_ROW_COLUMNS)], ignore_index=True)
+    return fact_rows.astype({'date_key': 'int64', 'quantity': 'int64', 'line_total': 'float64', 'profit': 'float64'})
+
+def read_fact_rows(conn, order_ids):
+    """Stored fact rows of some orders with the category/city they were aggregated under"""
+    order_ids = sorted(int(i) for i in set(order_ids))
+    query = text(FACT_ROWS_QUERY.format(where="f.order_id IN :order_ids")).bindparams(
+        bindparam('order_ids', expanding=True))
+    frames = []
+    for start in range(0, len(order_ids), IN_BATCH_SIZE):
+        frames.append(pd.read_sql(query, conn, params={'order_ids': order_ids[start:start + IN_BATCH_SIZE]}))
+    return typed_fact_rows(frames)
+
+def read_month_fact_rows(conn, month_key):
+    """Stored fact rows of one YYYYMM month (a date_key range, so a single partition on MySQL)"""
+    query = text(FACT_ROWS_QUERY.format(where="f.date_key BETWEEN :first_key AND :last_key"))
+    frame = pd.read_sql(query, conn, params={'first_key': month_key * 100, 'last_key': month_key * 100 + 99})
+    return typed_fact_rows([frame] if not frame.empty else [])
+
+def rebuild_aggregate_months(conn, month_keys):
+    """Recompute every summary cell of some YYYYMM months from the stored facts (idempotent, unlike deltas)"""
+    for month_key in sorted(int(m) for m in set(month_keys)):
+        for table, spec in AGGREGATES.items():
+            if spec['keys'][0] == 'month_key':
+                conn.execute(text(f"DELETE FROM {table} WHERE month_key = :month_key"), {'month_key': month_key})
+            else:
+                conn.execute(text(f"DELETE FROM {table} WHERE date_key BETWEEN :first_key AND :last_key"),
+                             {'first_key': month_key * 100, 'last_key': month_key * 100 + 99})
+        fact_rows = read_month_fact_rows(conn, month_key)
+        if not fact_rows.empty:
+            load_aggregates(conn, aggregate_sales(fact_rows))
+
+def merge_aggregate_deltas(conn, deltas):
+    """Apply aggregate deltas to the stored summary tables: read touched cells, add, rewrite only those cells"""
+    for table, delta in deltas.items():
+        if delta.empty:
+            continue
+        spec = AGGREGATES[table]
+        keys, measures = spec['keys'], list(spec['measures'])
+        existing = read_existing_cells(conn, table, keys, delta)
+
+        merged = (pd.concat([existing[keys + measures], delta[keys + measures]], ignore_index=True)
+                  .groupby(keys, as_index=False, sort=False)[measures].sum())
+        merged = merged.round({'revenue': 2, 'profit': 2})
+        # Cells whose rows were all retracted disappear
+        merged = merged[(merged[measures] != 0).any(axis=1)]
+
+        if not existing.empty:
+            conditions = ' AND '.join(f"{key} = :{key}" for key in keys)
+            conn.execute(text(f"DELETE FROM {table} WHERE {conditions}"),
+                         existing[keys].astype(object).to_dict('records'))
+        bulk_load(merged, table, conn)
+        print(f"   {table}: merged {len(delta)} delta cells")
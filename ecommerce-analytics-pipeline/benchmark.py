@@ -0,0 +1,186 @@
+# benchmark.py - REPRODUCIBLE ETL BENCHMARKS AGAINST LOCAL SQLITE STAND-INS
+import argparse
+import json
+import os
+import shutil
+import sys
+import db
+import generate_data
+import etl_pipeline
+import export_for_powerbi
+import instrumentation
+
+# BENCHMARK SETTINGS
+# Scales are named after their number of order items (orders average 2.2 items)
+SCALES = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+ITEMS_PER_ORDER = 2.2
+ORDERS_PER_CUSTOMER = 45
+NUM_PRODUCTS = 500
+SEED = 42
+END_DATE = '2024-12-31'  # fixed, so every run generates the same rows
+BENCHMARK_DIR = 'benchmark_data'
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+TIME_THRESHOLD = 0.25  # fail when a stage is more than 25% slower than its baseline
+MEMORY_THRESHOLD = 0.25  # ... or its peak RSS grows by more than 25%
+TIME_SLACK_SECONDS = 0.5  # differences below this are timer noise on small scales
+
+def run_stage(results, stage, func, count_rows):
+    """Run one stage under the ETL instrumentation and keep its wall time, rows/sec and peak memory"""
+    with instrumentation.stage(f"benchmark_{stage}") as metrics:
+        output = func()
+        metrics.rows = count_rows(output)
+    record = metrics.result
+    results[stage] = {
+        'seconds': round(record['seconds'], 3),
+        'rows': record['rows'],
+        'rows_per_sec': record['rows_per_sec'],
+        'peak_rss_mb': record['peak_rss_mb'],
+    }
+    return output
+
+def use_sqlite_databases(scale_dir):
+    """Point the generator, the ETL and the exporter at fresh SQLite source and warehouse files"""
+    shutil.rmtree(scale_dir, ignore_errors=True)
+    os.makedirs(scale_dir)
+    instrumentation.configure(os.path.join(scale_dir, 'etl_metrics.jsonl'), os.path.join(scale_dir, 'etl_metrics.prom'))
+    db.configure(backend='sqlite', sqlite_dir=scale_dir)
+
+def generate_dataset(num_items):
+    """Generate a deterministic dataset into the source database with the sharded generator"""
+    num_orders = max(1, int(num_items / ITEMS_PER_ORDER))
+    num_customers = max(50, num_orders // ORDERS_PER_CUSTOMER)
+    if not generate_data.create_tables():
+        raise RuntimeError("could not create the source tables")
+    # One worker generates in this process, so the stand-in engine is used and its memory is measured
+    return generate_data.run_sharded_generation(num_customers, NUM_PRODUCTS, num_orders, SEED, END_DATE, workers=1,
+                                                shard_size=generate_data.SHARD_SIZE, output='db', output_dir=None)
+
+def run_scale(scale, lean=False, output_dir=BENCHMARK_DIR, engine='pandas'):
+    """Benchmark every stage of the pipeline on one dataset scale"""
+    print(f"\n BENCHMARK scale {scale} ({SCALES[scale]:,} order items)")
+    print("=" * 50)
+    scale_dir = os.path.join(output_dir, scale)
+    use_sqlite_databases(scale_dir)
+    results = {}
+
+    run_stage(results, 'generate', lambda: generate_dataset(SCALES[scale]), lambda items: items)
+
+    sources = run_stage(results, 'extract', lambda: etl_pipeline.extract_sources(lean, engine=engine),
+                        lambda frames: sum(len(df) for df in frames if df is not None))
+    if sources[0] is None:
+        raise RuntimeError("extract failed")
+
+    sales_detail_df, customer_totals = run_stage(results, 'transform',
+                                                 lambda: etl_pipeline.transform_sources(sources, lean, engine=engine),
+                                                 lambda output: len(output[0]) if output[0] is not None else 0)
+    if sales_detail_df is None:
+        raise RuntimeError("transform failed")
+    customers_df, products_df = sources[0], sources[1]
+    # Release frames later stages don't need (rebound, not deleted: the stage closures refer to the names)
+    sources = None
+
+    def load():
+        if not etl_pipeline.create_data_warehouse_tables():
+            raise RuntimeError("warehouse creation failed")
+        if not etl_pipeline.load_data_to_warehouse(sales_detail_df, customer_totals, products_df,
+                                                   customers_df if lean else None):
+            raise RuntimeError("load failed")
+        return len(sales_detail_df)
+    run_stage(results, 'load', load, lambda rows: rows)
+    sales_detail_df = customer_totals = None
+
+    def export():
+        if not export_for_powerbi.export_columnar_for_powerbi(os.path.join(scale_dir, 'powerbi_export')):
+            raise RuntimeError("export failed")
+        manifest = export_for_powerbi.load_manifest(os.path.join(scale_dir, 'powerbi_export'))
+        return sum(partition['rows'] for partition in manifest['fact_partitions'].values())
+    run_stage(results, 'export', export, lambda rows: rows)
+
+    return results
+
+def compare_to_baseline(results, baseline, time_threshold=TIME_THRESHOLD, memory_threshold=MEMORY_THRESHOLD):
+    """List the stages that got slower or bigger than the baseline allows"""
+    regressions = []
+    print("\n BENCHMARK vs baseline:")
+    for scale, stages in results.items():
+        if scale not in baseline:
+            print(f"   {scale}: no baseline")
+            continue
+        for stage, current in stages.items():
+            previous = baseline[scale].get(stage)
+            if not previous:
+                continue
+            time_change = current['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0.0
+            line = f"   {scale} {stage}: {current['seconds']:.2f}s vs {previous['seconds']:.2f}s ({time_change:+.0%})"
+            if time_change > time_threshold and current['seconds'] - previous['seconds'] > TIME_SLACK_SECONDS:
+                regressions.append(f"{scale} {stage}: {time_change:+.0%} wall time")
+            if current.get('peak_rss_mb') and previous.get('peak_rss_mb'):
+                memory_change = current['peak_rss_mb'] / previous['peak_rss_mb'] - 1
+                line += f", peak RSS {current['peak_rss_mb']:,.1f} MB vs {previous['peak_rss_mb']:,.1f} MB ({memory_change:+.0%})"
+                if memory_change > memory_threshold:
+                    regressions.append(f"{scale} {stage}: {memory_change:+.0%} peak RSS")
+            print(line)
+    return regressions
+
+def load_baseline(path=BASELINE_FILE):
+    """Read the committed baseline ({} when there is none yet)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_FILE):
+    """Merge these results into the baseline file"""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f" Baseline updated: {path}")
+
+def main(scales=None, lean=False, update_baseline=False, time_threshold=TIME_THRESHOLD,
+         memory_threshold=MEMORY_THRESHOLD, results_file=None, engine='pandas'):
+    """Run the benchmarks and return a process exit code (1 on regressions)"""
+    results = {}
+    for scale in scales or ['10k']:
+        # Lean runs and the SQL transform engine have their own baseline entries
+        key = scale + ('-lean' if lean else '') + ('-sql' if engine == 'sql' else '')
+        results[key] = run_scale(scale, lean, engine=engine)
+
+    if results_file:
+        with open(results_file, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if update_baseline:
+        save_baseline(results)
+        return 0
+
+    regressions = compare_to_baseline(results, load_baseline(), time_threshold, memory_threshold)
+    if regressions:
+        print("\n BENCHMARK REGRESSIONS:")
+        for regression in regressions:
+            print(f"   - {regression}")
+        return 1
+    print("\n No regressions beyond the thresholds")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ETL pipeline on generated SQLite datasets")
+    parser.add_argument('--scale', action='append', choices=list(SCALES),
+                        help="dataset scale to run (repeatable; default: 10k)")
+    parser.add_argument('--lean', action='store_true', help="benchmark the lean extract/transform")
+    parser.add_argument('--transform-engine', choices=etl_pipeline.transform_engine.TRANSFORM_ENGINES,
+                        default='pandas', help="transform engine to benchmark")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="write these results into the baseline file instead of comparing")
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD,
+                        help="allowed wall-time increase per stage (0.25 = 25%%)")
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD,
+                        help="allowed peak-RSS increase per stage (0.25 = 25%%)")
+    parser.add_argument('--results', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+    sys.exit(main(args.scale, args.lean, args.update_baseline, args.time_threshold,
+                  args.memory_threshold, args.results, args.transform_engine))
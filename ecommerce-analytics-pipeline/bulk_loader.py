@@ -0,0 +1,109 @@
+# bulk_loader.py - PLUGGABLE BULK LOADER FOR DATAFRAMES
+import os
+import tempfile
+import time
+import pandas as pd
+from sqlalchemy.engine import Engine
+from sqlalchemy import text
+from instrumentation import stage
+
+# LOADER SETTINGS (override with environment variables or configure())
+LOAD_STRATEGY = os.environ.get('ETL_LOAD_STRATEGY', 'executemany')
+LOAD_BATCH_SIZE = int(os.environ.get('ETL_LOAD_BATCH_SIZE', '10000'))
+
+def configure(strategy=None, batch_size=None):
+    """Change the default load strategy and batch size for this process"""
+    global LOAD_STRATEGY, LOAD_BATCH_SIZE
+    if strategy:
+        if strategy not in LOADERS:
+            raise ValueError(f"Unknown load strategy '{strategy}' (choose from {', '.join(LOADERS)})")
+        LOAD_STRATEGY = strategy
+    if batch_size:
+        LOAD_BATCH_SIZE = batch_size
+
+def _rows(df):
+    """DataFrame rows as tuples of plain Python values (NaN/NaT -> None) that every DBAPI driver accepts"""
+    columns = []
+    for _, column in df.items():
+        if pd.api.types.is_datetime64_any_dtype(column):
+            values = column.dt.to_pydatetime().astype(object)
+        else:
+            values = column.to_numpy(dtype=object)
+        values[column.isna().to_numpy()] = None
+        columns.append(values)
+    return list(zip(*columns))
+
+def _insert_batches(conn, df, table, batch_size):
+    """INSERT df in batches through the DBAPI cursor's executemany"""
+    placeholder = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+    columns = ', '.join(df.columns)
+    values = ', '.join([placeholder] * len(df.columns))
+    insert_sql = f"INSERT INTO {table} ({columns}) VALUES ({values})"
+
+    cursor = conn.connection.cursor()
+    try:
+        for start in range(0, len(df), batch_size):
+            cursor.executemany(insert_sql, _rows(df.iloc[start:start + batch_size]))
+    finally:
+        cursor.close()
+
+def load_executemany(conn, df, table, batch_size):
+    """Batched executemany; PyMySQL rewrites each batch into multi-row INSERT statements"""
+    _insert_batches(conn, df, table, batch_size)
+
+def load_data_infile(conn, df, table, batch_size):
+    """MySQL LOAD DATA LOCAL INFILE from temporary CSV files (needs local_infile on client and server)"""
+    if conn.dialect.name != 'mysql':
+        raise ValueError("load_data_infile strategy requires a MySQL connection")
+
+    # Booleans as 0/1 and NULLs as \N, the way LOAD DATA reads them
+    df = df.copy()
+    for column in df.columns[df.dtypes == bool]:
+        df[column] = df[column].astype(int)
+
+    for start in range(0, len(df), batch_size):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        try:
+            df.iloc[start:start + batch_size].to_csv(path, index=False, header=False, na_rep='\\N',
+                                                     date_format='%Y-%m-%d %H:%M:%S', lineterminator='\n')
+            conn.execute(text(
+                f"LOAD DATA LOCAL INFILE '{path.replace(os.sep, '/')}' INTO TABLE {table} "
+                f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+                f"({', '.join(df.columns)})"
+            ))
+        finally:
+            os.remove(path)
+
+def load_sqlite(conn, df, table, batch_size):
+    """SQLite stand-in for local testing: executemany inside a single transaction"""
+    if conn.dialect.name != 'sqlite':
+        raise ValueError("sqlite strategy requires a SQLite connection")
+    _insert_batches(conn, df, table, batch_size)
+
+LOADERS = {
+    'executemany': load_executemany,
+    'load_data_infile': load_data_infile,
+    'sqlite': load_sqlite,
+}
+
+def bulk_load(df, table, connectable, strategy=None, batch_size=None):
+    """Append df to table with the configured strategy and report rows/sec"""
+    strategy = strategy or LOAD_STRATEGY
+    batch_size = batch_size or LOAD_BATCH_SIZE
+    loader = LOADERS[strategy]
+
+    start_time = time.perf_counter()
+    with stage('load_table', table) as metrics:
+        if len(df):
+            if isinstance(connectable, Engine):
+                with connectable.begin() as conn:
+                    loader(conn, df, table, batch_size)
+            else:
+                loader(connectable, df, table, batch_size)
+        metrics.record(df)
+    seconds = time.perf_counter() - start_time
+
+    rows_per_sec = len(df) / seconds if seconds > 0 else 0.0
+    print(f"   {table}: {len(df)} rows in {seconds:.2f}s ({rows_per_sec:,.0f} rows/sec, {strategy})")
+    return {'table': table, 'rows': len(df), 'seconds': seconds, 'rows_per_sec': rows_per_sec, 'strategy': strategy}
@@ -0,0 +1,147 @@
+# checkpoint.py - CONTENT-ADDRESSED CHECKPOINTS OF EXTRACTED AND TRANSFORMED FRAMES
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from pyarrow import feather
+from sqlalchemy import text
+
+# CHECKPOINT SETTINGS (override with environment variables or configure())
+CHECKPOINT_DIR = os.environ.get('ETL_CHECKPOINT_DIR', '.etl_checkpoints')
+CHECKPOINT_BUDGET_MB = float(os.environ.get('ETL_CHECKPOINT_BUDGET_MB', '2048'))  # LRU eviction above this
+META_FILE = 'meta.json'
+
+def configure(checkpoint_dir=None, budget_mb=None):
+    """Change the checkpoint directory and disk budget for this process"""
+    global CHECKPOINT_DIR, CHECKPOINT_BUDGET_MB
+    if checkpoint_dir:
+        CHECKPOINT_DIR = checkpoint_dir
+    if budget_mb is not None:
+        CHECKPOINT_BUDGET_MB = budget_mb
+
+def source_fingerprint(engine, table_keys):
+    """Row count, max id and max created_at of every source table"""
+    state = {}
+    with engine.connect() as conn:
+        for table, key in table_keys.items():
+            row = conn.execute(text(
+                f"SELECT COUNT(*), MAX({key}), MAX(created_at) FROM {table}"
+            )).fetchone()
+            state[table] = [int(row[0]), int(row[1] or 0), str(row[2]) if row[2] is not None else None]
+    return state
+
+def code_version(*functions):
+    """Hash of the source code of the functions that produce a checkpoint"""
+    digest = hashlib.sha256()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    return digest.hexdigest()[:16]
+
+def checkpoint_key(kind, key_parts):
+    """Content address of a checkpoint: its kind plus a hash of everything its frames depend on"""
+    digest = hashlib.sha256(json.dumps(key_parts, sort_keys=True, default=str).encode()).hexdigest()[:20]
+    return f"{kind}-{digest}"
+
+def _touch(path, meta):
+    """Record a use of the checkpoint for LRU eviction"""
+    meta['last_used'] = time.time()
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+def load_checkpoint(key, names):
+    """Frames of a checkpoint, converted from memory-mapped Arrow files (None when missing or unreadable)
+
+    Zero-copy columns are read-only: assign new columns instead of writing into them in place.
+    """
+    path = os.path.join(CHECKPOINT_DIR, key)
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        frames = []
+        for name in names:
+            if name in meta['missing']:
+                frames.append(None)
+                continue
+            # The mapped Arrow columns are converted one at a time and released as they go, so a frame
+            # is not held twice; numeric columns without nulls can stay zero-copy views of the file
+            table = feather.read_table(os.path.join(path, f"{name}.arrow"), memory_map=True)
+            frames.append(table.to_pandas(split_blocks=True, self_destruct=True))
+            del table
+        _touch(path, meta)
+        return tuple(frames)
+    except Exception as e:
+        print(f" CHECKPOINT {key} unreadable, recomputing: {e}")
+        return None
+
+def save_checkpoint(key, names, frames):
+    """Write the frames of a checkpoint, then evict least recently used checkpoints over the budget"""
+    path = os.path.join(CHECKPOINT_DIR, key)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(temporary_path, exist_ok=True)
+        missing = []
+        for name, df in zip(names, frames):
+            if df is None:
+                missing.append(name)
+                continue
+            feather.write_feather(df.reset_index(drop=True), os.path.join(temporary_path, f"{name}.arrow"),
+                                  compression='uncompressed')
+        _touch(temporary_path, {'key': key, 'names': list(names), 'missing': missing, 'created': time.time()})
+        # A complete checkpoint appears in one rename, so a crash never leaves a half-written one
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temporary_path, path)
+    except Exception as e:
+        # Checkpoints are an optimization: a frame Arrow cannot store just means no checkpoint
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        print(f" CHECKPOINT {key} not saved: {e}")
+        return False
+    evict_checkpoints(keep=key)
+    return True
+
+def checkpoint_sizes():
+    """(last_used, bytes, key) of every stored checkpoint"""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+    checkpoints = []
+    for key in os.listdir(CHECKPOINT_DIR):
+        meta_path = os.path.join(CHECKPOINT_DIR, key, META_FILE)
+        if not os.path.exists(meta_path):
+            continue
+        with open(meta_path) as f:
+            last_used = json.load(f).get('last_used', 0)
+        directory = os.path.join(CHECKPOINT_DIR, key)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        checkpoints.append((last_used, size, key))
+    return checkpoints
+
+def evict_checkpoints(keep=None, budget_mb=None):
+    """Delete least recently used checkpoints until the rest fit in the disk budget"""
+    budget = (CHECKPOINT_BUDGET_MB if budget_mb is None else budget_mb) * 1024 * 1024
+    checkpoints = sorted(checkpoint_sizes())
+    total = sum(size for _, size, _ in checkpoints)
+    for _, size, key in checkpoints:
+        if total <= budget:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(CHECKPOINT_DIR, key), ignore_errors=True)
+        total -= size
+        print(f" CHECKPOINT evicted {key} ({size / 1e6:,.1f} MB)")
+
+def cached(kind, key_parts, compute, names):
+    """Return compute()'s frames from a matching checkpoint, or compute and store them"""
+    key = checkpoint_key(kind, key_parts)
+    frames = load_checkpoint(key, names)
+    if frames is not None:
+        print(f" CHECKPOINT hit: reusing {key}")
+        return frames
+    frames = compute()
+    # Failed stages return None frames (first one included), which are never checkpointed
+    if frames[0] is not None:
+        save_checkpoint(key, names, frames)
+    return frames
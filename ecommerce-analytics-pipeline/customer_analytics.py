@@ -0,0 +1,255 @@
+# customer_analytics.py - VECTORIZED CUSTOMER ANALYTICS (SEGMENTS, RFM, COHORTS, CLV)
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam
+from bulk_loader import bulk_load
+from date_dimension import date_keys
+from key_lookup import UNKNOWN_MEMBER_KEY
+
+IN_BATCH_SIZE = 1000  # ids per "WHERE ... IN (...)" query
+
+# SEGMENT SETTINGS
+SPEND_SEGMENTS = [(1000, 'Premium'), (500, 'Gold')]  # lifetime total_amount above -> customer_segment
+DEFAULT_SEGMENT = 'Standard'
+RFM_BINS = 5  # quantile bins per score: 5 is best (most recent, most orders, most spent)
+PROFIT_MARGIN = 0.3  # same margin as the profit column of the facts
+CLV_HORIZON_MONTHS = 24  # CLV = margin on the customer's monthly spend over this horizon
+CLV_MIN_TENURE_MONTHS = 3  # so one recent order is not projected as a monthly habit
+
+# dim_customer columns maintained here (besides customer_id, name, city and total_spent)
+METRIC_COLUMNS = ['order_count', 'first_order_date', 'last_order_date', 'cohort_month']
+SCORE_COLUMNS = ['customer_segment', 'recency_days', 'r_score', 'f_score', 'm_score', 'rfm_segment', 'clv']
+DIM_CUSTOMER_COLUMN_TYPES = {
+    'order_count': 'INT', 'first_order_date': 'DATE', 'last_order_date': 'DATE', 'cohort_month': 'INT',
+    'recency_days': 'INT', 'r_score': 'SMALLINT', 'f_score': 'SMALLINT', 'm_score': 'SMALLINT',
+    'rfm_segment': 'VARCHAR(20)', 'clv': 'DECIMAL(12,2)',
+}
+
+# COHORT TABLES: months are YYYYMM keys like month_key of the summary tables
+COHORT_TABLES = {
+    # One row per customer and month with orders: the grain retention is counted from
+    'customer_cohort_activity': {
+        'columns': {'customer_id': 'INT NOT NULL', 'activity_month': 'INT NOT NULL', 'cohort_month': 'INT NOT NULL',
+                    'months_since': 'INT NOT NULL', 'orders': 'INT NOT NULL', 'revenue': 'DECIMAL(14,2) NOT NULL'},
+        'keys': ['customer_id', 'activity_month'],
+    },
+    # The retention matrix: cohort x months since acquisition
+    'cohort_retention': {
+        'columns': {'cohort_month': 'INT NOT NULL', 'months_since': 'INT NOT NULL', 'cohort_size': 'INT NOT NULL',
+                    'active_customers': 'INT NOT NULL', 'retention_rate': 'DECIMAL(7,4) NOT NULL',
+                    'revenue': 'DECIMAL(14,2) NOT NULL'},
+        'keys': ['cohort_month', 'months_since'],
+    },
+}
+
+def create_cohort_tables(conn, full_refresh=True, suffix=''):
+    """CREATE the cohort tables next to the star schema (suffix: staging copies of them)"""
+    for table, spec in COHORT_TABLES.items():
+        table += suffix
+        if full_refresh:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        columns = [f"{column} {column_type}" for column, column_type in spec['columns'].items()]
+        columns.append(f"PRIMARY KEY ({', '.join(spec['keys'])})")
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})"))
+
+def month_number(month_keys):
+    """YYYYMM keys as a running month count, so month differences are plain subtraction"""
+    month_keys = np.asarray(month_keys, dtype=np.int64)
+    return (month_keys // 100) * 12 + month_keys % 100
+
+def month_keys(dates):
+    """YYYYMM keys of dates"""
+    return date_keys(dates) // 100
+
+def customer_metrics(orders_df, customers_df):
+    """Per-customer lifetime total, order count, first/last order date and cohort from order rows"""
+    orders = orders_df[['customer_id', 'order_date', 'total_amount']]
+    metrics = (orders.assign(order_date=pd.to_datetime(orders['order_date']))
+               .groupby('customer_id', as_index=False, sort=False, observed=True)
+               .agg(total_amount=('total_amount', 'sum'), order_count=('total_amount', 'size'),
+                    first_order_date=('order_date', 'min'), last_order_date=('order_date', 'max')))
+    # Money sums to whole cents, whatever order the floats were added in
+    metrics['total_amount'] = metrics['total_amount'].round(2)
+    return with_cohorts(metrics, customers_df)
+
+def combine_customer_metrics(*metric_sets):
+    """Combine per-customer metrics of several order batches (e.g. streaming chunks)"""
+    frames = [m for m in metric_sets if m is not None and not m.empty]
+    metrics = pd.concat(frames or [pd.DataFrame(columns=['customer_id', 'total_amount'] + METRIC_COLUMNS)],
+                        ignore_index=True)
+    return (metrics.groupby('customer_id', as_index=False, sort=False)
+            .agg(total_amount=('total_amount', 'sum'), order_count=('order_count', 'sum'),
+                 first_order_date=('first_order_date', 'min'), last_order_date=('last_order_date', 'max'),
+                 cohort_month=('cohort_month', 'min')))
+
+def with_cohorts(metrics, customers_df):
+    """Add the acquisition cohort: the month of registration, or of the first order when that came earlier"""
+    registrations = customers_df[['customer_id', 'registration_date']].drop_duplicates('customer_id')
+    metrics = metrics.merge(registrations, on='customer_id', how='left')
+    # Customers without a registration date are acquired with their first order
+    registration_dates = pd.to_datetime(metrics['registration_date']).fillna(metrics['first_order_date'])
+    metrics['cohort_month'] = np.minimum(month_keys(registration_dates), month_keys(metrics['first_order_date']))
+    return metrics.drop(columns='registration_date')
+
+def quantile_scores(values, bins=RFM_BINS):
+    """1..bins by percentile rank, so each score holds about 1/bins of the customers (ties share a score)"""
+    if len(values) == 0:
+        return pd.Series([], dtype='int8', index=values.index)
+    return np.ceil(values.rank(method='average', pct=True) * bins).clip(1, bins).astype('int8')
+
+def spend_segments(total_amount):
+    """Premium/Gold/Standard from lifetime spend, as one vectorized select"""
+    return np.select([total_amount > threshold for threshold, _ in SPEND_SEGMENTS],
+                     [segment for _, segment in SPEND_SEGMENTS], default=DEFAULT_SEGMENT)
+
+def rfm_segments(r_score, f_score, m_score):
+    """Named RFM segments (rules assume RFM_BINS = 5; the first matching rule wins)"""
+    return np.select([
+        (r_score >= 4) & (f_score >= 4) & (m_score >= 4),
+        f_score >= 4,
+        (r_score >= 4) & (f_score <= 2),
+        (r_score <= 2) & (f_score >= 3),
+        r_score <= 2,
+    ], ['Champions', 'Loyal', 'New', 'At Risk', 'Hibernating'], default='Needs Attention')
+
+def score_customers(metrics, as_of=None):
+    """Add spend segment, recency, RFM scores/segment and CLV to per-customer metrics, column at a time"""
+    metrics = metrics.copy()
+    first_order_date = pd.to_datetime(metrics['first_order_date'])
+    last_order_date = pd.to_datetime(metrics['last_order_date'])
+    # Recency is measured from the newest order in the data, so reruns on the same data score the same
+    as_of = last_order_date.max() if as_of is None else pd.Timestamp(as_of)
+
+    metrics['customer_segment'] = spend_segments(metrics['total_amount'])
+    metrics['recency_days'] = (as_of - last_order_date).dt.days
+    metrics['r_score'] = quantile_scores(-metrics['recency_days'])
+    metrics['f_score'] = quantile_scores(metrics['order_count'])
+    metrics['m_score'] = quantile_scores(metrics['total_amount'])
+    metrics['rfm_segment'] = rfm_segments(metrics['r_score'], metrics['f_score'], metrics['m_score'])
+
+    tenure_months = np.maximum((as_of - first_order_date).dt.days / 30.44, CLV_MIN_TENURE_MONTHS)
+    metrics['clv'] = (metrics['total_amount'] / tenure_months * PROFIT_MARGIN * CLV_HORIZON_MONTHS).round(2)
+    return metrics
+
+def customer_activity(sales_df):
+    """Orders and revenue per customer and month from sales rows (enriched sales or stored facts)"""
+    keys = sales_df['date_key'] if 'date_key' in sales_df else date_keys(sales_df['order_date'])
+    # Lean frames carry money as integer cents: summed exactly, converted once per row
+    revenue = 'line_total_cents' if 'line_total_cents' in sales_df else 'line_total'
+    activity = (pd.DataFrame({'customer_id': sales_df['customer_id'].to_numpy(),
+                              'activity_month': np.asarray(keys) // 100,
+                              'order_id': sales_df['order_id'].to_numpy(),
+                              'revenue': sales_df[revenue].to_numpy()})
+                .groupby(['customer_id', 'activity_month'], as_index=False, sort=False)
+                .agg(orders=('order_id', 'nunique'), revenue=('revenue', 'sum')))
+    if revenue == 'line_total_cents':
+        activity['revenue'] = activity['revenue'] / 100
+    return activity
+
+def combine_activity(*activity_sets):
+    """Add customer activity of several order batches (an order is always in exactly one batch)"""
+    frames = [a for a in activity_sets if a is not None and not a.empty]
+    activity = pd.concat(frames or [pd.DataFrame(columns=['customer_id', 'activity_month', 'orders', 'revenue'])],
+                         ignore_index=True)
+    return activity.groupby(['customer_id', 'activity_month'], as_index=False, sort=False)[['orders', 'revenue']].sum()
+
+def with_months_since(activity, cohorts):
+    """Attach each customer's cohort and the months from acquisition to the activity month"""
+    activity = activity.merge(cohorts[['customer_id', 'cohort_month']], on='customer_id', how='inner')
+    activity['cohort_month'] = activity['cohort_month'].astype('int64')
+    activity['months_since'] = month_number(activity['activity_month']) - month_number(activity['cohort_month'])
+    return activity[list(COHORT_TABLES['customer_cohort_activity']['columns'])].round({'revenue': 2})
+
+def build_cohort_retention(activity, cohorts):
+    """Retention matrix: active customers and revenue per cohort and month since acquisition"""
+    sizes = (cohorts.groupby('cohort_month', as_index=False, sort=False)
+             .agg(cohort_size=('customer_id', 'size')))
+    retention = (activity.groupby(['cohort_month', 'months_since'], as_index=False, sort=True)
+                 .agg(active_customers=('customer_id', 'size'), revenue=('revenue', 'sum')))
+    retention = retention.merge(sizes, on='cohort_month', how='left')
+    retention['cohort_size'] = retention['cohort_size'].fillna(0).astype('int64')
+    retention['retention_rate'] = (retention['active_customers'] / retention['cohort_size'].clip(lower=1)).round(4)
+    return retention[list(COHORT_TABLES['cohort_retention']['columns'])].round({'revenue': 2})
+
+def load_cohorts(connectable, activity, cohorts, suffix=''):
+    """Append the customer activity and retention matrix of a full load; returns both frames"""
+    activity = with_months_since(activity, cohorts)
+    retention = build_cohort_retention(activity, cohorts)
+    bulk_load(activity, 'customer_cohort_activity' + suffix, connectable)
+    bulk_load(retention, 'cohort_retention' + suffix, connectable)
+    return activity, retention
+
+def read_in_batches(conn, query, name, values, empty_columns):
+    """Run a "... IN :name" query over values in batches of IN_BATCH_SIZE"""
+    values = sorted(int(v) for v in set(values))
+    query = text(query).bindparams(bindparam(name, expanding=True))
+    frames = [pd.read_sql(query, conn, params={name: values[start:start + IN_BATCH_SIZE]})
+              for start in range(0, len(values), IN_BATCH_SIZE)]
+    return pd.concat(frames or [pd.DataFrame(columns=empty_columns)], ignore_index=True)
+
+def rescore_customers(conn, customer_ids):
+    """Re-score the stored customers after some customers' metrics changed; rewrite only rows whose scores changed
+
+    Scores are percentile ranks and recency is measured from the newest order, so one customer's new order
+    can move anyone's scores: when customer_ids is not empty this costs one scan of the current
+    dim_customer rows (the score inputs only), never of the facts. Without changed customers nothing moves.
+    """
+    if len(customer_ids) == 0:
+        return 0
+    current = pd.read_sql(text(f"""
+        SELECT customer_id, total_spent AS total_amount, order_count, first_order_date, last_order_date,
+               {', '.join(SCORE_COLUMNS)}
+        FROM dim_customer WHERE customer_key <> :unknown AND is_current = 1
+    """), conn, params={'unknown': UNKNOWN_MEMBER_KEY})
+    if current.empty:
+        return 0
+    current['total_amount'] = current['total_amount'].astype(float)
+    scored = score_customers(current.drop(columns=SCORE_COLUMNS))
+
+    changed = np.zeros(len(current), dtype=bool)
+    for column in SCORE_COLUMNS:
+        changed |= (scored[column].astype(object).to_numpy() != current[column].astype(object).to_numpy())
+    updates = scored.loc[changed, ['customer_id'] + SCORE_COLUMNS]
+    if not updates.empty:
+        assignments = ', '.join(f"{column} = :{column}" for column in SCORE_COLUMNS)
+        conn.execute(text(f"UPDATE dim_customer SET {assignments} WHERE customer_id = :customer_id AND is_current = 1"),
+                     updates.astype(object).where(updates.notna(), None).to_dict('records'))
+    return len(updates)
+
+def refresh_customer_cohorts(conn, customer_ids):
+    """Rebuild the activity rows of some customers from the stored facts, then their cohorts' retention rows"""
+    customer_ids = sorted(int(i) for i in set(customer_ids))
+    old_cohorts = read_in_batches(conn, "SELECT DISTINCT cohort_month FROM customer_cohort_activity "
+                                        "WHERE customer_id IN :ids", 'ids', customer_ids, ['cohort_month'])
+    sales = read_in_batches(conn, """
+        SELECT c.customer_id, f.order_id, f.date_key, f.line_total
+        FROM fact_sales f JOIN dim_customer c ON c.customer_key = f.customer_key
+        WHERE c.customer_id IN :ids
+    """, 'ids', customer_ids, ['customer_id', 'order_id', 'date_key', 'line_total'])
+    sales = sales.astype({'customer_id': 'int64', 'date_key': 'int64', 'line_total': 'float64'})
+    # Facts of every version count towards the customer; the cohort comes from the current version
+    cohorts = read_in_batches(conn, "SELECT customer_id, cohort_month FROM dim_customer "
+                                    "WHERE is_current = 1 AND customer_id IN :ids",
+                              'ids', customer_ids, ['customer_id', 'cohort_month']).dropna()
+
+    delete_activity = text("DELETE FROM customer_cohort_activity WHERE customer_id IN :ids").bindparams(
+        bindparam('ids', expanding=True))
+    for start in range(0, len(customer_ids), IN_BATCH_SIZE):
+        conn.execute(delete_activity, {'ids': customer_ids[start:start + IN_BATCH_SIZE]})
+    activity = with_months_since(customer_activity(sales), cohorts)
+    bulk_load(activity, 'customer_cohort_activity', conn)
+
+    # Retention cells are distinct counts, so touched cohorts are recomputed from their activity rows
+    cohort_months = sorted(set(old_cohorts['cohort_month'].astype(int)) | set(cohorts['cohort_month'].astype(int)))
+    cohort_activity = read_in_batches(conn, "SELECT * FROM customer_cohort_activity WHERE cohort_month IN :months",
+                                      'months', cohort_months, list(COHORT_TABLES['customer_cohort_activity']['columns']))
+    cohort_members = read_in_batches(conn, "SELECT customer_id, cohort_month FROM dim_customer "
+                                           "WHERE is_current = 1 AND cohort_month IN :months", 'months', cohort_months,
+                                     ['customer_id', 'cohort_month'])
+    delete_retention = text("DELETE FROM cohort_retention WHERE cohort_month IN :months").bindparams(
+        bindparam('months', expanding=True))
+    for start in range(0, len(cohort_months), IN_BATCH_SIZE):
+        conn.execute(delete_retention, {'months': cohort_months[start:start + IN_BATCH_SIZE]})
+    cohort_activity = cohort_activity.astype({'revenue': 'float64'})
+    bulk_load(build_cohort_retention(cohort_activity, cohort_members), 'cohort_retention', conn)
+    return len(activity), len(cohort_months)
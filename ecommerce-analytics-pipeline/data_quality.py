@@ -0,0 +1,251 @@
+# data_quality.py - DECLARATIVE, VECTORIZED DATA-QUALITY CHECKS ON THE EXTRACTED FRAMES
+import json
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from instrumentation import RUN_ID
+
+# DATA QUALITY SETTINGS (override with environment variables or configure())
+QUALITY_ACTIONS = ['warn', 'quarantine', 'fail']  # what a violation does: report it, drop its orders, stop the run
+QUALITY_ACTION = os.environ.get('ETL_QUALITY_ACTION', 'warn')
+REPORT_FILE = os.environ.get('ETL_QUALITY_REPORT', 'data_quality.jsonl')  # one JSON line per rule and run
+QUARANTINE_DIR = os.environ.get('ETL_QUARANTINE_DIR', 'quarantine')
+MONEY_TOLERANCE = 0.01  # totals may differ from their items by rounding
+SAMPLE_SIZE = 5  # violating keys listed per rule in the report
+SOURCE_FRAMES = ['customers', 'products', 'orders', 'order_items']  # also the source table names
+SAMPLE_KEYS = {'orders': 'order_id', 'order_items': 'item_id', 'customers': 'customer_id', 'products': 'product_id'}
+
+_quarantined_order_ids = set()  # since the last saved high-water marks, to be re-queued by the next incremental run
+
+# RULES: each check runs once over a whole frame (or chunk) and flags the violating rows
+RULES = [
+    {'rule': 'orders_customer_exists', 'frame': 'orders', 'check': 'references', 'column': 'customer_id',
+     'target': 'customers'},
+    {'rule': 'orders_date_not_null', 'frame': 'orders', 'check': 'not_null', 'column': 'order_date'},
+    {'rule': 'orders_total_matches_items', 'frame': 'orders', 'check': 'reconciles', 'column': 'total_amount',
+     'detail': 'order_items', 'key': 'order_id', 'amount': ['quantity', 'unit_price']},
+    {'rule': 'items_order_exists', 'frame': 'order_items', 'check': 'references', 'column': 'order_id',
+     'target': 'orders'},
+    {'rule': 'items_product_exists', 'frame': 'order_items', 'check': 'references', 'column': 'product_id',
+     'target': 'products'},
+    {'rule': 'items_quantity_not_null', 'frame': 'order_items', 'check': 'not_null', 'column': 'quantity'},
+    {'rule': 'items_quantity_positive', 'frame': 'order_items', 'check': 'range', 'column': 'quantity', 'min': 1},
+    {'rule': 'items_unit_price_not_negative', 'frame': 'order_items', 'check': 'range', 'column': 'unit_price',
+     'min': 0},
+]
+
+def configure(action=None, report_file=None, quarantine_dir=None):
+    """Change what violations do and where reports and quarantined rows go"""
+    global QUALITY_ACTION, REPORT_FILE, QUARANTINE_DIR
+    if action is not None:
+        QUALITY_ACTION = action
+    if report_file is not None:
+        REPORT_FILE = report_file
+    if quarantine_dir is not None:
+        QUARANTINE_DIR = quarantine_dir
+
+def has_column(df, column):
+    # Lean frames carry money as integer <column>_cents
+    return column in df or column + '_cents' in df
+
+def column_values(df, column):
+    """A column as numbers, converting lean integer cents back to money"""
+    if column in df:
+        return df[column]
+    return df[column + '_cents'] / 100
+
+def check_not_null(frames, df, rule):
+    return df[rule['column']].isna().to_numpy()
+
+def check_range(frames, df, rule):
+    values = pd.to_numeric(column_values(df, rule['column']), errors='coerce')
+    violations = np.zeros(len(df), dtype=bool)
+    if 'min' in rule:
+        violations |= (values < rule['min']).to_numpy()
+    if 'max' in rule:
+        violations |= (values > rule['max']).to_numpy()
+    return violations
+
+def check_references(frames, df, rule):
+    """Keys missing from the referenced frame (hash membership); NULL keys are the not_null rules' job"""
+    column = rule['column']
+    known = frames[rule['target']][rule.get('target_column', column)]
+    return (df[column].notna() & ~df[column].isin(known)).to_numpy()
+
+def check_reconciles(frames, df, rule):
+    """Header amounts that differ from the sum of their detail rows (one groupby over the details)"""
+    detail, key = frames[rule['detail']], rule['key']
+    amounts = pd.Series(1.0, index=detail.index)
+    for column in rule['amount']:
+        amounts = amounts * column_values(detail, column).astype(float)
+    detail_totals = amounts.groupby(detail[key].to_numpy()).sum()
+    expected = df[key].map(detail_totals).fillna(0.0)
+    difference = (column_values(df, rule['column']).astype(float) - expected).abs()
+    return (difference > rule.get('tolerance', MONEY_TOLERANCE)).to_numpy()
+
+CHECKS = {
+    'not_null': check_not_null,
+    'range': check_range,
+    'references': check_references,
+    'reconciles': check_reconciles,
+}
+
+def rule_columns(rule):
+    """(frame, column) pairs a rule reads"""
+    columns = [(rule['frame'], rule['column'])]
+    if rule['check'] == 'references':
+        columns.append((rule['target'], rule.get('target_column', rule['column'])))
+    if rule['check'] == 'reconciles':
+        columns += [(rule['detail'], column) for column in rule['amount'] + [rule['key']]]
+        columns.append((rule['frame'], rule['key']))
+    return columns
+
+def run_rules(frames, rules=RULES):
+    """Evaluate every rule whose frames and columns are present: {rule: violation mask}, skipped rule names"""
+    masks, skipped = {}, []
+    for rule in rules:
+        if not all(frames.get(frame) is not None and has_column(frames[frame], column)
+                   for frame, column in rule_columns(rule)):
+            skipped.append(rule['rule'])
+            continue
+        masks[rule['rule']] = CHECKS[rule['check']](frames, frames[rule['frame']], rule)
+    return masks, skipped
+
+def summarize(frames, masks, rules=RULES):
+    """Per-rule violation counts with a sample of the violating keys"""
+    summary = []
+    for rule in rules:
+        if rule['rule'] not in masks:
+            continue
+        df, mask = frames[rule['frame']], masks[rule['rule']]
+        # Items are sampled by item_id where the extract kept it (the lean extract does not)
+        key = next(column for column in ['item_id', 'order_id'] if column in df)
+        summary.append({'rule': rule['rule'], 'frame': rule['frame'], 'check': rule['check'], 'rows': len(df),
+                        'violations': int(mask.sum()), 'sample_key': key,
+                        'sample': [int(k) for k in df.loc[mask, key].head(SAMPLE_SIZE)]})
+    return summary
+
+def write_report(summary, skipped, label, report_file=None):
+    """Append one JSON line per rule to the report file"""
+    report_file = REPORT_FILE if report_file is None else report_file
+    if not report_file:
+        return
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    with open(report_file, 'a') as f:
+        for record in summary:
+            f.write(json.dumps(dict(record, run_id=RUN_ID, label=label, timestamp=timestamp)) + '\n')
+        for rule in skipped:
+            f.write(json.dumps({'rule': rule, 'skipped': True, 'run_id': RUN_ID, 'label': label,
+                                'timestamp': timestamp}) + '\n')
+
+def rule_violations_sql(rule):
+    """A rule as SQL over the source tables: the sample key of every violating row"""
+    frame, column = rule['frame'], rule['column']
+    key = SAMPLE_KEYS[frame]
+    join = ''
+    if rule['check'] == 'not_null':
+        where = f"f.{column} IS NULL"
+    elif rule['check'] == 'range':
+        bounds = [f"f.{column} < {rule['min']}"] if 'min' in rule else []
+        bounds += [f"f.{column} > {rule['max']}"] if 'max' in rule else []
+        where = ' OR '.join(bounds)
+    elif rule['check'] == 'references':
+        target_column = rule.get('target_column', column)
+        join = f"LEFT JOIN {rule['target']} t ON t.{target_column} = f.{column}"
+        where = f"f.{column} IS NOT NULL AND t.{target_column} IS NULL"
+    else:
+        detail_key = rule['key']
+        amount = ' * '.join(f"d.{amount_column}" for amount_column in rule['amount'])
+        join = (f"LEFT JOIN (SELECT d.{detail_key}, SUM({amount}) AS detail_total FROM {rule['detail']} d "
+                f"GROUP BY d.{detail_key}) t ON t.{detail_key} = f.{detail_key}")
+        where = f"ABS(f.{column} - COALESCE(t.detail_total, 0)) > {rule.get('tolerance', MONEY_TOLERANCE)}"
+    return f"SELECT f.{key} FROM {frame} f {join} WHERE {where}", key
+
+def run_rules_in_source(engine, rules):
+    """Evaluate rules in the source database (for frames the run did not extract): summary records"""
+    summary = []
+    with engine.connect() as conn:
+        for rule in rules:
+            query, key = rule_violations_sql(rule)
+            violations = conn.execute(text(f"SELECT COUNT(*) FROM ({query}) v")).scalar()
+            sample = conn.execute(text(f"{query} ORDER BY f.{key} LIMIT {SAMPLE_SIZE}")).scalars().all()
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM {rule['frame']}")).scalar()
+            summary.append({'rule': rule['rule'], 'frame': rule['frame'], 'check': rule['check'], 'rows': int(rows),
+                            'violations': int(violations), 'sample_key': key,
+                            'sample': [int(k) for k in sample], 'in_source': True})
+    return summary
+
+def bad_order_ids(frames, masks, rules=RULES):
+    """Orders touched by any violation: quarantine works on whole orders, so no order loads half its items"""
+    order_ids = set()
+    for rule in rules:
+        if rule['rule'] in masks and 'order_id' in frames[rule['frame']]:
+            order_ids.update(frames[rule['frame']].loc[masks[rule['rule']], 'order_id'].tolist())
+    return order_ids
+
+def quarantine(frames, masks, label, rules=RULES):
+    """Move the orders and items of violating orders to CSV files (one pair per label); return the frames without them"""
+    order_ids = bad_order_ids(frames, masks, rules)
+    if not order_ids:
+        return frames
+    directory = os.path.join(QUARANTINE_DIR, RUN_ID)
+    os.makedirs(directory, exist_ok=True)
+    cleaned = dict(frames)
+    for frame in ['orders', 'order_items']:
+        df = frames[frame]
+        is_bad = df['order_id'].isin(order_ids).to_numpy()
+        # Which rules each quarantined row broke ('' for rows of an order that broke them elsewhere)
+        broken = pd.Series('', index=df.index[is_bad])
+        for rule in rules:
+            if rule['frame'] == frame and rule['rule'] in masks:
+                hit = pd.Series(masks[rule['rule']], index=df.index)[is_bad]
+                broken[hit] = broken[hit] + rule['rule'] + ';'
+        quarantined = df[is_bad].assign(quality_rules=broken.str.rstrip(';'))
+        quarantined.to_csv(os.path.join(directory, f"{frame}-{label.replace(' ', '_')}.csv"), index=False)
+        cleaned[frame] = df[~is_bad].reset_index(drop=True)
+    _quarantined_order_ids.update(int(order_id) for order_id in order_ids)
+    print(f" Quarantined {len(order_ids)} orders to {directory}/")
+    return cleaned
+
+def take_quarantined_order_ids():
+    """Order ids quarantined since the last call; saved with the high-water marks so they are not lost"""
+    order_ids = set(_quarantined_order_ids)
+    _quarantined_order_ids.clear()
+    return order_ids
+
+def validate_sources(sources, action=None, label='full', rules=RULES, source_engine=None):
+    """VALIDATE (customers, products, orders, order_items) and act on violations
+
+    Frames that were not extracted (None, e.g. the facts with the SQL transform engine) are checked in
+    source_engine instead. Returns the sources (without quarantined orders) or None when action is 'fail'
+    and a rule is violated.
+    """
+    action = action or QUALITY_ACTION
+    frames = dict(zip(SOURCE_FRAMES, sources))
+    masks, skipped = run_rules(frames, rules)
+    summary = summarize(frames, masks, rules)
+    if source_engine is not None:
+        in_source = [rule for rule in rules if rule['rule'] in skipped
+                     and any(frames.get(frame) is None for frame, _ in rule_columns(rule))]
+        summary += run_rules_in_source(source_engine, in_source)
+        skipped = [name for name in skipped if name not in {rule['rule'] for rule in in_source}]
+    write_report(summary, skipped, label)
+
+    violated = [record for record in summary if record['violations']]
+    for record in violated:
+        print(f"   {record['rule']}: {record['violations']} of {record['rows']} {record['frame']} rows "
+              f"(e.g. {record['sample_key']} {record['sample']})")
+    if skipped:
+        print(f"   skipped (columns not extracted): {', '.join(skipped)}")
+    print(f" DATA QUALITY ({label}): {len(violated)} of {len(summary)} rules violated")
+    if not violated or action == 'warn':
+        return sources
+    if action == 'fail':
+        return None
+    if any(record.get('in_source') for record in violated):
+        print(" Rows checked in the source cannot be quarantined: use the pandas transform engine")
+        return None
+    frames = quarantine(frames, masks, label, rules)
+    return tuple(frames[frame] for frame in SOURCE_FRAMES)
@@ -0,0 +1,57 @@
+# date_dimension.py - VECTORIZED CALENDAR DIMENSION
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+# FISCAL CALENDAR SETTINGS
+FISCAL_YEAR_START_MONTH = 4  # fiscal year runs April-March, named after the year it ends in
+
+def date_keys(dates):
+    """Integer YYYYMMDD keys for a column of dates, computed with array arithmetic"""
+    # Orders share few distinct dates, so key the distinct values and broadcast back
+    codes, uniques = pd.factorize(pd.Series(dates), sort=False)
+    days = pd.to_datetime(uniques).values.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    year = months.astype(np.int64) // 12 + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months).astype(np.int64) + 1
+    keys = (year * 10000 + month * 100 + day).astype(np.int32)
+    # Missing dates (code -1) map to the trailing 0 key
+    return np.append(keys, np.int32(0))[codes]
+
+def calendar_range(dates):
+    """First and last day of the whole calendar years spanned by dates"""
+    dates = pd.to_datetime(pd.Series(dates)).dropna()
+    return pd.Timestamp(dates.min().year, 1, 1), pd.Timestamp(dates.max().year, 12, 31)
+
+def build_date_dimension(start_date, end_date, fiscal_year_start_month=FISCAL_YEAR_START_MONTH,
+                         holiday_calendar=None):
+    """Build dim_date rows for every day from start_date to end_date (inclusive)"""
+    days = pd.date_range(start_date, end_date, freq='D')
+    holiday_calendar = holiday_calendar or USFederalHolidayCalendar()
+    if len(days):
+        holidays = holiday_calendar.holidays(start=days.min(), end=days.max(), return_name=True)
+    else:
+        holidays = pd.Series(dtype=object)
+
+    month = days.month.values
+    fiscal_month = (month - fiscal_year_start_month) % 12 + 1
+    fiscal_year = days.year.values + (month >= fiscal_year_start_month) * (fiscal_year_start_month > 1)
+    holiday_name = pd.Series(days).map(holidays)
+
+    return pd.DataFrame({
+        'date_key': date_keys(days),
+        'full_date': days,
+        'day': days.day,
+        'month': month,
+        'year': days.year,
+        'quarter': days.quarter,
+        'week': days.isocalendar().week.values.astype(np.int64),
+        'day_name': days.day_name(),
+        'is_weekend': days.dayofweek >= 5,
+        'fiscal_year': fiscal_year,
+        'fiscal_quarter': (fiscal_month - 1) // 3 + 1,
+        'fiscal_month': fiscal_month,
+        'is_holiday': holiday_name.notna().values,
+        'holiday_name': holiday_name.values,
+    })
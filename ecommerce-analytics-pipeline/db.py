@@ -0,0 +1,157 @@
+# db.py - LAZY, CONFIGURABLE DATABASE ENGINES FOR THE SOURCE AND THE WAREHOUSE
+import os
+import threading
+import zlib
+from urllib.parse import quote_plus
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+# DATABASE SETTINGS (override with environment variables or configure(); engines are created on first use)
+DATABASES = {'source': 'ecommerce_source', 'dw': 'ecommerce_dw'}
+BACKENDS = ['mysql', 'sqlite']  # sqlite: embedded files, the same schemas, no server needed
+BACKEND = os.environ.get('ETL_DB_BACKEND', 'mysql')
+MYSQL_DRIVERS = {
+    'pymysql': ('mysql+pymysql', {'local_infile': True}),
+    'mysqlconnector': ('mysql+mysqlconnector', {'allow_local_infile': True}),
+}
+MYSQL_DRIVER = os.environ.get('ETL_MYSQL_DRIVER', 'pymysql')
+MYSQL_HOST = os.environ.get('ETL_MYSQL_HOST', 'localhost')
+MYSQL_USER = os.environ.get('ETL_MYSQL_USER', 'root')
+MYSQL_PASSWORD = os.environ.get('ETL_MYSQL_PASSWORD', '')
+SQLITE_DIR = os.environ.get('ETL_SQLITE_DIR', 'local_db')  # <database>.db files
+SQLITE_TIMEOUT_SECONDS = 60  # SQLite has one writer at a time; others wait for its lock
+# ETL_SOURCE_URL / ETL_DW_URL set a full SQLAlchemy URL for one database and win over the settings above
+
+# CONNECTION POOL SETTINGS (the pool must cover the concurrent extract and load workers)
+POOL_SIZE = int(os.environ.get('ETL_POOL_SIZE', 8))
+POOL_MAX_OVERFLOW = int(os.environ.get('ETL_POOL_MAX_OVERFLOW', 4))
+POOL_RECYCLE_SECONDS = int(os.environ.get('ETL_POOL_RECYCLE', 1800))  # reconnect before MySQL's wait_timeout
+POOL_PRE_PING = os.environ.get('ETL_POOL_PRE_PING', '1') != '0'  # test pooled connections before handing them out
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Settings configure() changes, with the environment variables that pass them on to worker processes
+_ENVIRONMENT = {'BACKEND': 'ETL_DB_BACKEND', 'MYSQL_DRIVER': 'ETL_MYSQL_DRIVER', 'MYSQL_HOST': 'ETL_MYSQL_HOST',
+                'MYSQL_USER': 'ETL_MYSQL_USER', 'MYSQL_PASSWORD': 'ETL_MYSQL_PASSWORD',
+                'SQLITE_DIR': 'ETL_SQLITE_DIR', 'POOL_SIZE': 'ETL_POOL_SIZE',
+                'POOL_MAX_OVERFLOW': 'ETL_POOL_MAX_OVERFLOW', 'POOL_RECYCLE_SECONDS': 'ETL_POOL_RECYCLE'}
+
+def configure(backend=None, sqlite_dir=None, driver=None, host=None, user=None, password=None,
+              pool_size=None, max_overflow=None, recycle_seconds=None, pre_ping=None):
+    """Change the backend, connection and pool settings for this process and the worker processes it starts
+
+    Engines created with the old settings are disposed; the next use creates new ones.
+    """
+    global BACKEND, SQLITE_DIR, MYSQL_DRIVER, MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD
+    global POOL_SIZE, POOL_MAX_OVERFLOW, POOL_RECYCLE_SECONDS, POOL_PRE_PING
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown database backend '{backend}' (choose from {', '.join(BACKENDS)})")
+        BACKEND = backend
+    if driver:
+        if driver not in MYSQL_DRIVERS:
+            raise ValueError(f"Unknown MySQL driver '{driver}' (choose from {', '.join(MYSQL_DRIVERS)})")
+        MYSQL_DRIVER = driver
+    if sqlite_dir:
+        SQLITE_DIR = sqlite_dir
+    if host:
+        MYSQL_HOST = host
+    if user:
+        MYSQL_USER = user
+    if password is not None:
+        MYSQL_PASSWORD = password
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if max_overflow is not None:
+        POOL_MAX_OVERFLOW = max_overflow
+    if recycle_seconds is not None:
+        POOL_RECYCLE_SECONDS = recycle_seconds
+    if pre_ping is not None:
+        POOL_PRE_PING = pre_ping
+    # Spawned pool workers (sharded generation, out-of-core transforms) re-import this module from the environment
+    settings = globals()
+    for setting, variable in _ENVIRONMENT.items():
+        os.environ[variable] = str(settings[setting])
+    os.environ['ETL_POOL_PRE_PING'] = '1' if POOL_PRE_PING else '0'
+    dispose_engines()
+
+def max_connections():
+    """Connections one engine can hand out at once (caps the extract and load workers)"""
+    return POOL_SIZE + POOL_MAX_OVERFLOW
+
+def database_url(name):
+    """SQLAlchemy URL of the 'source' or 'dw' database for the configured backend"""
+    url = os.environ.get(f"ETL_{name.upper()}_URL")
+    if url:
+        return url
+    if BACKEND == 'sqlite':
+        return f"sqlite:///{os.path.join(SQLITE_DIR, DATABASES[name] + '.db')}"
+    dialect, _ = MYSQL_DRIVERS[MYSQL_DRIVER]
+    return f"{dialect}://{MYSQL_USER}:{quote_plus(MYSQL_PASSWORD)}@{MYSQL_HOST}/{DATABASES[name]}"
+
+def engine_options(url):
+    """create_engine() keyword arguments for a URL: pool settings for servers, a lock timeout for SQLite"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        if url.database:
+            os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+        return {'connect_args': {'timeout': SQLITE_TIMEOUT_SECONDS}}
+    options = {'pool_size': POOL_SIZE, 'max_overflow': POOL_MAX_OVERFLOW,
+               'pool_recycle': POOL_RECYCLE_SECONDS, 'pool_pre_ping': POOL_PRE_PING}
+    # local_infile lets the load_data_infile bulk-load strategy send files to the server
+    for dialect, connect_args in MYSQL_DRIVERS.values():
+        if url.drivername == dialect:
+            options['connect_args'] = connect_args
+    return options
+
+def _concat_ws(separator, *values):
+    return separator.join(str(value) for value in values if value is not None)
+
+def _crc32(value):
+    return None if value is None else zlib.crc32(str(value).encode())
+
+def register_sqlite_functions(dbapi_connection, connection_record):
+    """SQLite stand-ins for the MySQL functions the warehouse queries use (CONCAT_WS, CRC32)"""
+    dbapi_connection.create_function('CONCAT_WS', -1, _concat_ws, deterministic=True)
+    dbapi_connection.create_function('CRC32', 1, _crc32, deterministic=True)
+
+def get_engine(name):
+    """The shared engine of the 'source' or 'dw' database, created on first use (no connection until then)"""
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                url = database_url(name)
+                engine = create_engine(url, **engine_options(url))
+                if engine.dialect.name == 'sqlite':
+                    event.listen(engine, 'connect', register_sqlite_functions)
+                _engines[name] = engine
+    return engine
+
+def source_engine():
+    return get_engine('source')
+
+def dw_engine():
+    return get_engine('dw')
+
+def dispose_engines():
+    """Close the pooled connections and forget the engines"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+def add_arguments(parser):
+    """The shared --db-backend / --sqlite-dir / --mysql-driver command-line options"""
+    parser.add_argument('--db-backend', choices=BACKENDS, default=None,
+                        help=f"mysql server or embedded sqlite files (default: {BACKEND}; env ETL_DB_BACKEND)")
+    parser.add_argument('--sqlite-dir', default=None,
+                        help=f"directory of the sqlite database files (default: {SQLITE_DIR})")
+    parser.add_argument('--mysql-driver', choices=list(MYSQL_DRIVERS), default=None,
+                        help=f"MySQL DBAPI driver (default: {MYSQL_DRIVER})")
+
+def configure_from_args(args):
+    if args.db_backend or args.sqlite_dir or args.mysql_driver:
+        configure(backend=args.db_backend, sqlite_dir=args.sqlite_dir, driver=args.mysql_driver)
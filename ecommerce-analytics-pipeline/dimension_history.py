@@ -0,0 +1,257 @@
+# dimension_history.py - HASH-DIFF CHANGE DETECTION AND SCD TYPE 2 VERSIONS FOR THE DIMENSIONS
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text, bindparam
+from key_lookup import SurrogateKeyIndex, UNKNOWN_MEMBER_KEY
+
+IN_BATCH_SIZE = 1000  # ids per "WHERE ... IN (...)" query
+
+# VERSIONED DIMENSIONS: a change in a tracked column closes the member's current row and adds a new version.
+# The other columns (customer metrics and scores) are overwritten on the current version (Type 1)
+TRACKED_COLUMNS = {
+    'dim_customer': ['customer_name', 'city'],
+    'dim_product': ['product_name', 'category', 'price'],
+}
+MONEY_COLUMNS = ['price']  # hashed rounded to the cent, so DECIMAL reads and float sources agree
+DIMENSION_KEYS = {'dim_customer': ('customer_id', 'customer_key'), 'dim_product': ('product_id', 'product_key')}
+HISTORY_COLUMN_TYPES = {
+    'row_hash': 'BIGINT',  # 64-bit hash of the tracked columns
+    'valid_from': 'DATETIME NULL',
+    'valid_to': 'DATETIME NULL',  # NULL while the version is current
+    'is_current': 'BOOLEAN NOT NULL DEFAULT 1',
+}
+
+def hash_input(values, money=False):
+    """A column in one canonical form, so equal values hash equally whatever type they were read as"""
+    if money:
+        return pd.to_numeric(values).astype(float).round(2)
+    return values.astype(object).where(values.notna(), '').astype(str)
+
+def row_hashes(df, table):
+    """Vectorized 64-bit hash of the tracked columns of dimension rows, as signed BIGINT values"""
+    attributes = pd.DataFrame({column: hash_input(df[column], column in MONEY_COLUMNS)
+                               for column in TRACKED_COLUMNS[table]})
+    return pd.util.hash_pandas_object(attributes, index=False).to_numpy().view(np.int64)
+
+def has_history(conn, table):
+    """Whether a stored dimension table has the version columns (tables from before versioning do not)"""
+    inspector = inspect(conn)
+    return inspector.has_table(table) and 'row_hash' in {column['name'] for column in inspector.get_columns(table)}
+
+def read_current_versions(conn, table, ids=None):
+    """Natural key, surrogate key, row hash and valid_from of the current versions (optionally of some members)"""
+    natural_key, surrogate_key = DIMENSION_KEYS[table]
+    query = (f"SELECT {natural_key}, {surrogate_key}, COALESCE(row_hash, 0) AS row_hash, valid_from FROM {table} "
+             f"WHERE is_current = 1 AND {surrogate_key} <> :unknown")
+    params = {'unknown': UNKNOWN_MEMBER_KEY}
+    if ids is None:
+        frames = [pd.read_sql(text(query), conn, params=params)]
+    else:
+        query = text(query + f" AND {natural_key} IN :ids").bindparams(bindparam('ids', expanding=True))
+        ids = sorted(int(i) for i in set(ids))
+        frames = [pd.read_sql(query, conn, params=dict(params, ids=ids[start:start + IN_BATCH_SIZE]))
+                  for start in range(0, len(ids), IN_BATCH_SIZE)]
+    columns = [natural_key, surrogate_key, 'row_hash', 'valid_from']
+    versions = pd.concat(frames or [pd.DataFrame(columns=columns)], ignore_index=True)
+    return versions.astype({natural_key: 'int64', surrogate_key: 'int64', 'row_hash': 'int64'})
+
+class VersionHistory:
+    """Every version of some dimension members, sorted by member and valid_from, to key facts point-in-time
+
+    A fact gets the member's latest version whose valid_from is on or before the fact's date. Facts older
+    than all of a member's versions (loaded before the member was first versioned) get its first version.
+    attributes optionally holds some columns of every version (e.g. the city facts are aggregated under).
+    """
+
+    def __init__(self, natural_keys, surrogate_keys, valid_from, unknown_key=UNKNOWN_MEMBER_KEY, attributes=None):
+        natural_keys = np.asarray(natural_keys, dtype=np.int64)
+        valid_from = pd.to_datetime(pd.Series(valid_from, dtype=object)).fillna(pd.Timestamp.min)
+        valid_from = valid_from.to_numpy(dtype='datetime64[ns]')
+        order = np.lexsort((valid_from, natural_keys))
+        self.natural_keys = natural_keys[order]
+        self.surrogate_keys = np.asarray(surrogate_keys, dtype=np.int64)[order]
+        self.valid_from = valid_from[order]
+        self.unknown_key = unknown_key
+        self.attributes = None
+        if attributes is not None:
+            self.attributes = attributes.iloc[order].set_index(pd.Index(self.surrogate_keys))
+
+    @classmethod
+    def from_table(cls, conn, table, ids=None, attributes=None):
+        """Read every stored version of a dimension's members (optionally of some members, with some columns)"""
+        natural_key, surrogate_key = DIMENSION_KEYS[table]
+        columns = [natural_key, surrogate_key, 'valid_from'] + list(attributes or [])
+        query = f"SELECT {', '.join(columns)} FROM {table} WHERE {surrogate_key} <> :unknown"
+        params = {'unknown': UNKNOWN_MEMBER_KEY}
+        if ids is None:
+            frames = [pd.read_sql(text(query), conn, params=params)]
+        else:
+            query = text(query + f" AND {natural_key} IN :ids").bindparams(bindparam('ids', expanding=True))
+            ids = sorted(int(i) for i in set(ids))
+            frames = [pd.read_sql(query, conn, params=dict(params, ids=ids[start:start + IN_BATCH_SIZE]))
+                      for start in range(0, len(ids), IN_BATCH_SIZE)]
+        versions = pd.concat(frames or [pd.DataFrame(columns=columns)], ignore_index=True)
+        return cls(versions[natural_key], versions[surrogate_key], versions['valid_from'],
+                   attributes=versions[list(attributes)] if attributes is not None else None)
+
+    def lookup_at(self, natural_keys, dates):
+        """Surrogate keys of the versions valid on some dates; unknown members get unknown_key"""
+        natural_keys = pd.Series(natural_keys).fillna(-1).to_numpy(dtype=np.int64)
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+        keys = np.full(len(natural_keys), self.unknown_key, dtype=np.int32)
+        if len(self.natural_keys) == 0:
+            return keys
+        # Start from each member's latest version and step back while it began after the fact's date
+        # (one vectorized pass per version depth; NaT dates keep the latest version)
+        positions = np.searchsorted(self.natural_keys, natural_keys, side='right') - 1
+        found = positions >= 0
+        found[found] = self.natural_keys[positions[found]] == natural_keys[found]
+        positions, dates = positions[found], dates[found]
+        while True:
+            earlier = positions > 0
+            candidates = positions[earlier]
+            earlier[earlier] = ((self.natural_keys[candidates - 1] == self.natural_keys[candidates])
+                                & (self.valid_from[candidates] > dates[earlier]))
+            if not earlier.any():
+                break
+            positions[earlier] -= 1
+        keys[found] = self.surrogate_keys[positions]
+        return keys
+
+    def attribute(self, surrogate_keys, column):
+        """One attribute column of the versions with some surrogate keys (missing for keys it does not hold)"""
+        return self.attributes[column].reindex(np.asarray(surrogate_keys, dtype=np.int64)).to_numpy()
+
+    def __len__(self):
+        return len(self.natural_keys)
+
+class DimensionVersions(SurrogateKeyIndex):
+    """Surrogate keys of a dimension's current versions after a hash diff against the stored versions
+
+    Serves as the facts' key index, and knows which rows are new versions and which stored ones they close.
+    """
+
+    def __init__(self, table, natural_keys, surrogate_keys, valid_from, is_new_version, retired_keys, load_time,
+                 stored_history=True, history=None):
+        order = np.argsort(np.asarray(natural_keys, dtype=np.int64), kind='stable')
+        super().__init__(np.asarray(natural_keys, dtype=np.int64)[order], np.asarray(surrogate_keys)[order])
+        self.table = table
+        self.valid_from = np.asarray(valid_from, dtype='datetime64[ns]')[order]
+        self.is_new_version = np.asarray(is_new_version, dtype=bool)[order]
+        self.retired_keys = np.asarray(retired_keys, dtype=np.int64)
+        self.load_time = load_time
+        self.stored_history = stored_history  # False when there was no versioned table to diff against
+        self.history = history  # every stored and planned version (full loads), for point-in-time fact keys
+
+    def lookup_at(self, natural_keys, dates):
+        """Keys of the versions valid on some dates (the current versions when no history was read)"""
+        if self.history is None:
+            return self.lookup(natural_keys)
+        return self.history.lookup_at(natural_keys, dates)
+
+    def attribute(self, surrogate_keys, column):
+        """An attribute of the stored or planned versions with some surrogate keys (full loads only)"""
+        return self.history.attribute(surrogate_keys, column)
+
+    def with_history(self, dimension_df):
+        """Rows of the current versions: surrogate key first, then the row hash and validity columns"""
+        natural_key, surrogate_key = DIMENSION_KEYS[self.table]
+        positions, found = self.positions(dimension_df[natural_key])
+        valid_from = np.full(len(dimension_df), np.datetime64(self.load_time, 'ns'))
+        valid_from[found] = self.valid_from[positions[found]]
+        dimension_df = dimension_df.copy()
+        dimension_df.insert(0, surrogate_key, self.lookup(dimension_df[natural_key]))
+        dimension_df['row_hash'] = row_hashes(dimension_df, self.table)
+        dimension_df['valid_from'] = valid_from
+        dimension_df['valid_to'] = pd.NaT
+        dimension_df['is_current'] = True
+        return dimension_df
+
+    def new_version_rows(self, dimension_df):
+        """Which rows of dimension_df are new versions (changed or new members) rather than current ones"""
+        positions, found = self.positions(dimension_df[DIMENSION_KEYS[self.table][0]])
+        return found & self.is_new_version[positions] if len(self.is_new_version) else found
+
+def plan_versions(conn, table, incoming, load_time=None, full=False, attributes=None):
+    """Hash-diff incoming dimension rows against the stored current versions and assign their surrogate keys
+
+    Unchanged members keep their key and valid_from; changed and new members get new keys after every
+    stored one. A full load also closes the members missing from incoming, and reads every stored version
+    (with its attributes columns) so its facts are keyed point-in-time.
+    """
+    natural_key, surrogate_key = DIMENSION_KEYS[table]
+    load_time = load_time or datetime.now().replace(microsecond=0)
+    incoming = incoming.drop_duplicates(natural_key)
+    natural_keys = incoming[natural_key].to_numpy(dtype=np.int64)
+    hashes = row_hashes(incoming, table)
+
+    stored_history = has_history(conn, table)
+    if stored_history:
+        stored = read_current_versions(conn, table, None if full else natural_keys)
+        next_key = int(conn.execute(text(f"SELECT COALESCE(MAX({surrogate_key}), 0) FROM {table}")).scalar()) + 1
+    else:
+        # First versioned load: nothing to diff against, every member starts a version
+        stored = read_current_versions(conn, table, ids=[])
+        next_key = 1
+    stored_index = SurrogateKeyIndex(stored[natural_key], np.arange(len(stored)))
+    positions, found = stored_index.positions(natural_keys)
+    stored_rows = stored_index.surrogate_keys[positions] if len(stored) else positions
+    unchanged = found & (stored['row_hash'].to_numpy()[stored_rows] == hashes) if len(stored) else found
+
+    surrogate_keys = np.empty(len(natural_keys), dtype=np.int64)
+    surrogate_keys[unchanged] = stored[surrogate_key].to_numpy()[stored_rows[unchanged]]
+    surrogate_keys[~unchanged] = next_key + np.arange(int((~unchanged).sum()))
+    valid_from = np.full(len(natural_keys), np.datetime64(load_time, 'ns'))
+    valid_from[unchanged] = pd.to_datetime(stored['valid_from']).to_numpy()[stored_rows[unchanged]]
+
+    retired_keys = stored[surrogate_key].to_numpy()[stored_rows[found & ~unchanged]]
+    if full:
+        missing = ~stored[natural_key].isin(natural_keys).to_numpy()
+        retired_keys = np.concatenate([retired_keys, stored[surrogate_key].to_numpy()[missing]])
+    history = None
+    if full:
+        attributes = list(attributes or [])
+        stored_versions = (VersionHistory.from_table(conn, table, attributes=attributes) if stored_history
+                           else VersionHistory([], [], [], attributes=pd.DataFrame(columns=attributes)))
+        planned_attributes = incoming.loc[~unchanged, attributes]
+        history = VersionHistory(np.concatenate([stored_versions.natural_keys, natural_keys[~unchanged]]),
+                                 np.concatenate([stored_versions.surrogate_keys, surrogate_keys[~unchanged]]),
+                                 np.concatenate([stored_versions.valid_from, valid_from[~unchanged]]),
+                                 attributes=pd.concat([stored_versions.attributes, planned_attributes],
+                                                      ignore_index=True))
+    print(f" {table}: {int(unchanged.sum())} unchanged, {int((found & ~unchanged).sum())} changed, "
+          f"{int((~found).sum())} new, {len(retired_keys)} versions closed")
+    return DimensionVersions(table, natural_keys, surrogate_keys, valid_from, ~unchanged, retired_keys, load_time,
+                             stored_history, history)
+
+def comparable(values, like):
+    """Column values in the form of another column, for comparing stored rows with incoming ones"""
+    if pd.api.types.is_datetime64_any_dtype(like):
+        return pd.to_datetime(values).dt.normalize()
+    if pd.api.types.is_numeric_dtype(like):
+        return pd.to_numeric(values).astype(float).round(2)
+    return values.astype(object).where(values.notna(), None)
+
+def copy_versions(conn, table, suffix):
+    """Copy every stored version of a dimension into its staging copy, inside the warehouse (INSERT ... SELECT)"""
+    surrogate_key = DIMENSION_KEYS[table][1]
+    stored_columns = {column['name'] for column in inspect(conn).get_columns(table)}
+    columns = ', '.join(column['name'] for column in inspect(conn).get_columns(table + suffix)
+                        if column['name'] in stored_columns)
+    return conn.execute(text(f"INSERT INTO {table}{suffix} ({columns}) SELECT {columns} FROM {table} "
+                             f"WHERE {surrogate_key} <> :unknown"), {'unknown': UNKNOWN_MEMBER_KEY}).rowcount
+
+def changed_rows(conn, table, rows, columns, suffix=''):
+    """Which rows differ from the stored current version with the same surrogate key in some columns"""
+    surrogate_key = DIMENSION_KEYS[table][1]
+    stored = pd.read_sql(text(f"SELECT {surrogate_key}, {', '.join(columns)} FROM {table}{suffix} "
+                              f"WHERE is_current = 1 AND {surrogate_key} <> :unknown"),
+                         conn, params={'unknown': UNKNOWN_MEMBER_KEY})
+    stored = rows[[surrogate_key]].merge(stored, on=surrogate_key, how='left')
+    changed = np.zeros(len(rows), dtype=bool)
+    for column in columns:
+        incoming = comparable(rows[column].reset_index(drop=True), rows[column])
+        current = comparable(stored[column], rows[column])
+        changed |= ~((incoming == current) | (incoming.isna() & current.isna())).to_numpy()
+    return changed
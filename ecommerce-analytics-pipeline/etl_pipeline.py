@@ -1,250 +1,1714 @@
-# etl_pipeline.py - FIXED ETL PIPELINE
-import pandas as pd
-from sqlalchemy import create_engine, text
-import numpy as np
-from datetime import datetime, timedelta
-
-# DATABASE CONNECTIONS
-source_engine = create_engine('mysql+pymysql://root:@localhost/ecommerce_source')
-dw_engine = create_engine('mysql+pymysql://root:@localhost/ecommerce_dw')
-
-def extract_data():
-    """EXTRACT data from source database"""
-    print("EXTRACTING data from source database...")
-    
-    try:
-        customers_df = pd.read_sql("SELECT customer_id, first_name, last_name, email, city, registration_date FROM customers", source_engine)
-        products_df = pd.read_sql("SELECT product_id, product_name, category, price FROM products", source_engine)
-        orders_df = pd.read_sql("SELECT order_id, customer_id, order_date, total_amount, status FROM orders", source_engine)
-        order_items_df = pd.read_sql("SELECT item_id, order_id, product_id, quantity, unit_price FROM order_items", source_engine)
-        
-        print(f" EXTRACTED: {len(customers_df)} customers, {len(products_df)} products, "
-              f"{len(orders_df)} orders, {len(order_items_df)} order items")
-        return customers_df, products_df, orders_df, order_items_df
-        
-    except Exception as e:
-        print(f" EXTRACTION FAILED: {e}")
-        return None, None, None, None
-
-def transform_data(customers_df, products_df, orders_df, order_items_df):
-    """TRANSFORM data: Clean, calculate, enrich"""
-    print(" TRANSFORMING data with business logic...")
-    
-    try:
-        # Merge orders with order_items
-        sales_detail_df = pd.merge(
-            orders_df[['order_id', 'customer_id', 'order_date', 'total_amount', 'status']], 
-            order_items_df[['item_id', 'order_id', 'product_id', 'quantity', 'unit_price']], 
-            on='order_id', 
-            how='inner'
-        )
-        
-        # Merge with products
-        sales_detail_df = pd.merge(
-            sales_detail_df,
-            products_df[['product_id', 'product_name', 'category', 'price']],
-            on='product_id',
-            how='left'
-        )
-        
-        # Merge with customers
-        sales_detail_df = pd.merge(
-            sales_detail_df,
-            customers_df[['customer_id', 'first_name', 'last_name', 'city', 'registration_date']],
-            on='customer_id', 
-            how='left'
-        )
-        
-        # Calculate new columns
-        sales_detail_df['line_total'] = sales_detail_df['quantity'] * sales_detail_df['unit_price']
-        sales_detail_df['profit'] = sales_detail_df['line_total'] * 0.3
-        
-        # Create customer segments
-        customer_totals = orders_df.groupby('customer_id')['total_amount'].sum().reset_index()
-        customer_totals['customer_segment'] = customer_totals['total_amount'].apply(
-            lambda x: 'Premium' if x > 1000 else 'Gold' if x > 500 else 'Standard'
-        )
-        
-        print(f" TRANSFORMED: Created enriched sales data with {len(sales_detail_df)} records")
-        return sales_detail_df, customer_totals
-        
-    except Exception as e:
-        print(f" TRANSFORMATION FAILED: {e}")
-        return None, None
-
-def create_data_warehouse_tables():
-    """CREATE Data Warehouse tables (Star Schema)"""
-    print(" CREATING Data Warehouse tables...")
-    
-    try:
-        with dw_engine.connect() as conn:
-            # Drop existing tables
-            conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
-            tables = ['fact_sales', 'dim_customer', 'dim_product', 'dim_date']
-            for table in tables:
-                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
-            conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
-            
-            # Create dimension tables
-            conn.execute(text("""
-                CREATE TABLE dim_customer (
-                    customer_key INT AUTO_INCREMENT PRIMARY KEY,
-                    customer_id INT,
-                    customer_name VARCHAR(100),
-                    city VARCHAR(50),
-                    customer_segment VARCHAR(20),
-                    total_spent DECIMAL(10,2),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            
-            conn.execute(text("""
-                CREATE TABLE dim_product (
-                    product_key INT AUTO_INCREMENT PRIMARY KEY,
-                    product_id INT,
-                    product_name VARCHAR(100),
-                    category VARCHAR(50),
-                    price DECIMAL(10,2),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            
-            conn.execute(text("""
-                CREATE TABLE dim_date (
-                    date_key INT PRIMARY KEY,
-                    full_date DATE,
-                    day INT,
-                    month INT, 
-                    year INT,
-                    quarter INT,
-                    week INT,
-                    day_name VARCHAR(10),
-                    is_weekend BOOLEAN,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            
-            # Create fact table
-            conn.execute(text("""
-                CREATE TABLE fact_sales (
-                    sales_key INT AUTO_INCREMENT PRIMARY KEY,
-                    date_key INT,
-                    customer_key INT,
-                    product_key INT, 
-                    order_id INT,
-                    quantity INT,
-                    amount DECIMAL(10,2),
-                    profit DECIMAL(10,2),
-                    line_total DECIMAL(10,2),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            
-        print(" Data Warehouse tables created successfully")
-        return True
-        
-    except Exception as e:
-        print(f" Data Warehouse creation failed: {e}")
-        return False
-
-def load_data_to_warehouse(sales_detail_df, customer_totals, products_df):
-    """LOAD transformed data to Data Warehouse"""
-    print(" LOADING data to Data Warehouse...")
-    
-    try:
-        # Load dim_customer
-        dim_customer_data = pd.merge(
-            customer_totals,
-            sales_detail_df[['customer_id', 'first_name', 'last_name', 'city']].drop_duplicates(),
-            on='customer_id',
-            how='left'
-        )
-        dim_customer_data['customer_name'] = dim_customer_data['first_name'] + ' ' + dim_customer_data['last_name']
-        dim_customer_data = dim_customer_data[['customer_id', 'customer_name', 'city', 'customer_segment', 'total_amount']]
-        dim_customer_data.rename(columns={'total_amount': 'total_spent'}, inplace=True)
-        dim_customer_data.to_sql('dim_customer', dw_engine, if_exists='append', index=False)
-        print("Loaded dim_customer table")
-        
-        # Load dim_product
-        dim_product_data = products_df[['product_id', 'product_name', 'category', 'price']]
-        dim_product_data.to_sql('dim_product', dw_engine, if_exists='append', index=False)
-        print(" Loaded dim_product table")
-        
-        # Load dim_date
-        unique_dates = sales_detail_df['order_date'].unique()
-        date_data = []
-        for date in unique_dates:
-            date_key = int(date.strftime('%Y%m%d'))
-            date_data.append({
-                'date_key': date_key,
-                'full_date': date,
-                'day': date.day,
-                'month': date.month,
-                'year': date.year,
-                'quarter': (date.month - 1) // 3 + 1,
-                'week': date.isocalendar()[1],
-                'day_name': date.strftime('%A'),
-                'is_weekend': date.weekday() >= 5
-            })
-        dim_date_df = pd.DataFrame(date_data)
-        dim_date_df.to_sql('dim_date', dw_engine, if_exists='append', index=False)
-        print(" Loaded dim_date table")
-        
-        # Load fact_sales
-        fact_sales_data = sales_detail_df.copy()
-        fact_sales_data['date_key'] = fact_sales_data['order_date'].apply(lambda x: int(x.strftime('%Y%m%d')))
-        fact_sales_data = fact_sales_data[['date_key', 'order_id', 'quantity', 'unit_price', 'profit', 'line_total']]
-        fact_sales_data.rename(columns={'unit_price': 'amount'}, inplace=True)
-        fact_sales_data.to_sql('fact_sales', dw_engine, if_exists='append', index=False)
-        print(" Loaded fact_sales table")
-        
-        print(" DATA WAREHOUSE LOADING COMPLETED!")
-        return True
-        
-    except Exception as e:
-        print(f" LOADING FAILED: {e}")
-        return False
-
-def main():
-    """MAIN function: Orchestrates the complete ETL process"""
-    print(" STARTING COMPLETE ETL PIPELINE...")
-    print("=" * 50)
-    
-    # STEP 1: EXTRACT
-    customers_df, products_df, orders_df, order_items_df = extract_data()
-    if customers_df is None:
-        print(" ETL Pipeline failed at EXTRACT stage")
-        return
-    
-    # STEP 2: TRANSFORM  
-    sales_detail_df, customer_totals = transform_data(customers_df, products_df, orders_df, order_items_df)
-    if sales_detail_df is None:
-        print(" ETL Pipeline failed at TRANSFORM stage")
-        return
-    
-    # STEP 3: CREATE DATA WAREHOUSE
-    if not create_data_warehouse_tables():
-        print(" ETL Pipeline failed at Data Warehouse creation")
-        return
-    
-    # STEP 4: LOAD
-    if not load_data_to_warehouse(sales_detail_df, customer_totals, products_df):
-        print(" ETL Pipeline failed at LOAD stage")
-        return
-    
-    print("=" * 50)
-    print(" ETL PIPELINE COMPLETED SUCCESSFULLY!")
-    print(" Your Data Warehouse is ready for analytics!")
-    
-    # Show summary
-    with dw_engine.connect() as conn:
-        dim_customer_count = pd.read_sql("SELECT COUNT(*) as count FROM dim_customer", conn).iloc[0]['count']
-        fact_sales_count = pd.read_sql("SELECT COUNT(*) as count FROM fact_sales", conn).iloc[0]['count']
-        
-    print(f" Data Warehouse Summary:")
-    print(f"   • dim_customer: {dim_customer_count} customers")
-    print(f"   • fact_sales: {fact_sales_count} sales records")
-    print(f"   • Ready for Power BI dashboards!")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+# etl_pipeline.py - FIXED ETL PIPELINE
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from sqlalchemy import text, bindparam
+import numpy as np
+from date_dimension import build_date_dimension, calendar_range, date_keys
+from key_lookup import UNKNOWN_MEMBER_KEY
+import bulk_loader
+from bulk_loader import bulk_load
+from aggregates import (AGGREGATES, VERSION_ATTRIBUTES, aggregate_fact_rows, aggregate_sales, combine_aggregates,
+                        create_aggregate_tables, load_aggregates, merge_aggregate_deltas, read_fact_rows,
+                        rebuild_aggregate_months)
+import instrumentation
+from instrumentation import stage
+import checkpoint
+import customer_analytics
+import data_quality
+import db
+import dimension_history
+import kpi_service
+import out_of_core
+import transform_engine
+import warehouse_schema
+from pandas.api.types import union_categoricals
+
+# EXTRACT SETTINGS
+EXTRACT_WORKERS = 8  # concurrent extract queries (the db.py connection pool covers them)
+
+# PARALLEL LOAD SETTINGS
+LOAD_WORKERS = 1  # concurrent bulk loads, each on its own connection (--load-workers; 1 loads table by table)
+
+# STREAMING EXTRACT SETTINGS
+CHUNK_SIZE = 50000  # rows per DataFrame chunk in streaming mode
+
+# INCREMENTAL LOAD SETTINGS
+SOURCE_KEYS = {
+    'customers': 'customer_id',
+    'products': 'product_id',
+    'orders': 'order_id',
+    'order_items': 'item_id',
+}
+IN_BATCH_SIZE = 1000  # ids per "WHERE ... IN (...)" query
+
+# SOURCE QUERIES: table -> (columns, key used to split it into key ranges)
+EXTRACT_QUERIES = {
+    'customers': (['customer_id', 'first_name', 'last_name', 'email', 'city', 'registration_date'], None),
+    'products': (['product_id', 'product_name', 'category', 'price'], None),
+    'orders': (['order_id', 'customer_id', 'order_date', 'total_amount', 'status'], 'order_id'),
+    'order_items': (['item_id', 'order_id', 'product_id', 'quantity', 'unit_price'], 'item_id'),
+}
+
+# LEAN TRANSFORM SETTINGS (--lean): only the columns the star schema needs, in compact dtypes
+LEAN_COLUMNS = {
+    'orders': ['order_id', 'customer_id', 'order_date', 'status'],
+    'order_items': ['order_id', 'product_id', 'quantity', 'unit_price'],
+    'products': ['product_id', 'category'],
+    'customers': ['customer_id', 'city'],
+}
+LEAN_INTEGER_COLUMNS = ['order_id', 'customer_id', 'product_id', 'quantity']  # downcast to the smallest int type
+LEAN_CATEGORY_COLUMNS = ['status', 'category', 'city']
+LEAN_MONEY_COLUMNS = ['unit_price']  # stored as <column>_cents (int64 fixed point)
+
+# TRANSFORM ENGINE SETTINGS: 'pandas' merges the extracted tables, 'sql' pushes the joins down to the source
+TRANSFORM_ENGINE = 'pandas'
+
+# CHECKPOINT SETTINGS: full runs reuse extracted/transformed frames while the source is unchanged
+CHECKPOINTS = True  # --no-checkpoint disables
+EXTRACT_FRAMES = ['customers', 'products', 'orders', 'order_items']
+TRANSFORM_FRAMES = ['sales_detail', 'customer_totals']
+
+# STAGING SETTINGS
+# Full loads write <table>_staging copies of these tables and publish them together at the end
+PUBLISHED_TABLES = (['dim_customer', 'dim_product', 'dim_date', 'fact_sales'] + list(AGGREGATES)
+                    + list(customer_analytics.COHORT_TABLES))
+STAGING_SUFFIX = warehouse_schema.STAGING_SUFFIX
+
+def extract_data():
+    """EXTRACT data from source database"""
+    print("EXTRACTING data from source database...")
+    
+    try:
+        customers_df = pd.read_sql("SELECT customer_id, first_name, last_name, email, city, registration_date FROM customers", db.source_engine())
+        products_df = pd.read_sql("SELECT product_id, product_name, category, price FROM products", db.source_engine())
+        orders_df = pd.read_sql("SELECT order_id, customer_id, order_date, total_amount, status FROM orders", db.source_engine())
+        order_items_df = pd.read_sql("SELECT item_id, order_id, product_id, quantity, unit_price FROM order_items", db.source_engine())
+        
+        print(f" EXTRACTED: {len(customers_df)} customers, {len(products_df)} products, "
+              f"{len(orders_df)} orders, {len(order_items_df)} order items")
+        return customers_df, products_df, orders_df, order_items_df
+        
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return None, None, None, None
+
+def timed_read(query, params=None):
+    """Run one extract query on its own pooled connection and time it"""
+    start_time = time.perf_counter()
+    with db.source_engine().connect() as conn:
+        df = pd.read_sql(text(query), conn, params=params)
+    return df, time.perf_counter() - start_time
+
+def plan_extract_queries(key_ranges):
+    """Per-table SELECTs, with the big tables split into key_ranges contiguous key ranges"""
+    plan = []
+    with db.source_engine().connect() as conn:
+        for table, (columns, key) in EXTRACT_QUERIES.items():
+            query = f"SELECT {', '.join(columns)} FROM {table}"
+            if key is None or key_ranges <= 1:
+                plan.append((table, query, None))
+                continue
+            min_key, max_key = conn.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).fetchone()
+            if min_key is None:
+                plan.append((table, query, None))
+                continue
+            bounds = np.linspace(min_key, max_key + 1, key_ranges + 1).astype(np.int64)
+            for low, high in zip(bounds[:-1], bounds[1:]):
+                if low < high:
+                    plan.append((table, f"{query} WHERE {key} >= :low AND {key} < :high",
+                                 {'low': int(low), 'high': int(high)}))
+    return plan
+
+def extract_data_concurrent(workers=EXTRACT_WORKERS, key_ranges=None):
+    """EXTRACT the source tables with their (per-key-range) queries running concurrently on a thread pool"""
+    key_ranges = key_ranges or workers
+    print(f"EXTRACTING data from source database ({workers} concurrent queries)...")
+    
+    try:
+        start_time = time.perf_counter()
+        plan = plan_extract_queries(key_ranges)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(timed_read, query, params) for _, query, params in plan]
+            results = [future.result() for future in futures]
+        
+        # Per-query timing, so the bottleneck table stands out
+        frames = {table: [] for table in EXTRACT_QUERIES}
+        table_seconds = dict.fromkeys(EXTRACT_QUERIES, 0.0)
+        for (table, _, params), (df, seconds) in zip(plan, results):
+            frames[table].append(df)
+            table_seconds[table] = max(table_seconds[table], seconds)
+            key_range = f" [{params['low']}, {params['high']})" if params else ""
+            print(f"   {table}{key_range}: {len(df)} rows in {seconds:.2f}s")
+        
+        customers_df, products_df, orders_df, order_items_df = (
+            pd.concat(frames[table], ignore_index=True) for table in EXTRACT_QUERIES)
+        slowest = max(table_seconds, key=table_seconds.get)
+        print(f" EXTRACTED: {len(customers_df)} customers, {len(products_df)} products, "
+              f"{len(orders_df)} orders, {len(order_items_df)} order items in "
+              f"{time.perf_counter() - start_time:.2f}s (slowest table: {slowest}, {table_seconds[slowest]:.2f}s)")
+        return customers_df, products_df, orders_df, order_items_df
+        
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return None, None, None, None
+
+def iter_table_chunks(table, columns, key, chunk_size=CHUNK_SIZE, where=None, params=None):
+    """Yield fixed-size DataFrame chunks of a source table using keyset pagination on key"""
+    filters = f"{key} > :last_key"
+    if where:
+        filters += f" AND ({where})"
+    query = text(f"SELECT {', '.join(columns)} FROM {table} WHERE {filters} ORDER BY {key} LIMIT :chunk_size")
+    
+    # Keys are positive auto-generated ids, so 0 starts before the first row.
+    # stream_results asks the driver for a server-side cursor (SSCursor on PyMySQL)
+    # so a page is never buffered twice in client memory.
+    last_key = 0
+    with db.source_engine().connect().execution_options(stream_results=True) as conn:
+        while True:
+            chunk_params = dict(params or {}, last_key=last_key, chunk_size=chunk_size)
+            chunk = pd.read_sql(query, conn, params=chunk_params)
+            if chunk.empty:
+                break
+            yield chunk
+            if len(chunk) < chunk_size:
+                break
+            last_key = int(chunk[key].iloc[-1])
+
+def extract_data_chunked(chunk_size=CHUNK_SIZE):
+    """EXTRACT orders and their order items as a stream of (orders, order_items) chunks"""
+    print(f"EXTRACTING orders in chunks of {chunk_size} rows...")
+    
+    for orders_chunk in iter_table_chunks(
+            'orders', ['order_id', 'customer_id', 'order_date', 'total_amount', 'status'],
+            'order_id', chunk_size):
+        # Items of the orders in this page, paged on item_id so no single read exceeds chunk_size
+        order_range = {'first_order': int(orders_chunk['order_id'].iloc[0]),
+                       'last_order': int(orders_chunk['order_id'].iloc[-1])}
+        item_pages = list(iter_table_chunks(
+            'order_items', ['item_id', 'order_id', 'product_id', 'quantity', 'unit_price'],
+            'item_id', chunk_size,
+            where='order_id BETWEEN :first_order AND :last_order', params=order_range))
+        if item_pages:
+            order_items_chunk = pd.concat(item_pages, ignore_index=True)
+        else:
+            order_items_chunk = pd.DataFrame(columns=['item_id', 'order_id', 'product_id', 'quantity', 'unit_price'])
+        yield orders_chunk, order_items_chunk
+
+def extract_dimension_sources(chunk_size=CHUNK_SIZE):
+    """EXTRACT the (small) customer and product sources page by page"""
+    customers_df = pd.concat(list(iter_table_chunks(
+        'customers', ['customer_id', 'first_name', 'last_name', 'email', 'city', 'registration_date'],
+        'customer_id', chunk_size)), ignore_index=True)
+    products_df = pd.concat(list(iter_table_chunks(
+        'products', ['product_id', 'product_name', 'category', 'price'],
+        'product_id', chunk_size)), ignore_index=True)
+    print(f" EXTRACTED: {len(customers_df)} customers, {len(products_df)} products")
+    return customers_df, products_df
+
+def extract_data_lean(chunk_size=CHUNK_SIZE):
+    """EXTRACT for the lean transform: fact sources paged and compacted page by page, never held wide"""
+    print("EXTRACTING data from source database (lean)...")
+    
+    try:
+        customers_df, products_df = extract_dimension_sources(chunk_size)
+        orders_columns = LEAN_COLUMNS['orders'] + ['total_amount']
+        orders_df = pd.concat([compact_columns(chunk, orders_columns)
+                               for chunk in iter_table_chunks('orders', orders_columns, 'order_id', chunk_size)],
+                              ignore_index=True)
+        items_columns = LEAN_COLUMNS['order_items']
+        # Paged on item_id, which the lean frame itself does not keep
+        order_items_df = pd.concat([compact_columns(chunk, items_columns)
+                                    for chunk in iter_table_chunks('order_items', ['item_id'] + items_columns,
+                                                                   'item_id', chunk_size)],
+                                   ignore_index=True)
+        
+        print(f" EXTRACTED: {len(orders_df)} orders, {len(order_items_df)} order items")
+        return customers_df, products_df, orders_df, order_items_df
+        
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return None, None, None, None
+
+def read_rows_by_ids(engine, table, columns, id_column, ids):
+    """Read rows whose id_column is in ids, in batches of IN_BATCH_SIZE"""
+    ids = sorted(int(i) for i in set(ids))
+    query = text(f"SELECT {', '.join(columns)} FROM {table} WHERE {id_column} IN :ids").bindparams(
+        bindparam('ids', expanding=True))
+    frames = []
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        frames.append(pd.read_sql(query, engine, params={'ids': ids[start:start + IN_BATCH_SIZE]}))
+    # Seeding the concat with an empty frame would make every column object dtype
+    return pd.concat(frames or [pd.DataFrame(columns=columns)], ignore_index=True)
+
+def read_source_watermarks():
+    """Snapshot the current high-water mark (max key, max created_at) of every source table"""
+    watermarks = {}
+    with db.source_engine().connect() as conn:
+        for table, key in SOURCE_KEYS.items():
+            row = conn.execute(text(f"SELECT MAX({key}), MAX(created_at) FROM {table}")).fetchone()
+            watermarks[table] = (int(row[0] or 0), row[1])
+    return watermarks
+
+def load_watermarks():
+    """Read the high-water marks persisted by the last successful load"""
+    watermarks_df = pd.read_sql("SELECT table_name, last_id, last_created_at FROM etl_watermark", db.dw_engine())
+    return {row.table_name: (int(row.last_id), row.last_created_at) for row in watermarks_df.itertuples()}
+
+def load_requeued_order_ids():
+    """Orders quarantined below the persisted marks, which the next incremental run extracts again"""
+    requeued_df = pd.read_sql("SELECT order_id FROM etl_requeued_orders", db.dw_engine())
+    return {int(order_id) for order_id in requeued_df['order_id']}
+
+def requeue_order_ids(conn, order_ids, replace=False):
+    """Queue quarantined orders for the next incremental run (replace: drop the previously queued ones)"""
+    order_ids = sorted(int(i) for i in order_ids)
+    if replace:
+        conn.execute(text("DELETE FROM etl_requeued_orders"))
+    elif order_ids:
+        conn.execute(text("DELETE FROM etl_requeued_orders WHERE order_id IN :ids").bindparams(
+            bindparam('ids', expanding=True)), {'ids': order_ids})
+    if order_ids:
+        conn.execute(text("INSERT INTO etl_requeued_orders (order_id) VALUES (:order_id)"),
+                     [{'order_id': order_id} for order_id in order_ids])
+
+def save_watermarks(conn, watermarks, requeued_order_ids=()):
+    """Persist high-water marks inside the load transaction
+
+    The marks move past orders this run quarantined, so those are re-queued in the same transaction.
+    """
+    conn.execute(text("DELETE FROM etl_watermark"))
+    conn.execute(
+        text("INSERT INTO etl_watermark (table_name, last_id, last_created_at) VALUES (:table_name, :last_id, :last_created_at)"),
+        [{'table_name': table, 'last_id': last_id, 'last_created_at': last_created_at}
+         for table, (last_id, last_created_at) in watermarks.items()]
+    )
+    requeue_order_ids(conn, requeued_order_ids, replace=True)
+
+def store_watermarks(watermarks, requeued_order_ids=None):
+    """Persist high-water marks after a full (re)load (by default with the orders this process quarantined)"""
+    if requeued_order_ids is None:
+        requeued_order_ids = data_quality.take_quarantined_order_ids()
+    try:
+        with db.dw_engine().begin() as conn:
+            save_watermarks(conn, watermarks, requeued_order_ids)
+        print(" Saved source high-water marks")
+        return True
+    except Exception as e:
+        print(f" Saving high-water marks failed: {e}")
+        return False
+
+def extract_changed_rows(table, columns, watermarks):
+    """Read rows added (key above the mark) or re-created (created_at above the mark) since the last load"""
+    key = SOURCE_KEYS[table]
+    last_id, last_created_at = watermarks.get(table, (0, None))
+    where = f"{key} > :last_id"
+    params = {'last_id': last_id}
+    if last_created_at is not None:
+        where += " OR created_at > :last_created_at"
+        params['last_created_at'] = last_created_at
+    return pd.read_sql(text(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}"), db.source_engine(),
+                       params=params)
+
+def extract_incremental(watermarks, requeued_order_ids=()):
+    """EXTRACT only the source rows that changed since the persisted high-water marks (plus re-queued orders)"""
+    print("EXTRACTING changed rows from source database...")
+    
+    try:
+        changed_customers = extract_changed_rows('customers', ['customer_id'], watermarks)
+        changed_products = extract_changed_rows('products', ['product_id', 'product_name', 'category', 'price'], watermarks)
+        changed_orders = extract_changed_rows('orders', ['order_id'], watermarks)
+        changed_items = extract_changed_rows('order_items', ['order_id'], watermarks)
+        
+        # An order is reloaded as a whole when the order or any of its items changed
+        order_ids = set(changed_orders['order_id']) | set(changed_items['order_id']) | set(requeued_order_ids)
+        return extract_orders(order_ids, set(changed_customers['customer_id']), changed_products)
+        
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return None, None, None, None, None, None
+
+def extract_orders(order_ids, changed_customer_ids, changed_products):
+    """EXTRACT whole orders with their items, customers (plus lifetime totals) and products"""
+    orders_df = read_rows_by_ids(db.source_engine(), 'orders',
+                                 ['order_id', 'customer_id', 'order_date', 'total_amount', 'status'],
+                                 'order_id', order_ids)
+    order_items_df = read_rows_by_ids(db.source_engine(), 'order_items',
+                                      ['item_id', 'order_id', 'product_id', 'quantity', 'unit_price'],
+                                      'order_id', order_ids)
+    
+    # Customers whose attributes or lifetime totals may have changed
+    customer_ids = set(changed_customer_ids) | set(orders_df['customer_id'])
+    customers_df = read_rows_by_ids(db.source_engine(), 'customers',
+                                    ['customer_id', 'first_name', 'last_name', 'email', 'city', 'registration_date'],
+                                    'customer_id', customer_ids)
+    customer_totals = read_customer_totals(customer_ids)
+    
+    # Products needed to enrich the changed items, plus the changed products themselves
+    products_df = read_rows_by_ids(db.source_engine(), 'products',
+                                   ['product_id', 'product_name', 'category', 'price'],
+                                   'product_id', set(order_items_df['product_id']) | set(changed_products['product_id']))
+    
+    print(f" EXTRACTED CHANGES: {len(customer_ids)} customers, {len(changed_products)} products, "
+          f"{len(orders_df)} orders, {len(order_items_df)} order items")
+    return customers_df, products_df, orders_df, order_items_df, changed_products, customer_totals
+
+def extract_months(month_keys):
+    """EXTRACT every order dated in some YYYYMM months, to rebuild their fact_sales partitions"""
+    print(f"EXTRACTING orders of {len(month_keys)} months from source database...")
+    
+    try:
+        query = text("SELECT order_id FROM orders WHERE order_date >= :start_date AND order_date < :end_date")
+        order_ids = set()
+        for month_key in month_keys:
+            start_date = pd.Timestamp(int(month_key) // 100, int(month_key) % 100, 1)
+            end_date = start_date + pd.offsets.MonthBegin(1)
+            order_ids.update(pd.read_sql(query, db.source_engine(), params={
+                'start_date': start_date.strftime('%Y-%m-%d'), 'end_date': end_date.strftime('%Y-%m-%d')})['order_id'])
+        # Products are only enriched from, not upserted: changes to them are the incremental load's job
+        no_products = pd.DataFrame(columns=['product_id', 'product_name', 'category', 'price'])
+        return extract_orders(order_ids, set(), no_products)
+        
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return None, None, None, None, None, None
+
+def read_customer_totals(customer_ids):
+    """Lifetime total_amount, order count and first/last order date per customer, aggregated in the source database"""
+    ids = sorted(int(i) for i in customer_ids)
+    query = text("SELECT customer_id, SUM(total_amount) AS total_amount, COUNT(*) AS order_count, "
+                 "MIN(order_date) AS first_order_date, MAX(order_date) AS last_order_date FROM orders "
+                 "WHERE customer_id IN :ids GROUP BY customer_id").bindparams(bindparam('ids', expanding=True))
+    frames = []
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        frames.append(pd.read_sql(query, db.source_engine(), params={'ids': ids[start:start + IN_BATCH_SIZE]}))
+    customer_totals = pd.concat(frames or [pd.DataFrame(columns=['customer_id', 'total_amount', 'order_count',
+                                                                 'first_order_date', 'last_order_date'])],
+                                ignore_index=True)
+    customer_totals['total_amount'] = customer_totals['total_amount'].astype(float)
+    for column in ['first_order_date', 'last_order_date']:
+        customer_totals[column] = pd.to_datetime(customer_totals[column])
+    return customer_totals
+
+def transform_data(customers_df, products_df, orders_df, order_items_df):
+    """TRANSFORM data: Clean, calculate, enrich"""
+    print(" TRANSFORMING data with business logic...")
+    
+    try:
+        # Merge orders with order_items
+        sales_detail_df = pd.merge(
+            orders_df[['order_id', 'customer_id', 'order_date', 'total_amount', 'status']], 
+            order_items_df[['item_id', 'order_id', 'product_id', 'quantity', 'unit_price']], 
+            on='order_id', 
+            how='inner'
+        )
+        
+        # Merge with products
+        sales_detail_df = pd.merge(
+            sales_detail_df,
+            products_df[['product_id', 'product_name', 'category', 'price']],
+            on='product_id',
+            how='left'
+        )
+        
+        # Merge with customers
+        sales_detail_df = pd.merge(
+            sales_detail_df,
+            customers_df[['customer_id', 'first_name', 'last_name', 'city', 'registration_date']],
+            on='customer_id', 
+            how='left'
+        )
+        
+        # Calculate new columns
+        add_sales_measures(sales_detail_df)
+        
+        # Customer metrics, segments, RFM scores and CLV
+        customer_totals = customer_analytics.score_customers(customer_analytics.customer_metrics(orders_df, customers_df))
+        
+        print(f" TRANSFORMED: Created enriched sales data with {len(sales_detail_df)} records")
+        return sales_detail_df, customer_totals
+        
+    except Exception as e:
+        print(f" TRANSFORMATION FAILED: {e}")
+        return None, None
+
+def add_sales_measures(sales_detail_df):
+    """Line total and profit of enriched sales rows (shared by every transform engine)"""
+    sales_detail_df['line_total'] = sales_detail_df['quantity'] * sales_detail_df['unit_price']
+    sales_detail_df['profit'] = sales_detail_df['line_total'] * 0.3
+
+def add_sales_measures_lean(sales_detail_df):
+    """Line total and profit in integer cents: quantity * price is exact, profit is rounded half up to the cent"""
+    sales_detail_df['line_total_cents'] = sales_detail_df['quantity'].astype(np.int64) * sales_detail_df['unit_price_cents']
+    sales_detail_df['profit_cents'] = (sales_detail_df['line_total_cents'] * 3 + 5) // 10
+
+def to_cents(values):
+    """Money as int64 cents, so line totals and sums are exact integer arithmetic"""
+    return np.round(pd.to_numeric(values).to_numpy(dtype=np.float64) * 100).astype(np.int64)
+
+def compact_columns(df, columns):
+    """New frame with only columns, integer ids downcast, labels categorical and money in cents"""
+    compact = {}
+    for column in columns:
+        if column in LEAN_MONEY_COLUMNS:
+            # Frames compacted during extract already hold the cents column
+            cents_column = column + '_cents'
+            compact[cents_column] = df[cents_column] if column not in df else to_cents(df[column])
+        elif column in LEAN_INTEGER_COLUMNS:
+            compact[column] = pd.to_numeric(df[column], downcast='integer')
+        elif column in LEAN_CATEGORY_COLUMNS:
+            compact[column] = df[column].astype('category')
+        elif column == 'order_date':
+            compact[column] = pd.to_datetime(df[column])
+        else:
+            compact[column] = df[column]
+    return pd.DataFrame(compact, index=df.index)
+
+def transform_data_lean(customers_df, products_df, orders_df, order_items_df):
+    """TRANSFORM with pruned columns and compact dtypes (same facts, a fraction of the memory)"""
+    print(" TRANSFORMING data with business logic (lean)...")
+    
+    try:
+        # Prune and compact every input before it is joined, so no join carries unused columns
+        sales_detail_df = pd.merge(
+            compact_columns(orders_df, LEAN_COLUMNS['orders']),
+            compact_columns(order_items_df, LEAN_COLUMNS['order_items']),
+            on='order_id',
+            how='inner'
+        )
+        sales_detail_df = sales_detail_df.merge(compact_columns(products_df, LEAN_COLUMNS['products']),
+                                                on='product_id', how='left')
+        sales_detail_df = sales_detail_df.merge(compact_columns(customers_df, LEAN_COLUMNS['customers']),
+                                                on='customer_id', how='left')
+        
+        add_sales_measures_lean(sales_detail_df)
+        
+        customer_totals = customer_analytics.score_customers(customer_analytics.customer_metrics(orders_df, customers_df))
+        
+        print(f" TRANSFORMED: Created enriched sales data with {len(sales_detail_df)} records")
+        return sales_detail_df, customer_totals
+        
+    except Exception as e:
+        print(f" TRANSFORMATION FAILED: {e}")
+        return None, None
+
+def transform_data_sql(customers_df, lean=False, chunk_size=CHUNK_SIZE):
+    """TRANSFORM pushed down to the source database: joins and per-customer totals run in SQL,
+    only the enriched rows and one row per customer come back"""
+    print(f" TRANSFORMING data in the source database{' (lean)' if lean else ''}...")
+    
+    try:
+        if lean:
+            # Pages are compacted as they arrive, so the wide result is never held
+            columns = [column for _, column in transform_engine.LEAN_SALES_DETAIL_COLUMNS]
+            pages = [compact_columns(page, columns) for page in transform_engine.iter_sales_detail(
+                db.source_engine(), transform_engine.LEAN_SALES_DETAIL_COLUMNS, chunk_size)]
+            sales_detail_df = concat_compact_pages(pages, columns)
+            add_sales_measures_lean(sales_detail_df)
+        else:
+            pages = list(transform_engine.iter_sales_detail(db.source_engine(), transform_engine.SALES_DETAIL_COLUMNS,
+                                                            chunk_size))
+            sales_detail_df = pd.concat(pages or [pd.DataFrame(
+                columns=[column for _, column in transform_engine.SALES_DETAIL_COLUMNS])], ignore_index=True)
+            add_sales_measures(sales_detail_df)
+        
+        customer_totals = customer_analytics.score_customers(customer_analytics.with_cohorts(
+            transform_engine.read_customer_totals(db.source_engine()), customers_df))
+        
+        print(f" TRANSFORMED: Created enriched sales data with {len(sales_detail_df)} records")
+        return sales_detail_df, customer_totals
+        
+    except Exception as e:
+        print(f" TRANSFORMATION FAILED: {e}")
+        return None, None
+
+def concat_compact_pages(pages, columns):
+    """Concatenate compacted pages, keeping label columns categorical across pages"""
+    if not pages:
+        return compact_columns(pd.DataFrame(columns=columns), columns)
+    sales_detail_df = pd.concat(pages, ignore_index=True)
+    for column in LEAN_CATEGORY_COLUMNS:
+        if column in sales_detail_df:
+            # Pages have different category sets, which plain concat turns back into strings
+            sales_detail_df[column] = union_categoricals([page[column] for page in pages], sort_categories=True)
+    return sales_detail_df
+
+def validate_transform_engines(lean=False):
+    """Run the pandas and the SQL transform on the current source and report whether they agree"""
+    print(" VALIDATING transform engines (pandas vs sql)...")
+    customers_df, products_df, orders_df, order_items_df = extract_data_lean() if lean else extract_data()
+    if customers_df is None:
+        return False
+    transform = transform_data_lean if lean else transform_data
+    expected = transform(customers_df, products_df, orders_df, order_items_df)
+    del orders_df, order_items_df
+    actual = transform_data_sql(customers_df, lean)
+    if expected[0] is None or actual[0] is None:
+        return False
+    differences = transform_engine.compare_outputs(expected, actual)
+    for difference in differences:
+        print(f"   MISMATCH {difference}")
+    print(f" Transform engines {'differ' if differences else 'produce identical output'}")
+    return not differences
+
+def checkpoint_keys(lean=False, engine=TRANSFORM_ENGINE):
+    """What the extract and transform checkpoints depend on: source table state and the code producing them"""
+    extract_key = {
+        'source': checkpoint.source_fingerprint(db.source_engine(), SOURCE_KEYS),
+        'lean': lean,
+        'engine': engine,
+        'queries': EXTRACT_QUERIES,
+        'lean_columns': [LEAN_COLUMNS, LEAN_INTEGER_COLUMNS, LEAN_CATEGORY_COLUMNS, LEAN_MONEY_COLUMNS],
+        'code': checkpoint.code_version(extract_data, extract_data_concurrent, extract_data_lean,
+                                        extract_dimension_sources, iter_table_chunks, compact_columns, to_cents),
+    }
+    # Quarantining changes the frames the transform sees, so the rules and their action are part of the key
+    transform_key = dict(extract_key, quality=data_quality.QUALITY_ACTION, transform_code=checkpoint.code_version(
+        transform_data, transform_data_lean, transform_data_sql, concat_compact_pages, add_sales_measures,
+        add_sales_measures_lean, compact_columns, to_cents, customer_analytics, transform_engine, data_quality))
+    return extract_key, transform_key
+
+def extract_sources(lean=False, extract_workers=None, keys=None, engine=TRANSFORM_ENGINE):
+    """EXTRACT with the lean, concurrent or default method, reusing a checkpoint when keys are given
+
+    The SQL transform engine reads the fact sources itself, so only customers and products are extracted.
+    """
+    def extract():
+        if engine == 'sql':
+            return extract_dimensions_only()
+        if lean:
+            return extract_data_lean()
+        if extract_workers:
+            return extract_data_concurrent(extract_workers)
+        return extract_data()
+    if keys is None:
+        return extract()
+    return checkpoint.cached('extract', keys[0], extract, EXTRACT_FRAMES)
+
+def extract_dimensions_only():
+    """EXTRACT customers and products (orders and order items stay in the source for the SQL engine)"""
+    print("EXTRACTING dimension sources from source database...")
+    try:
+        customers_df, products_df = extract_dimension_sources()
+        return customers_df, products_df, None, None
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return None, None, None, None
+
+def validate_stage(sources, label='full'):
+    """VALIDATE the extracted frames as the 'validate' stage; None when the run has to stop"""
+    with stage('validate') as metrics:
+        # Rules on frames the SQL transform engine does not extract are checked in the source database
+        sources = data_quality.validate_sources(sources, label=label, source_engine=db.source_engine())
+        metrics.failed = sources is None
+    if sources is None:
+        print(" ETL Pipeline failed at VALIDATE stage")
+    return sources
+
+def transform_sources(sources, lean=False, keys=None, engine=TRANSFORM_ENGINE):
+    """TRANSFORM with the chosen engine, reusing a checkpoint when keys are given"""
+    if engine == 'sql':
+        def transform(customers_df, *_):
+            return transform_data_sql(customers_df, lean)
+    else:
+        transform = transform_data_lean if lean else transform_data
+    if keys is None:
+        return transform(*sources)
+    return checkpoint.cached('transform', keys[1], lambda: transform(*sources), TRANSFORM_FRAMES)
+
+def create_data_warehouse_tables(full_refresh=True):
+    """CREATE Data Warehouse tables (Star Schema); full_refresh creates empty staging copies to load instead"""
+    print(" CREATING Data Warehouse tables...")
+    
+    try:
+        # The warehouse is MySQL; SQLite stands in for it in local tests and benchmarks
+        is_mysql = db.dw_engine().dialect.name == 'mysql'
+        surrogate_key = "INT AUTO_INCREMENT PRIMARY KEY" if is_mysql else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        customer_analytics_columns = ', '.join(f"{column} {column_type}" for column, column_type
+                                               in customer_analytics.DIM_CUSTOMER_COLUMN_TYPES.items())
+        # dim_customer and dim_product keep every version of a member (SCD Type 2)
+        history_columns = ', '.join(f"{column} {column_type}" for column, column_type
+                                    in dimension_history.HISTORY_COLUMN_TYPES.items())
+        # MySQL range-partitions fact_sales by month of date_key, which the primary key must then include
+        if is_mysql:
+            fact_surrogate_key = "INT AUTO_INCREMENT"
+            fact_primary_key = ",\n                    PRIMARY KEY (sales_key, date_key)"
+            fact_partitioning = warehouse_schema.FACT_PARTITIONING
+        else:
+            fact_surrogate_key, fact_primary_key, fact_partitioning = surrogate_key, "", ""
+        # The live tables stay readable during a full load; it fills staging copies
+        suffix = STAGING_SUFFIX if full_refresh else ''
+        with db.dw_engine().connect() as conn:
+            if full_refresh:
+                # Drop staging tables left by an earlier, unpublished load
+                if is_mysql:
+                    conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+                tables = ['fact_sales', 'dim_customer', 'dim_product', 'dim_date']
+                for table in tables:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {table}{suffix}"))
+                if is_mysql:
+                    conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+            
+            # Create dimension tables
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS dim_customer{suffix} (
+                    customer_key {surrogate_key},
+                    customer_id INT,
+                    customer_name VARCHAR(100),
+                    city VARCHAR(50),
+                    customer_segment VARCHAR(20),
+                    total_spent DECIMAL(10,2),
+                    {customer_analytics_columns},
+                    {history_columns},
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS dim_product{suffix} (
+                    product_key {surrogate_key},
+                    product_id INT,
+                    product_name VARCHAR(100),
+                    category VARCHAR(50),
+                    price DECIMAL(10,2),
+                    {history_columns},
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS dim_date{suffix} (
+                    date_key INT PRIMARY KEY,
+                    full_date DATE,
+                    day INT,
+                    month INT, 
+                    year INT,
+                    quarter INT,
+                    week INT,
+                    day_name VARCHAR(10),
+                    is_weekend BOOLEAN,
+                    fiscal_year INT,
+                    fiscal_quarter INT,
+                    fiscal_month INT,
+                    is_holiday BOOLEAN,
+                    holiday_name VARCHAR(50),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            
+            # Create fact table (secondary indexes are built after the load, see warehouse_schema)
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS fact_sales{suffix} (
+                    sales_key {fact_surrogate_key},
+                    date_key INT NOT NULL,
+                    customer_key INT,
+                    product_key INT, 
+                    order_id INT,
+                    order_status VARCHAR(20),
+                    quantity INT,
+                    amount DECIMAL(10,2),
+                    profit DECIMAL(10,2),
+                    line_total DECIMAL(10,2),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP{fact_primary_key}
+                ) {fact_partitioning}
+            """))
+            
+            ensure_unknown_members(conn, suffix)
+            if not full_refresh:
+                # Incremental loads upsert row by row, so they run with every index in place
+                warehouse_schema.create_secondary_indexes(conn)
+            
+            # Dashboard rollups maintained next to the star schema
+            create_aggregate_tables(conn, full_refresh, suffix)
+            customer_analytics.create_cohort_tables(conn, full_refresh, suffix)
+            
+            # High-water marks of the source tables for incremental loads
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS etl_watermark (
+                    table_name VARCHAR(50) PRIMARY KEY,
+                    last_id INT,
+                    last_created_at DATETIME NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            # Quarantined orders the marks already moved past, extracted again by the next incremental run
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS etl_requeued_orders (
+                    order_id INT PRIMARY KEY
+                )
+            """))
+            
+        print(" Data Warehouse tables created successfully")
+        return True
+        
+    except Exception as e:
+        print(f" Data Warehouse creation failed: {e}")
+        return False
+
+def ensure_unknown_members(conn, suffix=''):
+    """Add the "unknown member" rows that facts with a missing dimension row point to"""
+    unknown_rows = {
+        'dim_customer': ("customer_key", f"INSERT INTO dim_customer{suffix} (customer_key, customer_id, customer_name, city, customer_segment, total_spent) "
+                                         "VALUES (:key, :key, 'Unknown', 'Unknown', 'Unknown', 0)"),
+        'dim_product': ("product_key", f"INSERT INTO dim_product{suffix} (product_key, product_id, product_name, category, price) "
+                                       "VALUES (:key, :key, 'Unknown', 'Unknown', 0)"),
+    }
+    for table, (key_column, insert_sql) in unknown_rows.items():
+        exists = conn.execute(text(f"SELECT COUNT(*) FROM {table}{suffix} WHERE {key_column} = :key"),
+                              {'key': UNKNOWN_MEMBER_KEY}).scalar()
+        if not exists:
+            conn.execute(text(insert_sql), {'key': UNKNOWN_MEMBER_KEY})
+
+def build_dim_customer(customer_totals, customer_attributes):
+    """Build dim_customer rows from customer totals and customer name/city attributes"""
+    dim_customer_data = pd.merge(
+        customer_totals,
+        customer_attributes[['customer_id', 'first_name', 'last_name', 'city']].drop_duplicates(),
+        on='customer_id',
+        how='left'
+    )
+    dim_customer_data['customer_name'] = dim_customer_data['first_name'] + ' ' + dim_customer_data['last_name']
+    # Incremental loads upsert the metrics only; the scores are recomputed in the warehouse afterwards
+    analytics_columns = [column for column in customer_analytics.SCORE_COLUMNS + customer_analytics.METRIC_COLUMNS
+                         if column in dim_customer_data]
+    dim_customer_data = dim_customer_data[['customer_id', 'customer_name', 'city'] + analytics_columns + ['total_amount']]
+    dim_customer_data.rename(columns={'total_amount': 'total_spent'}, inplace=True)
+    return dim_customer_data
+
+def build_dim_date(order_dates):
+    """Build dim_date rows for the whole calendar years spanned by the order dates"""
+    if len(order_dates) == 0:
+        # Empty range: no rows, but the same columns and dtypes
+        return build_date_dimension('2000-01-01', '1999-12-31')
+    start_date, end_date = calendar_range(order_dates)
+    return build_date_dimension(start_date, end_date)
+
+def build_fact_sales(sales_detail_df, customer_index, product_index):
+    """Build fact_sales rows from the enriched sales data, keyed to the dimensions' surrogate keys"""
+    # Built column by column: the wide sales frame is never copied
+    fact_sales_data = pd.DataFrame({
+        'date_key': date_keys(sales_detail_df['order_date']),
+        # Each sale points to the member's version valid on its order date (SCD Type 2)
+        'customer_key': customer_index.lookup_at(sales_detail_df['customer_id'], sales_detail_df['order_date']),
+        'product_key': product_index.lookup_at(sales_detail_df['product_id'], sales_detail_df['order_date']),
+        'order_id': sales_detail_df['order_id'].to_numpy(),
+        'order_status': sales_detail_df['status'].to_numpy(),
+        'quantity': sales_detail_df['quantity'].to_numpy(),
+    })
+    # Lean frames carry money as integer cents
+    for fact_column, column in [('amount', 'unit_price'), ('profit', 'profit'), ('line_total', 'line_total')]:
+        if column + '_cents' in sales_detail_df:
+            fact_sales_data[fact_column] = sales_detail_df[column + '_cents'].to_numpy() / 100
+        else:
+            fact_sales_data[fact_column] = sales_detail_df[column].to_numpy()
+    return fact_sales_data
+
+def customer_version_rows(customers_df):
+    """Source customers with the tracked dim_customer columns, for planning versions before the totals exist"""
+    return pd.DataFrame({'customer_id': customers_df['customer_id'],
+                         'customer_name': customers_df['first_name'] + ' ' + customers_df['last_name'],
+                         'city': customers_df['city']})
+
+def assign_dimension_versions(customer_rows, products_df):
+    """Hash-diff the incoming customers and products against the live dimensions and pre-assign surrogate keys:
+    unchanged members keep theirs, changed and new members get new versions"""
+    with db.dw_engine().connect() as conn:
+        customer_index = dimension_history.plan_versions(conn, 'dim_customer', customer_rows, full=True,
+                                                         attributes=VERSION_ATTRIBUTES['dim_customer'])
+        product_index = dimension_history.plan_versions(conn, 'dim_product', products_df, full=True,
+                                                        attributes=VERSION_ATTRIBUTES['dim_product'])
+    return customer_index, product_index
+
+def assign_warehouse_keys(sales_detail_df, customer_totals, products_df, customers_df=None):
+    """Build dim_customer rows and pre-assign customer/product surrogate keys, so facts can be keyed without a read-back"""
+    dim_customer_data = build_dim_customer(customer_totals,
+                                           sales_detail_df if customers_df is None else customers_df)
+    customer_index, product_index = assign_dimension_versions(dim_customer_data, products_df)
+    return dim_customer_data, customer_index, product_index
+
+def build_dim_product(products_df, product_index):
+    """Build dim_product rows (current versions) with their pre-assigned surrogate keys"""
+    return product_index.with_history(products_df[['product_id', 'product_name', 'category', 'price']])
+
+def clear_staging_tables(tables):
+    """Empty staging tables (keeping their unknown member rows) before loading them
+    
+    Every full-load step starts from its own empty tables, so a step that failed partway,
+    e.g. after some parallel fact slices committed, can simply run again.
+    """
+    with db.dw_engine().begin() as conn:
+        for table in tables:
+            if table in dimension_history.DIMENSION_KEYS:
+                surrogate_key = dimension_history.DIMENSION_KEYS[table][1]
+                conn.execute(text(f"DELETE FROM {table}{STAGING_SUFFIX} WHERE {surrogate_key} <> :unknown"),
+                             {'unknown': UNKNOWN_MEMBER_KEY})
+            else:
+                conn.execute(text(f"DELETE FROM {table}{STAGING_SUFFIX}"))
+
+def stage_dimension_versions(table, dimension_df, versions):
+    """Stage a full load's versions of a dimension with history: the stored versions are copied inside the
+    warehouse, then only new versions and changed rows are written to the copy (the live table waits for the publish)"""
+    with db.dw_engine().begin() as conn:
+        copied = dimension_history.copy_versions(conn, table, STAGING_SUFFIX)
+        new_rows, updates = write_dimension_versions(conn, table, dimension_df, versions, changed_only=True,
+                                                     suffix=STAGING_SUFFIX)
+    print(f" Staged {table}: {copied} stored versions copied, {len(new_rows)} inserted, "
+          f"{len(versions.retired_keys)} closed, {len(updates)} rows updated")
+    return [new_rows, updates]
+
+def load_dim_customer(dim_customer_data, customer_index):
+    """Load dim_customer into staging: the stored versions with this load's changes, or the first versions"""
+    clear_staging_tables(['dim_customer'])
+    if customer_index.stored_history:
+        return stage_dimension_versions('dim_customer', dim_customer_data, customer_index)
+    dim_customer_rows = customer_index.with_history(dim_customer_data)
+    bulk_load(dim_customer_rows, 'dim_customer' + STAGING_SUFFIX, db.dw_engine())
+    print("Loaded dim_customer table")
+    return [dim_customer_rows]
+
+def load_dim_product(products_df, product_index):
+    """Load dim_product into staging: the stored versions with this load's changes, or the first versions"""
+    product_columns = ['product_id', 'product_name', 'category', 'price']
+    clear_staging_tables(['dim_product'])
+    if product_index.stored_history:
+        return stage_dimension_versions('dim_product', products_df[product_columns], product_index)
+    dim_product_rows = build_dim_product(products_df, product_index)
+    bulk_load(dim_product_rows, 'dim_product' + STAGING_SUFFIX, db.dw_engine())
+    print(" Loaded dim_product table")
+    return [dim_product_rows]
+
+def load_dim_date(sales_detail_df):
+    """Load dim_date for the calendar years of the orders"""
+    clear_staging_tables(['dim_date'])
+    dim_date_rows = build_dim_date(sales_detail_df['order_date'])
+    bulk_load(dim_date_rows, 'dim_date' + STAGING_SUFFIX, db.dw_engine())
+    print(" Loaded dim_date table")
+    return [dim_date_rows]
+
+def load_worker_count(workers):
+    """Concurrent bulk loads the warehouse can take: SQLite has a single writer, so it loads on one"""
+    workers = max(1, min(workers or LOAD_WORKERS, db.max_connections()))
+    if workers > 1 and db.dw_engine().dialect.name == 'sqlite':
+        print(" SQLite allows one writer at a time: loading with 1 worker")
+        return 1
+    return workers
+
+def fact_slices(fact_sales_data, slices):
+    """Split fact rows into up to `slices` parts: whole months (one partition each) when there are
+    enough of them, else contiguous row ranges"""
+    if slices <= 1 or len(fact_sales_data) == 0:
+        return [fact_sales_data]
+    months = fact_sales_data['date_key'] // 100
+    month_rows = months.value_counts()
+    if len(month_rows) < slices:
+        bounds = np.linspace(0, len(fact_sales_data), slices + 1).astype(np.int64)
+        return [fact_sales_data.iloc[low:high] for low, high in zip(bounds[:-1], bounds[1:]) if low < high]
+    # Largest months first, each onto the lightest slice so far
+    slice_rows = [0] * slices
+    slice_months = [[] for _ in range(slices)]
+    for month, rows in month_rows.items():
+        lightest = slice_rows.index(min(slice_rows))
+        slice_rows[lightest] += rows
+        slice_months[lightest].append(month)
+    return [fact_sales_data[months.isin(month_keys)] for month_keys in slice_months if month_keys]
+
+def load_parallel(tasks, workers):
+    """Bulk load (table, DataFrame) tasks on a pool of workers, each with its own pooled connection"""
+    def load_task(task):
+        result = bulk_load(task[1], task[0], db.dw_engine())
+        result['worker'] = threading.current_thread().name
+        return result
+    
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='load') as executor:
+        results = list(executor.map(load_task, tasks))
+    seconds = time.perf_counter() - start_time
+    
+    # Per-worker throughput shows whether the workers or the warehouse are the limit
+    for worker in sorted({result['worker'] for result in results}):
+        worker_results = [result for result in results if result['worker'] == worker]
+        rows = sum(result['rows'] for result in worker_results)
+        busy = sum(result['seconds'] for result in worker_results)
+        print(f"   {worker}: {len(worker_results)} loads, {rows} rows in {busy:.2f}s "
+              f"({rows / busy if busy > 0 else 0.0:,.0f} rows/sec)")
+    rows = sum(result['rows'] for result in results)
+    print(f" Loaded {len(tasks)} slices with {workers} workers: {rows} rows in {seconds:.2f}s "
+          f"({rows / seconds if seconds > 0 else 0.0:,.0f} rows/sec)")
+    return results
+
+def fact_sales_tasks(sales_detail_df, customer_index, product_index, slices=1):
+    """fact_sales rows as (table, slice) load tasks, with the staging partitions they need in place"""
+    fact_sales_data = build_fact_sales(sales_detail_df, customer_index, product_index)
+    warehouse_schema.ensure_partitions(db.dw_engine(), warehouse_schema.month_keys_of(fact_sales_data['date_key']),
+                                       'fact_sales' + STAGING_SUFFIX)
+    return [('fact_sales' + STAGING_SUFFIX, part) for part in fact_slices(fact_sales_data, slices)]
+
+def load_fact_sales(sales_detail_df, customer_index, product_index, load_workers=None):
+    """Load fact_sales keyed with the pre-assigned surrogate keys (in parallel slices with several workers)"""
+    clear_staging_tables(['fact_sales'])
+    workers = load_worker_count(load_workers)
+    tasks = fact_sales_tasks(sales_detail_df, customer_index, product_index, workers)
+    if workers > 1:
+        load_parallel(tasks, workers)
+    else:
+        bulk_load(tasks[0][1], tasks[0][0], db.dw_engine())
+    print(" Loaded fact_sales table")
+    return [fact_slice for _, fact_slice in tasks]
+
+def load_summary_tables(sales_detail_df, customer_index, product_index):
+    """Load the pre-aggregated summary tables, counting each sale under the dimension versions it is keyed to"""
+    clear_staging_tables(list(AGGREGATES))
+    aggregates = aggregate_fact_rows(build_fact_sales(sales_detail_df, customer_index, product_index),
+                                     customer_index, product_index)
+    load_aggregates(db.dw_engine(), aggregates, STAGING_SUFFIX)
+    print(" Loaded aggregate tables")
+    return list(aggregates.values())
+
+def load_customer_cohorts(sales_detail_df, dim_customer_data):
+    """Load the customer activity and cohort retention tables"""
+    clear_staging_tables(list(customer_analytics.COHORT_TABLES))
+    activity = customer_analytics.customer_activity(sales_detail_df)
+    cohort_frames = customer_analytics.load_cohorts(db.dw_engine(), activity,
+                                                    dim_customer_data[['customer_id', 'cohort_month']], STAGING_SUFFIX)
+    print(" Loaded cohort tables")
+    return list(cohort_frames)
+
+def build_warehouse_indexes():
+    """Build the secondary indexes the bulk load skipped and refresh the table statistics"""
+    try:
+        warehouse_schema.finish_bulk_load(db.dw_engine())
+        return True
+        
+    except Exception as e:
+        print(f" INDEX BUILD FAILED: {e}")
+        return False
+
+def publish_staging():
+    """Swap the loaded staging tables in for the live ones, all in one atomic step"""
+    warehouse_schema.publish_staging_tables(db.dw_engine(), PUBLISHED_TABLES)
+
+def publish_warehouse():
+    """Publish the staging tables of a full load"""
+    try:
+        publish_staging()
+        return True
+        
+    except Exception as e:
+        print(f" PUBLISH FAILED: {e}")
+        return False
+
+def load_data_to_warehouse(sales_detail_df, customer_totals, products_df, customers_df=None, load_workers=None):
+    """LOAD transformed data to Data Warehouse (dim_customer attributes from customers_df when given)"""
+    print(" LOADING data to Data Warehouse...")
+    
+    try:
+        dim_customer_data, customer_index, product_index = assign_warehouse_keys(
+            sales_detail_df, customer_totals, products_df, customers_df)
+        workers = load_worker_count(load_workers)
+        if workers > 1:
+            # Dimensions and fact slices all at once: keys are pre-assigned, so nothing waits on another table
+            tasks = [('dim_date' + STAGING_SUFFIX, build_dim_date(sales_detail_df['order_date']))]
+            # Dimensions with history are staged from their stored versions first
+            if customer_index.stored_history:
+                load_dim_customer(dim_customer_data, customer_index)
+            else:
+                tasks.append(('dim_customer' + STAGING_SUFFIX, customer_index.with_history(dim_customer_data)))
+            if product_index.stored_history:
+                load_dim_product(products_df, product_index)
+            else:
+                tasks.append(('dim_product' + STAGING_SUFFIX, build_dim_product(products_df, product_index)))
+            tasks += fact_sales_tasks(sales_detail_df, customer_index, product_index, workers)
+            load_parallel(tasks, workers)
+        else:
+            load_dim_customer(dim_customer_data, customer_index)
+            load_dim_product(products_df, product_index)
+            load_dim_date(sales_detail_df)
+            load_fact_sales(sales_detail_df, customer_index, product_index, 1)
+        load_summary_tables(sales_detail_df, customer_index, product_index)
+        load_customer_cohorts(sales_detail_df, dim_customer_data)
+        warehouse_schema.finish_bulk_load(db.dw_engine())
+        publish_staging()
+        
+        print(" DATA WAREHOUSE LOADING COMPLETED!")
+        return True
+        
+    except Exception as e:
+        print(f" LOADING FAILED: {e}")
+        return False
+
+def sql_records(df):
+    """DataFrame rows as plain-Python dicts (NaN -> None, Timestamp -> datetime) for executemany"""
+    records = df.astype(object)
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            records[column] = pd.Series(df[column].dt.to_pydatetime(), index=df.index, dtype=object)
+    return records.where(df.notna(), None).to_dict('records')
+
+def write_dimension_versions(conn, table, df, versions, changed_only=False, suffix=''):
+    """Apply planned versions to a stored dimension (suffix: its staging copy): close the replaced versions,
+    insert the new ones and update the remaining (Type 1) columns of the others (changed_only: only where they differ)
+    
+    Returns the inserted version rows and the updated rows.
+    """
+    natural_key, surrogate_key = dimension_history.DIMENSION_KEYS[table]
+    rows = versions.with_history(df.drop_duplicates(natural_key))
+    is_new_version = versions.new_version_rows(rows)
+    
+    if len(versions.retired_keys):
+        conn.execute(text(f"UPDATE {table}{suffix} SET valid_to = :valid_to, is_current = 0 "
+                          f"WHERE {surrogate_key} = :key"),
+                     [{'valid_to': versions.load_time, 'key': int(key)} for key in versions.retired_keys])
+    bulk_load(rows[is_new_version], table + suffix, conn)
+    
+    type1_columns = [c for c in df.columns if c != natural_key and c not in dimension_history.TRACKED_COLUMNS[table]]
+    updates = rows.loc[~is_new_version, [surrogate_key] + type1_columns]
+    if changed_only and type1_columns and not updates.empty:
+        updates = updates[dimension_history.changed_rows(conn, table, updates, type1_columns, suffix)]
+    if type1_columns and not updates.empty:
+        assignments = ', '.join(f"{c} = :{c}" for c in type1_columns)
+        conn.execute(text(f"UPDATE {table}{suffix} SET {assignments} WHERE {surrogate_key} = :{surrogate_key}"),
+                     sql_records(updates))
+    return rows[is_new_version], updates if type1_columns else updates.iloc[:0]
+
+def upsert_dimension(conn, df, table):
+    """Apply changed rows to a versioned dimension in place, writing only what changed
+    
+    A member whose tracked columns hash differently gets its current row closed and a new version;
+    new members get a first version; the others only have their remaining (Type 1) columns updated.
+    """
+    if df.empty:
+        return 0, 0
+    versions = dimension_history.plan_versions(conn, table, df)
+    new_rows, updates = write_dimension_versions(conn, table, df, versions)
+    return len(updates), len(new_rows)
+
+def upsert_dimensions(conn, sales_detail_df, customer_totals, customers_df, changed_products):
+    """Upsert the changed dimension rows and add missing dates, returning the key indexes for the facts"""
+    updated, inserted = upsert_dimension(conn, build_dim_customer(customer_totals, customers_df), 'dim_customer')
+    print(f" Upserted dim_customer: {updated} updated in place, {inserted} versions inserted")
+    
+    dim_product_data = changed_products[['product_id', 'product_name', 'category', 'price']]
+    updated, inserted = upsert_dimension(conn, dim_product_data, 'dim_product')
+    print(f" Upserted dim_product: {updated} updated in place, {inserted} versions inserted")
+    
+    dim_date_df = build_dim_date(sales_detail_df['order_date'])
+    if not dim_date_df.empty:
+        existing_dates = read_rows_by_ids(conn, 'dim_date', ['date_key'], 'date_key', dim_date_df['date_key'])
+        dim_date_df = dim_date_df[~dim_date_df['date_key'].isin(existing_dates['date_key'].astype(int))]
+        bulk_load(dim_date_df, 'dim_date', conn)
+    print(f" Added {len(dim_date_df)} dim_date rows")
+    
+    # Read back every version of the members: each fact points to the one valid on its order date
+    customer_index = dimension_history.VersionHistory.from_table(conn, 'dim_customer',
+                                                                 ids=sales_detail_df['customer_id'].dropna())
+    product_index = dimension_history.VersionHistory.from_table(conn, 'dim_product',
+                                                                ids=sales_detail_df['product_id'].dropna())
+    return customer_index, product_index
+
+def load_incremental_to_warehouse(sales_detail_df, customer_totals, customers_df, changed_products, watermarks):
+    """LOAD (upsert) changed rows into the existing star schema and advance the high-water marks"""
+    print(" LOADING changes to Data Warehouse...")
+    
+    try:
+        # New months get their partitions first: partition DDL would commit an open transaction
+        warehouse_schema.ensure_partitions(db.dw_engine(), warehouse_schema.month_keys_of(
+            date_keys(sales_detail_df['order_date'])))
+        
+        # One transaction: the warehouse and the marks move forward together or not at all
+        with db.dw_engine().begin() as conn:
+            # Retract the stored rows of changed orders from the aggregates, under the
+            # category/city they were counted with. Stored facts keep the dimension versions
+            # they were loaded with, so a changed customer/product moves only its reloaded orders
+            order_ids = sorted(int(i) for i in sales_detail_df['order_id'].unique())
+            retractions = aggregate_sales(read_fact_rows(conn, order_ids), sign=-1)
+            
+            customer_index, product_index = upsert_dimensions(conn, sales_detail_df, customer_totals,
+                                                              customers_df, changed_products)
+            
+            # Changed orders are replaced as a whole
+            delete_facts = text("DELETE FROM fact_sales WHERE order_id IN :ids").bindparams(
+                bindparam('ids', expanding=True))
+            for start in range(0, len(order_ids), IN_BATCH_SIZE):
+                conn.execute(delete_facts, {'ids': order_ids[start:start + IN_BATCH_SIZE]})
+            fact_sales_data = build_fact_sales(sales_detail_df, customer_index, product_index)
+            bulk_load(fact_sales_data, 'fact_sales', conn)
+            print(f" Replaced fact_sales rows of {len(order_ids)} orders ({len(fact_sales_data)} rows)")
+            
+            # Re-add the affected orders as they are stored now
+            additions = aggregate_sales(read_fact_rows(conn, order_ids))
+            merge_aggregate_deltas(conn, combine_aggregates(retractions, additions))
+            print(" Merged aggregate deltas")
+            
+            # RFM bins and recency are relative to all customers: re-score them at customer grain
+            rescored = customer_analytics.rescore_customers(conn, customer_totals['customer_id'])
+            activity_rows, cohorts = customer_analytics.refresh_customer_cohorts(conn, customer_totals['customer_id'])
+            print(f" Re-scored {rescored} customers, refreshed {activity_rows} activity rows in {cohorts} cohorts")
+            
+            save_watermarks(conn, watermarks, data_quality.take_quarantined_order_ids())
+        
+        print(" INCREMENTAL LOADING COMPLETED!")
+        return True
+        
+    except Exception as e:
+        print(f" LOADING FAILED: {e}")
+        return False
+
+def read_month_customer_ids(conn, month_keys):
+    """Customers with stored facts in some YYYYMM months"""
+    customer_ids = set()
+    query = text("""
+        SELECT DISTINCT c.customer_id FROM fact_sales f
+        JOIN dim_customer c ON c.customer_key = f.customer_key
+        WHERE f.date_key BETWEEN :first_key AND :last_key
+    """)
+    for month_key in month_keys:
+        customer_ids.update(conn.execute(query, {'first_key': month_key * 100,
+                                                 'last_key': month_key * 100 + 99}).scalars())
+    return customer_ids
+
+def delete_moved_facts(conn, order_ids, month_keys):
+    """Delete stored rows of reloaded orders that sit outside the reloaded months, returning those rows' months"""
+    query = text("SELECT sales_key, date_key FROM fact_sales WHERE order_id IN :ids").bindparams(
+        bindparam('ids', expanding=True))
+    delete_rows = text("DELETE FROM fact_sales WHERE sales_key IN :keys").bindparams(bindparam('keys', expanding=True))
+    moved_months = set()
+    for start in range(0, len(order_ids), IN_BATCH_SIZE):
+        rows = pd.read_sql(query, conn, params={'ids': order_ids[start:start + IN_BATCH_SIZE]})
+        moved = rows[~(rows['date_key'] // 100).isin(month_keys)]
+        if not moved.empty:
+            conn.execute(delete_rows, {'keys': [int(key) for key in moved['sales_key']]})
+            moved_months.update(int(month) for month in moved['date_key'] // 100)
+    return sorted(moved_months)
+
+def load_month_partitions(sales_detail_df, customer_totals, customers_df, changed_products, month_keys):
+    """LOAD whole months: replace their fact_sales partitions, then rebuild what is derived from them"""
+    print(" RELOADING fact_sales partitions...")
+    
+    try:
+        month_keys = sorted(int(m) for m in month_keys)
+        warehouse_schema.ensure_partitions(db.dw_engine(), month_keys)
+        with db.dw_engine().begin() as conn:
+            # Customers who had facts in the months are re-derived too, even if those facts are gone now
+            stored_customer_ids = read_month_customer_ids(conn, month_keys)
+            customer_index, product_index = upsert_dimensions(conn, sales_detail_df, customer_totals,
+                                                              customers_df, changed_products)
+        
+        fact_sales_data = build_fact_sales(sales_detail_df, customer_index, product_index)
+        fact_months = fact_sales_data['date_key'] // 100
+        for month_key in month_keys:
+            month_rows = fact_sales_data[fact_months == month_key]
+            method = warehouse_schema.replace_partition(db.dw_engine(), month_key, month_rows)
+            print(f" Replaced fact_sales {month_key}: {len(month_rows)} rows ({method})")
+        
+        with db.dw_engine().begin() as conn:
+            # Orders re-dated into a reloaded month still have rows under their old month
+            order_ids = sorted(int(i) for i in sales_detail_df['order_id'].unique())
+            moved_months = delete_moved_facts(conn, order_ids, month_keys)
+            rebuild_aggregate_months(conn, month_keys + moved_months)
+            print(f" Rebuilt aggregates of {len(month_keys) + len(moved_months)} months")
+            
+            customer_ids = stored_customer_ids | set(customer_totals['customer_id'])
+            rescored = customer_analytics.rescore_customers(conn, customer_ids)
+            activity_rows, cohorts = customer_analytics.refresh_customer_cohorts(conn, customer_ids)
+            print(f" Re-scored {rescored} customers, refreshed {activity_rows} activity rows in {cohorts} cohorts")
+            
+            # The reloaded months lost their quarantined orders' rows: the next incremental run retries them
+            requeue_order_ids(conn, data_quality.take_quarantined_order_ids())
+        
+        print(" PARTITION RELOAD COMPLETED!")
+        return True
+        
+    except Exception as e:
+        print(f" LOADING FAILED: {e}")
+        return False
+
+def run_month_reload(month_keys, lean=False):
+    """Re-extract some months from the source and swap in their fact_sales partitions (watermarks stay put)"""
+    if not create_data_warehouse_tables(full_refresh=False):
+        print(" ETL Pipeline failed at Data Warehouse creation")
+        return False
+    
+    with stage('extract') as metrics:
+        (customers_df, products_df, orders_df, order_items_df,
+         changed_products, customer_totals) = extract_months(month_keys)
+        metrics.failed = customers_df is None
+        metrics.record(customers_df, products_df, orders_df, order_items_df)
+    if customers_df is None:
+        print(" ETL Pipeline failed at EXTRACT stage")
+        return False
+    
+    sources = validate_stage((customers_df, products_df, orders_df, order_items_df),
+                             'reload')
+    if sources is None:
+        return False
+    customers_df, products_df, orders_df, order_items_df = sources
+    
+    with stage('transform') as metrics:
+        transform = transform_data_lean if lean else transform_data
+        sales_detail_df, _ = transform(customers_df, products_df, orders_df, order_items_df)
+        metrics.failed = sales_detail_df is None
+        metrics.record(sales_detail_df)
+    if sales_detail_df is None:
+        print(" ETL Pipeline failed at TRANSFORM stage")
+        return False
+    customer_totals = customer_analytics.with_cohorts(customer_totals, customers_df)
+    
+    with stage('load') as metrics:
+        metrics.failed = not load_month_partitions(sales_detail_df, customer_totals, customers_df,
+                                                   changed_products, month_keys)
+        metrics.record(sales_detail_df)
+    return not metrics.failed
+
+def run_incremental_etl(lean=False):
+    """Run the ETL on the rows changed since the last load, upserting into the existing warehouse"""
+    if not create_data_warehouse_tables(full_refresh=False):
+        print(" ETL Pipeline failed at Data Warehouse creation")
+        return False
+    
+    # Snapshot the new marks first: rows arriving during the run are picked up (again) next time
+    new_watermarks = read_source_watermarks()
+    watermarks = load_watermarks()
+    if not watermarks:
+        print(" No high-water marks found: loading the full history incrementally")
+    requeued_order_ids = load_requeued_order_ids()
+    if requeued_order_ids:
+        print(f" Retrying {len(requeued_order_ids)} quarantined orders")
+    
+    with stage('extract') as metrics:
+        (customers_df, products_df, orders_df, order_items_df,
+         changed_products, customer_totals) = extract_incremental(watermarks, requeued_order_ids)
+        metrics.failed = customers_df is None
+        metrics.record(customers_df, products_df, orders_df, order_items_df)
+    if customers_df is None:
+        print(" ETL Pipeline failed at EXTRACT stage")
+        return False
+    
+    sources = validate_stage((customers_df, products_df, orders_df, order_items_df),
+                             'incremental')
+    if sources is None:
+        return False
+    customers_df, products_df, orders_df, order_items_df = sources
+    
+    with stage('transform') as metrics:
+        transform = transform_data_lean if lean else transform_data
+        sales_detail_df, _ = transform(customers_df, products_df, orders_df, order_items_df)
+        metrics.failed = sales_detail_df is None
+        metrics.record(sales_detail_df)
+    if sales_detail_df is None:
+        print(" ETL Pipeline failed at TRANSFORM stage")
+        return False
+    # Metrics come from lifetime totals, not from the changed orders alone (scores follow in the load)
+    customer_totals = customer_analytics.with_cohorts(customer_totals, customers_df)
+    
+    with stage('load') as metrics:
+        metrics.failed = not load_incremental_to_warehouse(sales_detail_df, customer_totals, customers_df,
+                                                           changed_products, new_watermarks)
+        metrics.record(sales_detail_df)
+    return not metrics.failed
+
+def load_accumulated_tables(customer_totals, customers_df, customer_index, order_dates, aggregates, activity):
+    """Load the tables chunked loads accumulate across chunks (dim_customer, dim_date, summary and cohort tables),
+    then index and publish the staging tables"""
+    customer_totals = customer_analytics.score_customers(customer_totals)
+    dim_customer_data = build_dim_customer(customer_totals, customers_df)
+    # Keys were assigned to the source customers only: orders of unknown customers point to the unknown member
+    dim_customer_data = dim_customer_data[dim_customer_data['customer_id'].isin(customers_df['customer_id'])]
+    load_dim_customer(dim_customer_data, customer_index)
+    
+    bulk_load(build_dim_date(order_dates), 'dim_date' + STAGING_SUFFIX, db.dw_engine())
+    print(" Loaded dim_date table")
+    
+    if aggregates:
+        load_aggregates(db.dw_engine(), aggregates, STAGING_SUFFIX)
+    print(" Loaded aggregate tables")
+    
+    customer_analytics.load_cohorts(db.dw_engine(), activity, dim_customer_data[['customer_id', 'cohort_month']],
+                                    STAGING_SUFFIX)
+    print(" Loaded cohort tables")
+    warehouse_schema.finish_bulk_load(db.dw_engine())
+    publish_staging()
+
+def run_streaming_etl(chunk_size=CHUNK_SIZE, lean=False):
+    """Run extract/transform/load chunk by chunk so peak memory does not grow with the source tables"""
+    try:
+        watermarks = read_source_watermarks()
+        customers_df, products_df = extract_dimension_sources(chunk_size)
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return False
+    
+    if not create_data_warehouse_tables():
+        print(" ETL Pipeline failed at Data Warehouse creation")
+        return False
+    
+    try:
+        # Facts are loaded before dim_customer, so surrogate keys are pre-assigned from the sources
+        customer_index, product_index = assign_dimension_versions(customer_version_rows(customers_df), products_df)
+        load_dim_product(products_df, product_index)
+        
+        # Only per-customer metrics and activity and the first/last order date are carried across chunks
+        customer_totals = None
+        activity = None
+        order_dates = []
+        aggregates = {}
+        chunk_count = 0
+        fact_rows = 0
+        
+        transform = transform_data_lean if lean else transform_data
+        for orders_chunk, order_items_chunk in extract_data_chunked(chunk_size):
+            # Each chunk holds whole orders with all their items, so every rule can run per chunk
+            sources = data_quality.validate_sources((customers_df, products_df, orders_chunk, order_items_chunk),
+                                                    label=f"chunk {chunk_count + 1}")
+            if sources is None:
+                print(" ETL Pipeline failed at VALIDATE stage")
+                return False
+            orders_chunk, order_items_chunk = sources[2:]
+            sales_detail_df, chunk_totals = transform(customers_df, products_df, orders_chunk, order_items_chunk)
+            if sales_detail_df is None:
+                print(" ETL Pipeline failed at TRANSFORM stage")
+                return False
+            
+            fact_sales_data = build_fact_sales(sales_detail_df, customer_index, product_index)
+            warehouse_schema.ensure_partitions(db.dw_engine(),
+                                               warehouse_schema.month_keys_of(fact_sales_data['date_key']),
+                                               'fact_sales' + STAGING_SUFFIX)
+            bulk_load(fact_sales_data, 'fact_sales' + STAGING_SUFFIX, db.dw_engine())
+            
+            customer_totals = customer_analytics.combine_customer_metrics(
+                customer_totals, chunk_totals[['customer_id', 'total_amount'] + customer_analytics.METRIC_COLUMNS])
+            activity = customer_analytics.combine_activity(activity, customer_analytics.customer_activity(sales_detail_df))
+            if not sales_detail_df.empty:
+                order_dates = list(calendar_range(order_dates + list(calendar_range(sales_detail_df['order_date']))))
+            aggregates = combine_aggregates(aggregates,
+                                            aggregate_fact_rows(fact_sales_data, customer_index, product_index))
+            chunk_count += 1
+            fact_rows += len(fact_sales_data)
+            print(f" Loaded chunk {chunk_count}: {len(fact_sales_data)} fact rows ({fact_rows} total)")
+        
+        load_accumulated_tables(customer_totals, customers_df, customer_index, order_dates, aggregates, activity)
+        print(" DATA WAREHOUSE LOADING COMPLETED!")
+        
+    except Exception as e:
+        print(f" LOADING FAILED: {e}")
+        return False
+    
+    return store_watermarks(watermarks)
+
+def transform_partition(task):
+    """TRANSFORM one spilled order_id partition (runs in a pool process)
+    
+    The fact rows go back to a spill file; only small partial results (customer metrics, activity,
+    aggregate cells, the calendar range) are returned to the loading process.
+    """
+    directory, lean, customer_index, product_index = task
+    customers_df, products_df = out_of_core.read_broadcast(os.path.dirname(directory), ['customers', 'products'])
+    orders_df = out_of_core.read_partition(directory, 'orders')
+    order_items_df = out_of_core.read_partition(directory, 'order_items')
+    
+    transform = transform_data_lean if lean else transform_data
+    sales_detail_df, partition_totals = transform(customers_df, products_df, orders_df, order_items_df)
+    if sales_detail_df is None:
+        raise RuntimeError(f"transform of {directory} failed")
+    
+    fact_sales_data = build_fact_sales(sales_detail_df, customer_index, product_index)
+    facts_path = os.path.join(directory, 'fact_sales.arrow')
+    out_of_core.write_frame(fact_sales_data, facts_path)
+    return {
+        'facts_path': facts_path,
+        'fact_rows': len(fact_sales_data),
+        'month_keys': warehouse_schema.month_keys_of(fact_sales_data['date_key']),
+        'customer_totals': partition_totals[['customer_id', 'total_amount'] + customer_analytics.METRIC_COLUMNS],
+        'activity': customer_analytics.customer_activity(sales_detail_df),
+        'aggregates': aggregate_fact_rows(fact_sales_data, customer_index, product_index),
+        'order_dates': [] if sales_detail_df.empty else list(calendar_range(sales_detail_df['order_date'])),
+    }
+
+def run_out_of_core_etl(chunk_size=CHUNK_SIZE, lean=False, partitions=None, processes=None):
+    """Full load for sources larger than RAM: spill orders and items to disk by order_id hash, transform the
+    partitions on a process pool and load each partition's facts as soon as it is done"""
+    try:
+        watermarks = read_source_watermarks()
+        customers_df, products_df = extract_dimension_sources(chunk_size)
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return False
+    
+    if not create_data_warehouse_tables():
+        print(" ETL Pipeline failed at Data Warehouse creation")
+        return False
+    
+    partitions = partitions or out_of_core.PARTITIONS
+    spill_dir = out_of_core.run_spill_dir()
+    try:
+        # Chunks hold whole orders with their items, and both tables are split on order_id,
+        # so every partition joins on its own; only customers and products are shared (broadcast)
+        with stage('spill') as metrics:
+            for chunk_number, (orders_chunk, order_items_chunk) in enumerate(extract_data_chunked(chunk_size), 1):
+                sources = data_quality.validate_sources((customers_df, products_df, orders_chunk, order_items_chunk),
+                                                        label=f"chunk {chunk_number}")
+                if sources is None:
+                    metrics.failed = True
+                    print(" ETL Pipeline failed at VALIDATE stage")
+                    return False
+                orders_chunk, order_items_chunk = sources[2:]
+                if lean:
+                    orders_chunk = compact_columns(orders_chunk, LEAN_COLUMNS['orders'] + ['total_amount'])
+                    order_items_chunk = compact_columns(order_items_chunk, LEAN_COLUMNS['order_items'])
+                out_of_core.spill(orders_chunk, 'orders', 'order_id', spill_dir, partitions, chunk_number)
+                out_of_core.spill(order_items_chunk, 'order_items', 'order_id', spill_dir, partitions, chunk_number)
+                metrics.record(orders_chunk, order_items_chunk)
+            out_of_core.write_broadcast(spill_dir, {'customers': customers_df, 'products': products_df})
+        print(f" Spilled {metrics.rows} source rows into {partitions} partitions in {spill_dir}")
+        
+        customer_index, product_index = assign_dimension_versions(customer_version_rows(customers_df), products_df)
+        load_dim_product(products_df, product_index)
+        
+        customer_totals = None
+        activity = None
+        order_dates = []
+        aggregates = {}
+        fact_rows = 0
+        tasks = [(directory, lean, customer_index, product_index)
+                 for directory in out_of_core.spilled_partitions(spill_dir)]
+        start_time = time.perf_counter()
+        for number, result in enumerate(out_of_core.map_partitions(transform_partition, tasks, processes), 1):
+            fact_sales_data = out_of_core.read_frame(result['facts_path'])
+            warehouse_schema.ensure_partitions(db.dw_engine(), result['month_keys'], 'fact_sales' + STAGING_SUFFIX)
+            bulk_load(fact_sales_data, 'fact_sales' + STAGING_SUFFIX, db.dw_engine())
+            os.remove(result['facts_path'])
+            
+            customer_totals = customer_analytics.combine_customer_metrics(customer_totals, result['customer_totals'])
+            activity = customer_analytics.combine_activity(activity, result['activity'])
+            if result['order_dates']:
+                order_dates = list(calendar_range(order_dates + result['order_dates']))
+            aggregates = combine_aggregates(aggregates, result['aggregates'])
+            fact_rows += result['fact_rows']
+            print(f" Loaded partition {number} of {len(tasks)}: {result['fact_rows']} fact rows ({fact_rows} total)")
+        seconds = time.perf_counter() - start_time
+        print(f" Transformed and loaded {fact_rows} fact rows in {seconds:.2f}s "
+              f"({fact_rows / seconds if seconds > 0 else 0:,.0f} rows/sec)")
+        
+        load_accumulated_tables(customer_totals, customers_df, customer_index, order_dates, aggregates, activity)
+        print(" DATA WAREHOUSE LOADING COMPLETED!")
+        
+    except Exception as e:
+        print(f" LOADING FAILED: {e}")
+        return False
+    finally:
+        out_of_core.remove_spill(spill_dir)
+    
+    return store_watermarks(watermarks)
+
+def main(chunk_size=None, mode='full', extract_workers=None, lean=False, checkpoints=CHECKPOINTS,
+         engine=TRANSFORM_ENGINE, months=None, load_workers=None, out_of_core_partitions=None, processes=None):
+    """MAIN function: Orchestrates the complete ETL process ('full' rebuild, 'incremental' upsert or 'reload-months')"""
+    print(" STARTING COMPLETE ETL PIPELINE...")
+    print("=" * 50)
+    
+    if engine == 'sql' and mode == 'full' and data_quality.QUALITY_ACTION == 'quarantine':
+        # The SQL engine never extracts the orders, so there is nothing to drop them from
+        print(" --quality quarantine needs the extracted orders: use --transform-engine pandas")
+        return
+    
+    if mode == 'reload-months':
+        # PARTITION MODE: rebuild whole months of facts from the source
+        if not months:
+            print(" --mode reload-months needs --months YYYYMM [YYYYMM ...]")
+            return
+        with stage('reload_months') as metrics:
+            metrics.failed = not run_month_reload(months, lean)
+        if metrics.failed:
+            print(" ETL Pipeline failed reloading months")
+            return
+        kpi_service.invalidate_cache(mode)
+        print_warehouse_summary()
+        return
+    
+    if mode == 'incremental':
+        # INCREMENTAL MODE: upsert only the rows changed since the last load
+        with stage('incremental_etl') as metrics:
+            metrics.failed = not run_incremental_etl(lean)
+        if metrics.failed:
+            print(" ETL Pipeline failed in incremental mode")
+            return
+        kpi_service.invalidate_cache(mode)
+        print_warehouse_summary()
+        return
+    
+    if out_of_core_partitions:
+        # OUT-OF-CORE MODE: hash-partition the fact sources to disk and transform the partitions on a process pool
+        with stage('out_of_core_etl') as metrics:
+            metrics.failed = not run_out_of_core_etl(chunk_size or CHUNK_SIZE, lean, out_of_core_partitions, processes)
+        if metrics.failed:
+            print(" ETL Pipeline failed in out-of-core mode")
+            return
+        kpi_service.invalidate_cache('out-of-core')
+        print_warehouse_summary()
+        return
+    
+    if chunk_size:
+        # STREAMING MODE: extract, transform and load in fixed-size chunks
+        with stage('streaming_etl') as metrics:
+            metrics.failed = not run_streaming_etl(chunk_size, lean)
+        if metrics.failed:
+            print(" ETL Pipeline failed in streaming mode")
+            return
+        kpi_service.invalidate_cache('streaming')
+        print_warehouse_summary()
+        return
+    
+    # Snapshot the source high-water marks so a later incremental run starts from this load
+    # and fingerprint it, so a rerun after a failed load reuses the checkpointed frames
+    try:
+        watermarks = read_source_watermarks()
+        keys = checkpoint_keys(lean, engine) if checkpoints else None
+    except Exception as e:
+        print(f" EXTRACTION FAILED: {e}")
+        return
+    
+    # STEP 1: EXTRACT
+    with stage('extract') as metrics:
+        customers_df, products_df, orders_df, order_items_df = extract_sources(lean, extract_workers, keys, engine)
+        metrics.failed = customers_df is None
+        metrics.record(customers_df, products_df, orders_df, order_items_df)
+    if customers_df is None:
+        print(" ETL Pipeline failed at EXTRACT stage")
+        return
+    
+    # Checks run on the frames already in memory: no second pass over the source
+    sources = validate_stage((customers_df, products_df, orders_df, order_items_df))
+    if sources is None:
+        return
+    customers_df, products_df, orders_df, order_items_df = sources
+    
+    # STEP 2: TRANSFORM  
+    with stage('transform') as metrics:
+        sales_detail_df, customer_totals = transform_sources(
+            (customers_df, products_df, orders_df, order_items_df), lean, keys, engine)
+        metrics.failed = sales_detail_df is None
+        metrics.record(sales_detail_df)
+    if sales_detail_df is None:
+        print(" ETL Pipeline failed at TRANSFORM stage")
+        return
+    if lean:
+        # The lean frame carries everything the load needs, so the big source frames can go
+        del orders_df, order_items_df
+    
+    # STEP 3: CREATE DATA WAREHOUSE
+    with stage('create_tables') as metrics:
+        metrics.failed = not create_data_warehouse_tables()
+    if metrics.failed:
+        print(" ETL Pipeline failed at Data Warehouse creation")
+        return
+    
+    # STEP 4: LOAD (each table load is recorded as its own load_table stage)
+    with stage('load') as metrics:
+        metrics.failed = not load_data_to_warehouse(sales_detail_df, customer_totals, products_df,
+                                                    customers_df if lean else None, load_workers)
+        metrics.record(sales_detail_df)
+    if metrics.failed:
+        print(" ETL Pipeline failed at LOAD stage")
+        return
+    
+    with stage('watermarks') as metrics:
+        metrics.failed = not store_watermarks(watermarks)
+    if metrics.failed:
+        print(" ETL Pipeline failed at LOAD stage")
+        return
+    
+    # Cached KPI results (kpi_service.py) describe the previous load
+    kpi_service.invalidate_cache(mode)
+    print_warehouse_summary()
+
+def print_warehouse_summary():
+    """Print row counts of the loaded Data Warehouse"""
+    print("=" * 50)
+    print(" ETL PIPELINE COMPLETED SUCCESSFULLY!")
+    print(" Your Data Warehouse is ready for analytics!")
+    
+    # Show summary
+    with db.dw_engine().connect() as conn:
+        dim_customer_count = pd.read_sql("SELECT COUNT(*) as count FROM dim_customer WHERE is_current = 1",
+                                         conn).iloc[0]['count']
+        fact_sales_count = pd.read_sql("SELECT COUNT(*) as count FROM fact_sales", conn).iloc[0]['count']
+        
+    print(f" Data Warehouse Summary:")
+    print(f"   • dim_customer: {dim_customer_count} customers")
+    print(f"   • fact_sales: {fact_sales_count} sales records")
+    print(f"   • Ready for Power BI dashboards!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="E-commerce ETL pipeline")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help=f"stream the source tables in chunks of this many rows (e.g. {CHUNK_SIZE})")
+    parser.add_argument('--mode', choices=['full', 'incremental', 'reload-months'], default='full',
+                        help="'full' drops and rebuilds the warehouse; 'incremental' upserts rows changed since the last load; "
+                             "'reload-months' replaces the fact_sales partitions of --months")
+    parser.add_argument('--months', type=int, nargs='+', default=None,
+                        help="YYYYMM months to re-extract with --mode reload-months (e.g. 202401 202402)")
+    parser.add_argument('--out-of-core', type=int, nargs='?', const=out_of_core.PARTITIONS, default=None,
+                        metavar='PARTITIONS',
+                        help=f"spill orders and items to disk in this many order_id hash partitions "
+                             f"(default: {out_of_core.PARTITIONS}) and transform them on a process pool")
+    parser.add_argument('--transform-processes', type=int, default=None,
+                        help=f"processes transforming partitions with --out-of-core (default: {out_of_core.PROCESSES})")
+    parser.add_argument('--spill-dir', default=None,
+                        help=f"directory for the --out-of-core spill files (default: {out_of_core.SPILL_DIR})")
+    parser.add_argument('--extract-workers', type=int, default=None,
+                        help=f"run the per-table/per-key-range extract queries on this many threads (max {db.max_connections()})")
+    parser.add_argument('--load-workers', type=int, default=None,
+                        help=f"load the dimensions and fact_sales slices on this many connections at once "
+                             f"(default: {LOAD_WORKERS}; max {db.max_connections()})")
+    parser.add_argument('--load-strategy', choices=list(bulk_loader.LOADERS), default=None,
+                        help=f"bulk load strategy (default: {bulk_loader.LOAD_STRATEGY})")
+    parser.add_argument('--load-batch-size', type=int, default=None,
+                        help=f"rows per insert batch / LOAD DATA file (default: {bulk_loader.LOAD_BATCH_SIZE})")
+    parser.add_argument('--lean', action='store_true',
+                        help="lean transform: prune columns, compact dtypes and integer-cent money to cut peak memory")
+    parser.add_argument('--transform-engine', choices=transform_engine.TRANSFORM_ENGINES, default=TRANSFORM_ENGINE,
+                        help="pandas: merge the extracted tables; sql: push the joins and totals down to the source")
+    parser.add_argument('--validate-transform', action='store_true',
+                        help="only check that the pandas and sql transform engines produce identical output")
+    parser.add_argument('--no-checkpoint', action='store_true',
+                        help=f"always extract and transform from the source (checkpoints: {checkpoint.CHECKPOINT_DIR})")
+    parser.add_argument('--quality', choices=data_quality.QUALITY_ACTIONS, default=None,
+                        help=f"on data-quality violations: warn, quarantine the orders, or fail "
+                             f"(default: {data_quality.QUALITY_ACTION}; report: {data_quality.REPORT_FILE})")
+    db.add_arguments(parser)
+    parser.add_argument('--metrics-file', default=None,
+                        help=f"JSON lines file for per-stage metrics ('' disables; default: {instrumentation.METRICS_FILE})")
+    parser.add_argument('--prometheus-file', default=None,
+                        help=f"Prometheus textfile for per-stage metrics ('' disables; default: {instrumentation.PROMETHEUS_FILE})")
+    parser.add_argument('--profile-dir', default=None,
+                        help="write a cProfile .pstats dump of every stage to this directory")
+    args = parser.parse_args()
+    # Options a mode would silently ignore are rejected instead
+    if args.transform_engine == 'sql':
+        if args.mode != 'full':
+            parser.error(f"--transform-engine sql only runs full loads, not --mode {args.mode}")
+        if args.chunk_size or args.out_of_core:
+            parser.error("--transform-engine sql can't be combined with --chunk-size or --out-of-core")
+        # The SQL engine never extracts the orders, so there is nothing to drop them from
+        if (args.quality or data_quality.QUALITY_ACTION) == 'quarantine':
+            parser.error("--quality quarantine needs the extracted orders: use --transform-engine pandas")
+    if args.mode != 'full' and (args.chunk_size or args.out_of_core):
+        parser.error(f"--chunk-size and --out-of-core only apply to full loads, not --mode {args.mode}")
+    if args.months and args.mode != 'reload-months':
+        parser.error("--months needs --mode reload-months")
+    if args.mode == 'reload-months' and not args.months:
+        parser.error("--mode reload-months needs --months YYYYMM [YYYYMM ...]")
+    db.configure_from_args(args)
+    bulk_loader.configure(args.load_strategy, args.load_batch_size)
+    instrumentation.configure(args.metrics_file, args.prometheus_file, args.profile_dir)
+    data_quality.configure(args.quality)
+    out_of_core.configure(args.spill_dir)
+    if args.validate_transform:
+        sys.exit(0 if validate_transform_engines(args.lean) else 1)
+    main(chunk_size=args.chunk_size, mode=args.mode, extract_workers=args.extract_workers, lean=args.lean,
+         checkpoints=not args.no_checkpoint, engine=args.transform_engine, months=args.months,
+         load_workers=args.load_workers, out_of_core_partitions=args.out_of_core,
+         processes=args.transform_processes)
\ No newline at end of file
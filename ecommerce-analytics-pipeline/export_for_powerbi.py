@@ -1,48 +1,222 @@
-# export_for_powerbi.py - EXPORT DATA FOR POWER BI
-import pandas as pd
-from sqlalchemy import create_engine
-
-# Database connection
-dw_engine = create_engine('mysql+pymysql://root:@localhost/ecommerce_dw')
-
-def export_data_for_powerbi():
-    print(" Exporting data for Power BI...")
-    
-    try:
-        # Export dim_customer
-        dim_customer = pd.read_sql("SELECT * FROM dim_customer", dw_engine)
-        dim_customer.to_csv('dim_customer.csv', index=False)
-        print(" Exported dim_customer.csv")
-        
-        # Export dim_product
-        dim_product = pd.read_sql("SELECT * FROM dim_product", dw_engine)
-        dim_product.to_csv('dim_product.csv', index=False)
-        print(" Exported dim_product.csv")
-        
-        # Export dim_date
-        dim_date = pd.read_sql("SELECT * FROM dim_date", dw_engine)
-        dim_date.to_csv('dim_date.csv', index=False)
-        print(" Exported dim_date.csv")
-        
-        # Export fact_sales
-        fact_sales = pd.read_sql("SELECT * FROM fact_sales", dw_engine)
-        fact_sales.to_csv('fact_sales.csv', index=False)
-        print(" Exported fact_sales.csv")
-        
-        print("\n ALL FILES EXPORTED!")
-        print(" Files created in your current directory:")
-        print("   - dim_customer.csv")
-        print("   - dim_product.csv") 
-        print("   - dim_date.csv")
-        print("   - fact_sales.csv")
-        print("\n Now import these CSV files into Power BI!")
-        
-    except Exception as e:
-        print(f" Export failed: {e}")
-
-if __name__ == "__main__":
-    choice = input("Export CSV files for Power BI? (y/n): ")
-    if choice.lower() == 'y':
-        export_data_for_powerbi()
-    else:
-        print(" Power BI can connect directly to MySQL database!")
\ No newline at end of file
+# export_for_powerbi.py - EXPORT DATA FOR POWER BI
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import inspect, text
+import db
+
+# COLUMNAR EXPORT SETTINGS
+EXPORT_DIR = 'powerbi_export'
+MANIFEST_FILE = 'manifest.json'
+ARROW_SUBDIR = 'arrow'  # Arrow IPC copies live in their own tree so Parquet folders stay Parquet-only
+PARQUET_COMPRESSION = 'snappy'  # read natively by Power BI's Parquet connector
+ARROW_COMPRESSION = 'lz4'
+DIMENSION_TABLES = ['dim_customer', 'dim_product', 'dim_date']
+CSV_TABLES = DIMENSION_TABLES + ['fact_sales']
+FINGERPRINT_EXCLUDED_COLUMNS = ['created_at']  # load time, not content: reloads would rewrite everything
+
+# Warehouse column types for the columnar files (anything not listed keeps the type pandas read)
+EXPORT_DTYPES = {
+    'customer_key': 'int32', 'customer_id': 'int32', 'product_key': 'int32', 'product_id': 'int32',
+    'sales_key': 'int64', 'date_key': 'int32', 'order_id': 'int32', 'quantity': 'int32',
+    'day': 'int8', 'month': 'int8', 'quarter': 'int8', 'week': 'int8', 'year': 'int16',
+    'fiscal_year': 'int16', 'fiscal_quarter': 'int8', 'fiscal_month': 'int8',
+    'is_weekend': 'bool', 'is_holiday': 'bool', 'is_current': 'bool', 'row_hash': 'Int64',
+    'city': 'category', 'customer_segment': 'category', 'category': 'category', 'day_name': 'category',
+    'order_status': 'category', 'rfm_segment': 'category',
+    # Analytics columns are NULL on the unknown member row, so they use nullable integer types
+    'order_count': 'Int32', 'recency_days': 'Int32', 'cohort_month': 'Int32',
+    'r_score': 'Int8', 'f_score': 'Int8', 'm_score': 'Int8', 'clv': 'float64',
+    'total_spent': 'float64', 'price': 'float64', 'amount': 'float64', 'profit': 'float64', 'line_total': 'float64',
+    'full_date': 'datetime64[ns]', 'created_at': 'datetime64[ns]',
+    'valid_from': 'datetime64[ns]', 'valid_to': 'datetime64[ns]',
+    'first_order_date': 'datetime64[ns]', 'last_order_date': 'datetime64[ns]',
+}
+
+def export_data_for_powerbi():
+    print(" Exporting data for Power BI...")
+    
+    try:
+        # Export dim_customer
+        dim_customer = pd.read_sql("SELECT * FROM dim_customer", db.dw_engine())
+        dim_customer.to_csv('dim_customer.csv', index=False)
+        print(" Exported dim_customer.csv")
+        
+        # Export dim_product
+        dim_product = pd.read_sql("SELECT * FROM dim_product", db.dw_engine())
+        dim_product.to_csv('dim_product.csv', index=False)
+        print(" Exported dim_product.csv")
+        
+        # Export dim_date
+        dim_date = pd.read_sql("SELECT * FROM dim_date", db.dw_engine())
+        dim_date.to_csv('dim_date.csv', index=False)
+        print(" Exported dim_date.csv")
+        
+        # Export fact_sales
+        fact_sales = pd.read_sql("SELECT * FROM fact_sales", db.dw_engine())
+        fact_sales.to_csv('fact_sales.csv', index=False)
+        print(" Exported fact_sales.csv")
+        
+        print("\n ALL FILES EXPORTED!")
+        print(" Files created in your current directory:")
+        print("   - dim_customer.csv")
+        print("   - dim_product.csv") 
+        print("   - dim_date.csv")
+        print("   - fact_sales.csv")
+        print("\n Now import these CSV files into Power BI!")
+        
+    except Exception as e:
+        print(f" Export failed: {e}")
+
+def export_table_csv(table, output_dir='.'):
+    """Export one warehouse table as <table>.csv without prompting (run_pipeline.py exports tables in parallel)"""
+    df = pd.read_sql(f"SELECT * FROM {table}", db.dw_engine())
+    df.to_csv(os.path.join(output_dir, f"{table}.csv"), index=False)
+    print(f" Exported {table}.csv")
+    return len(df)
+
+def apply_export_dtypes(df):
+    """Cast warehouse columns to compact, correctly typed columns for Parquet/Arrow"""
+    dtypes = {column: EXPORT_DTYPES[column] for column in df.columns if column in EXPORT_DTYPES}
+    for column, dtype in dtypes.items():
+        if dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column])
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def load_manifest(output_dir):
+    """Read what previous exports already wrote"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'tables': {}, 'fact_partitions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically so an interrupted export never leaves it half-written"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def write_columnar(df, output_dir, relative_path, arrow):
+    """Write df as compressed Parquet (and optionally Arrow IPC), returning the file names relative to output_dir"""
+    files = [relative_path + '.parquet']
+    if arrow:
+        files.append(os.path.join(ARROW_SUBDIR, relative_path + '.arrow'))
+    for file_name in files:
+        path = os.path.join(output_dir, file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if file_name.endswith('.parquet'):
+            df.to_parquet(path, index=False, compression=PARQUET_COMPRESSION)
+        else:
+            df.reset_index(drop=True).to_feather(path, compression=ARROW_COMPRESSION)
+    return files
+
+def remove_partition(output_dir, partition_dir):
+    """Delete a fact partition's Parquet and Arrow files"""
+    shutil.rmtree(os.path.join(output_dir, partition_dir), ignore_errors=True)
+    shutil.rmtree(os.path.join(output_dir, ARROW_SUBDIR, partition_dir), ignore_errors=True)
+
+def fact_partition_fingerprints():
+    """Row count and a checksum of every exported column of each year/month partition of fact_sales,
+    computed in the warehouse"""
+    with db.dw_engine().connect() as conn:
+        columns = [column['name'] for column in inspect(conn).get_columns('fact_sales')
+                   if column['name'] not in FINGERPRINT_EXCLUDED_COLUMNS]
+        # One CRC32 per row over all its columns, summed: any changed key, measure or status changes the sum
+        fingerprints = pd.read_sql(f"""
+            SELECT (date_key - date_key % 100) / 100 AS period,
+                   COUNT(*) AS row_count,
+                   SUM(CRC32(CONCAT_WS('|', {', '.join(columns)}))) AS row_checksum
+            FROM fact_sales
+            GROUP BY (date_key - date_key % 100) / 100
+        """, conn)
+    return {
+        f"{int(row.period) // 100:04d}-{int(row.period) % 100:02d}": f"{int(row.row_count)}:{int(row.row_checksum)}"
+        for row in fingerprints.itertuples()
+    }
+
+def export_columnar_for_powerbi(output_dir=EXPORT_DIR, arrow=False):
+    """Export the warehouse as compressed Parquet (and Arrow), fact_sales partitioned by year/month of date_key"""
+    print(f" Exporting columnar data for Power BI to {output_dir}/ ...")
+    
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = load_manifest(output_dir)
+        exported_at = datetime.now().isoformat(timespec='seconds')
+        
+        # Dimensions are small: read them, but only rewrite the files when their content changed
+        for table in DIMENSION_TABLES:
+            df = apply_export_dtypes(pd.read_sql(f"SELECT * FROM {table}", db.dw_engine()))
+            content = df.drop(columns=FINGERPRINT_EXCLUDED_COLUMNS, errors='ignore')
+            fingerprint = f"{len(df)}:{int(pd.util.hash_pandas_object(content, index=False).sum())}"
+            previous = manifest['tables'].get(table, {})
+            if previous.get('fingerprint') == fingerprint and previous.get('arrow') == arrow:
+                print(f" {table}: unchanged")
+                continue
+            files = write_columnar(df, output_dir, os.path.join(table, table), arrow)
+            manifest['tables'][table] = {'fingerprint': fingerprint, 'rows': len(df), 'arrow': arrow,
+                                         'files': files, 'exported_at': exported_at}
+            print(f" Exported {table} ({len(df)} rows)")
+        
+        # Facts: only new or changed year/month partitions are (re)written
+        fingerprints = fact_partition_fingerprints()
+        exported_partitions = manifest['fact_partitions']
+        written = 0
+        for period, fingerprint in sorted(fingerprints.items()):
+            previous = exported_partitions.get(period, {})
+            if previous.get('fingerprint') == fingerprint and previous.get('arrow') == arrow:
+                continue
+            year, month = (int(part) for part in period.split('-'))
+            df = pd.read_sql(text("SELECT * FROM fact_sales WHERE date_key BETWEEN :first_key AND :last_key"),
+                             db.dw_engine(), params={'first_key': year * 10000 + month * 100,
+                                                'last_key': year * 10000 + month * 100 + 99})
+            partition_dir = os.path.join('fact_sales', f"year={year:04d}", f"month={month:02d}")
+            remove_partition(output_dir, partition_dir)
+            files = write_columnar(apply_export_dtypes(df), output_dir, os.path.join(partition_dir, 'part-0'), arrow)
+            exported_partitions[period] = {'fingerprint': fingerprint, 'rows': len(df), 'arrow': arrow,
+                                           'files': files, 'exported_at': exported_at}
+            written += 1
+            print(f" Exported fact_sales {period} ({len(df)} rows)")
+        
+        # Partitions that no longer exist in the warehouse
+        for period in sorted(set(exported_partitions) - set(fingerprints)):
+            year, month = period.split('-')
+            remove_partition(output_dir, os.path.join('fact_sales', f"year={year}", f"month={month}"))
+            del exported_partitions[period]
+            print(f" Removed fact_sales {period}")
+        
+        save_manifest(output_dir, manifest)
+        print(f"\n COLUMNAR EXPORT COMPLETED: {written} of {len(fingerprints)} fact_sales partitions written")
+        print(f" Point Power BI's Parquet connector at the {output_dir} folder!")
+        return True
+    
+    except Exception as e:
+        print(f" Export failed: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Data Warehouse for Power BI")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default=None,
+                        help="csv: full CSV dump; parquet: incremental, partitioned columnar export")
+    parser.add_argument('--arrow', action='store_true', help="also write Arrow IPC files next to the Parquet files")
+    parser.add_argument('--output-dir', default=EXPORT_DIR, help="directory for the columnar export")
+    db.add_arguments(parser)
+    args = parser.parse_args()
+    db.configure_from_args(args)
+    
+    if args.format == 'parquet':
+        export_columnar_for_powerbi(args.output_dir, args.arrow)
+    elif args.format == 'csv':
+        export_data_for_powerbi()
+    else:
+        choice = input("Export CSV files for Power BI? (y/n): ")
+        if choice.lower() == 'y':
+            export_data_for_powerbi()
+        else:
+            print(" Power BI can connect directly to MySQL database!")
\ No newline at end of file
@@ -1,244 +1,442 @@
-# generate_data.py - DEBUG VERSION
-import pandas as pd
-import random
-from faker import Faker
-from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
-import numpy as np
-import sys
-
-print(" DEBUG: Starting generate_data.py...")
-
-# Initialize faker
-fake = Faker()
-
-try:
-    # Database connection - TEST FIRST
-    print(" Testing database connection...")
-    engine = create_engine('mysql+pymysql://root:@localhost/ecommerce_source')
-    
-    # Test connection
-    with engine.connect() as conn:
-        conn.execute(text("SELECT 1"))
-    print(" Database connection successful!")
-    
-except Exception as e:
-    print(f" DATABASE CONNECTION FAILED: {e}")
-    print(" TROUBLESHOOTING:")
-    print("   1. Is MySQL running?")
-    print("   2. Is the database 'ecommerce_source' created?")
-    print("   3. Check username/password in connection string")
-    sys.exit(1)
-
-def clear_existing_data():
-    """Clear existing data to avoid foreign key conflicts"""
-    try:
-        with engine.connect() as conn:
-            # Disable foreign key checks
-            conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
-            
-            # Clear tables in correct order
-            tables = ['order_items', 'orders', 'products', 'customers']
-            for table in tables:
-                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
-                print(f" Dropped table {table}")
-            
-            # Re-enable foreign key checks
-            conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
-            
-        print(" Cleared existing data")
-        return True
-    except Exception as e:
-        print(f" Error clearing data: {e}")
-        return False
-
-def create_tables():
-    """Recreate the database tables"""
-    try:
-        with engine.connect() as conn:
-            # Create customers table
-            conn.execute(text("""
-                CREATE TABLE customers (
-                    customer_id INT PRIMARY KEY,
-                    first_name VARCHAR(50),
-                    last_name VARCHAR(50),
-                    email VARCHAR(100),
-                    city VARCHAR(50),
-                    registration_date DATE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            print(" Created customers table")
-            
-            # Create products table
-            conn.execute(text("""
-                CREATE TABLE products (
-                    product_id INT PRIMARY KEY,
-                    product_name VARCHAR(100),
-                    category VARCHAR(50),
-                    price DECIMAL(10,2),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """))
-            print(" Created products table")
-            
-            # Create orders table
-            conn.execute(text("""
-                CREATE TABLE orders (
-                    order_id INT PRIMARY KEY,
-                    customer_id INT,
-                    order_date DATE,
-                    total_amount DECIMAL(10,2),
-                    status VARCHAR(20),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
-                )
-            """))
-            print(" Created orders table")
-            
-            # Create order_items table
-            conn.execute(text("""
-                CREATE TABLE order_items (
-                    item_id INT PRIMARY KEY,
-                    order_id INT,
-                    product_id INT,
-                    quantity INT,
-                    unit_price DECIMAL(10,2),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (order_id) REFERENCES orders(order_id),
-                    FOREIGN KEY (product_id) REFERENCES products(product_id)
-                )
-            """))
-            print(" Created order_items table")
-            
-        print(" Database tables created successfully")
-        return True
-    except Exception as e:
-        print(f" Error creating tables: {e}")
-        return False
-
-def generate_customers(num_customers=50):
-    """Generate fake customer data"""
-    customers = []
-    for i in range(1, num_customers + 1):
-        customers.append({
-            'customer_id': i,
-            'first_name': fake.first_name(),
-            'last_name': fake.last_name(),
-            'email': fake.email(),
-            'city': fake.city(),
-            'registration_date': fake.date_between(start_date='-2y', end_date='today')
-        })
-    return pd.DataFrame(customers)
-
-def generate_products(num_products=20):
-    """Generate fake product data"""
-    categories = ['Electronics', 'Clothing', 'Books', 'Home & Kitchen', 'Sports', 'Beauty']
-    products = []
-    for i in range(1, num_products + 1):
-        category = random.choice(categories)
-        base_price = random.uniform(10, 500)
-        products.append({
-            'product_id': i,
-            'product_name': f"{category} Product {i}",
-            'category': category,
-            'price': round(base_price, 2)
-        })
-    return pd.DataFrame(products)
-
-def generate_orders(num_orders=100):
-    """Generate fake order data"""
-    orders = []
-    order_items = []
-    item_id = 1
-    
-    for order_num in range(1, num_orders + 1):
-        customer_id = random.randint(1, 50)
-        order_date = fake.date_between(start_date='-1y', end_date='today')
-        
-        # Create order
-        orders.append({
-            'order_id': order_num,
-            'customer_id': customer_id,
-            'order_date': order_date,
-            'total_amount': 0,  # Will calculate after items
-            'status': random.choice(['completed', 'pending', 'shipped'])
-        })
-        
-        # Create 1-5 items per order
-        num_items = random.randint(1, 5)
-        order_total = 0
-        
-        for _ in range(num_items):
-            product_id = random.randint(1, 20)
-            quantity = random.randint(1, 3)
-            unit_price = round(random.uniform(10, 200), 2)
-            item_total = quantity * unit_price
-            order_total += item_total
-            
-            order_items.append({
-                'item_id': item_id,
-                'order_id': order_num,
-                'product_id': product_id,
-                'quantity': quantity,
-                'unit_price': unit_price
-            })
-            item_id += 1
-        
-        # Update order total
-        orders[-1]['total_amount'] = round(order_total, 2)
-    
-    return pd.DataFrame(orders), pd.DataFrame(order_items)
-
-def load_data_to_tables(customers_df, products_df, orders_df, order_items_df):
-    """Load data to database tables in correct order"""
-    try:
-        # Load in correct order (parents first, then children)
-        customers_df.to_sql('customers', engine, if_exists='append', index=False)
-        print(" Customers loaded")
-        
-        products_df.to_sql('products', engine, if_exists='append', index=False)
-        print(" Products loaded")
-        
-        orders_df.to_sql('orders', engine, if_exists='append', index=False)
-        print(" Orders loaded")
-        
-        order_items_df.to_sql('order_items', engine, if_exists='append', index=False)
-        print(" Order items loaded")
-        
-        return True
-    except Exception as e:
-        print(f" Error loading data: {e}")
-        return False
-
-def main():
-    print(" Starting data generation...")
-    
-    # Step 1: Clear existing data
-    if not clear_existing_data():
-        return
-    
-    # Step 2: Create tables
-    if not create_tables():
-        return
-    
-    # Step 3: Generate data
-    print(" Generating customers...")
-    customers_df = generate_customers(50)
-    
-    print(" Generating products...")
-    products_df = generate_products(20)
-    
-    print(" Generating orders and order items...")
-    orders_df, order_items_df = generate_orders(100)
-    
-    # Step 4: Load to database
-    print(" Loading data to MySQL...")
-    if load_data_to_tables(customers_df, products_df, orders_df, order_items_df):
-        print(" Data generation completed!")
-        print(f" Generated: {len(customers_df)} customers, {len(products_df)} products, {len(orders_df)} orders, {len(order_items_df)} order items")
-    else:
-        print(" Data generation failed!")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+# generate_data.py - DEBUG VERSION
+import argparse
+import pandas as pd
+import random
+from faker import Faker
+from datetime import datetime, timedelta
+from sqlalchemy import text
+import numpy as np
+import sys
+import os
+import time
+from contextlib import nullcontext
+from multiprocessing import Pool
+from bulk_loader import bulk_load
+import db
+
+print(" DEBUG: Starting generate_data.py...")
+
+# Initialize faker
+fake = Faker()
+
+
+def check_database_connection():
+    """Test the source database connection before writing to it"""
+    try:
+        print(" Testing database connection...")
+        with db.source_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+        print(" Database connection successful!")
+        return True
+        
+    except Exception as e:
+        print(f" DATABASE CONNECTION FAILED: {e}")
+        print(" TROUBLESHOOTING:")
+        print("   1. Is MySQL running?")
+        print("   2. Is the database 'ecommerce_source' created?")
+        print("   3. Check ETL_MYSQL_USER / ETL_MYSQL_PASSWORD, or run locally with --db-backend sqlite")
+        return False
+
+def clear_existing_data():
+    """Clear existing data to avoid foreign key conflicts"""
+    try:
+        with db.source_engine().connect() as conn:
+            # Disable foreign key checks (SQLite does not enforce them by default)
+            is_mysql = conn.dialect.name == 'mysql'
+            if is_mysql:
+                conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+            
+            # Clear tables in correct order
+            tables = ['order_items', 'orders', 'products', 'customers']
+            for table in tables:
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+                print(f" Dropped table {table}")
+            
+            # Re-enable foreign key checks
+            if is_mysql:
+                conn.execute(text("SET FOREIGN_KEY_CHECKS = 1"))
+            
+        print(" Cleared existing data")
+        return True
+    except Exception as e:
+        print(f" Error clearing data: {e}")
+        return False
+
+def create_tables():
+    """Recreate the database tables"""
+    try:
+        with db.source_engine().connect() as conn:
+            # Create customers table
+            conn.execute(text("""
+                CREATE TABLE customers (
+                    customer_id INT PRIMARY KEY,
+                    first_name VARCHAR(50),
+                    last_name VARCHAR(50),
+                    email VARCHAR(100),
+                    city VARCHAR(50),
+                    registration_date DATE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            print(" Created customers table")
+            
+            # Create products table
+            conn.execute(text("""
+                CREATE TABLE products (
+                    product_id INT PRIMARY KEY,
+                    product_name VARCHAR(100),
+                    category VARCHAR(50),
+                    price DECIMAL(10,2),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            print(" Created products table")
+            
+            # Create orders table
+            conn.execute(text("""
+                CREATE TABLE orders (
+                    order_id INT PRIMARY KEY,
+                    customer_id INT,
+                    order_date DATE,
+                    total_amount DECIMAL(10,2),
+                    status VARCHAR(20),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
+                )
+            """))
+            print(" Created orders table")
+            
+            # Create order_items table
+            conn.execute(text("""
+                CREATE TABLE order_items (
+                    item_id INT PRIMARY KEY,
+                    order_id INT,
+                    product_id INT,
+                    quantity INT,
+                    unit_price DECIMAL(10,2),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (order_id) REFERENCES orders(order_id),
+                    FOREIGN KEY (product_id) REFERENCES products(product_id)
+                )
+            """))
+            print(" Created order_items table")
+            
+        print(" Database tables created successfully")
+        return True
+    except Exception as e:
+        print(f" Error creating tables: {e}")
+        return False
+
+# GENERATION SETTINGS
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home & Kitchen', 'Sports', 'Beauty']
+ORDER_STATUSES = ['completed', 'pending', 'shipped']
+ORDER_STATUS_WEIGHTS = [0.75, 0.10, 0.15]
+MAX_ITEMS_PER_ORDER = 5
+ORDER_HISTORY_DAYS = 365
+PRODUCT_POPULARITY_SKEW = 1.1  # Zipf exponent: a few best sellers, a long tail
+REGISTRATION_HISTORY_DAYS = 730
+VALUE_POOL_SIZE = 1000  # distinct Faker values drawn once per run
+
+# SHARDED GENERATION SETTINGS
+SHARD_SIZE = 250000  # orders per shard; bounds the memory of one worker
+OUTPUT_FORMATS = ['db', 'csv', 'parquet']
+
+def build_value_pools(pool_size=VALUE_POOL_SIZE):
+    """Draw Faker values once so customers can be sampled from arrays instead of per-row Faker calls"""
+    return {
+        'first_name': np.array([fake.first_name() for _ in range(pool_size)]),
+        'last_name': np.array([fake.last_name() for _ in range(pool_size)]),
+        'city': np.array([fake.city() for _ in range(pool_size)]),
+        'email_domain': np.array([fake.free_email_domain() for _ in range(pool_size)]),
+    }
+
+def generate_customers(num_customers=50, rng=None, pools=None, first_customer_id=1, end_date=None):
+    """Generate fake customer data by sampling the precomputed value pools"""
+    rng = rng if rng is not None else np.random.default_rng()
+    pools = pools if pools is not None else build_value_pools()
+    end_date = pd.Timestamp(end_date or datetime.today()).normalize()
+    customer_ids = np.arange(first_customer_id, first_customer_id + num_customers)
+    
+    def sample(pool):
+        return pd.Series(pools[pool][rng.integers(0, len(pools[pool]), size=num_customers)])
+    
+    first_names = sample('first_name')
+    last_names = sample('last_name')
+    emails = (first_names.str.lower() + '.' + last_names.str.lower()).str.replace(r"[^a-z.]", '', regex=True)
+    emails = emails + pd.Series(customer_ids).astype(str) + '@' + sample('email_domain')
+    
+    return pd.DataFrame({
+        'customer_id': customer_ids,
+        'first_name': first_names,
+        'last_name': last_names,
+        'email': emails,
+        'city': sample('city'),
+        'registration_date': end_date - pd.to_timedelta(
+            rng.integers(0, REGISTRATION_HISTORY_DAYS, size=num_customers), unit='D')
+    })
+
+def generate_products(num_products=20, rng=None):
+    """Generate fake product data"""
+    rng = rng if rng is not None else np.random.default_rng()
+    product_ids = np.arange(1, num_products + 1)
+    categories = rng.choice(CATEGORIES, size=num_products)
+    return pd.DataFrame({
+        'product_id': product_ids,
+        'product_name': pd.Series(categories) + ' Product ' + pd.Series(product_ids).astype(str),
+        'category': categories,
+        'price': rng.uniform(10, 500, size=num_products).round(2)
+    })
+
+def seasonal_day_weights(days):
+    """Relative order volume per day: weekly cycle, summer dip and a November/December peak"""
+    day_of_year = days.dayofyear.values
+    weights = 1.0 + 0.15 * np.cos(2 * np.pi * (day_of_year - 15) / 365.25)
+    weights *= np.where(days.dayofweek.values >= 5, 1.25, 1.0)
+    weights *= np.where(days.month.values == 11, 1.4, 1.0) * np.where(days.month.values == 12, 1.7, 1.0)
+    return weights / weights.sum()
+
+def customer_order_rates(num_customers, rng):
+    """Per-customer order frequency: gamma-distributed, so some customers order far more often"""
+    customer_rate = rng.gamma(shape=0.8, scale=1.0, size=num_customers)
+    return customer_rate / customer_rate.sum()
+
+def generate_orders(num_orders, customer_ids, products_df, rng=None, end_date=None,
+                    first_order_id=1, first_item_id=1, customer_rates=None):
+    """Generate orders and order items as whole NumPy arrays"""
+    rng = rng if rng is not None else np.random.default_rng()
+    end_date = pd.Timestamp(end_date or datetime.today()).normalize()
+    order_ids = np.arange(first_order_id, first_order_id + num_orders)
+    
+    customer_ids = np.asarray(customer_ids)
+    if customer_rates is None:
+        customer_rates = customer_order_rates(len(customer_ids), rng)
+    order_customers = rng.choice(customer_ids, size=num_orders, p=customer_rates)
+    
+    # Seasonal order dates over the last year
+    days = pd.date_range(end=end_date, periods=ORDER_HISTORY_DAYS, freq='D')
+    order_dates = days.values[rng.choice(len(days), size=num_orders, p=seasonal_day_weights(days))]
+    
+    orders_df = pd.DataFrame({
+        'order_id': order_ids,
+        'customer_id': order_customers,
+        'order_date': order_dates,
+        'total_amount': 0.0,  # Will calculate after items
+        'status': rng.choice(ORDER_STATUSES, size=num_orders, p=ORDER_STATUS_WEIGHTS)
+    })
+    
+    # 1-5 items per order, mostly small baskets
+    items_per_order = 1 + rng.binomial(MAX_ITEMS_PER_ORDER - 1, 0.3, size=num_orders)
+    num_items = int(items_per_order.sum())
+    item_order_index = np.repeat(np.arange(num_orders), items_per_order)
+    
+    # Zipf-like product popularity over a random ranking of the catalogue
+    product_ids = products_df['product_id'].to_numpy()
+    product_prices = products_df['price'].to_numpy(dtype=float)
+    popularity = 1.0 / np.arange(1, len(product_ids) + 1) ** PRODUCT_POPULARITY_SKEW
+    popularity = rng.permutation(popularity)
+    item_products = rng.choice(len(product_ids), size=num_items, p=popularity / popularity.sum())
+    
+    quantity = rng.choice([1, 2, 3], size=num_items, p=[0.7, 0.2, 0.1])
+    discount = rng.choice([0.0, 0.05, 0.10, 0.20], size=num_items, p=[0.6, 0.2, 0.15, 0.05])
+    unit_price = (product_prices[item_products] * (1 - discount)).round(2)
+    
+    order_items_df = pd.DataFrame({
+        'item_id': np.arange(first_item_id, first_item_id + num_items),
+        'order_id': order_ids[item_order_index],
+        'product_id': product_ids[item_products],
+        'quantity': quantity,
+        'unit_price': unit_price
+    })
+    
+    # Order totals: sum of line totals per order
+    orders_df['total_amount'] = np.bincount(item_order_index, weights=quantity * unit_price,
+                                            minlength=num_orders).round(2)
+    
+    return orders_df, order_items_df
+
+def load_data_to_tables(customers_df, products_df, orders_df, order_items_df):
+    """Load data to database tables in correct order"""
+    try:
+        # Load in correct order (parents first, then children)
+        bulk_load(customers_df, 'customers', db.source_engine())
+        print(" Customers loaded")
+        
+        bulk_load(products_df, 'products', db.source_engine())
+        print(" Products loaded")
+        
+        bulk_load(orders_df, 'orders', db.source_engine())
+        print(" Orders loaded")
+        
+        bulk_load(order_items_df, 'order_items', db.source_engine())
+        print(" Order items loaded")
+        
+        return True
+    except Exception as e:
+        print(f" Error loading data: {e}")
+        return False
+
+def write_shard_table(df, table, shard, output, output_dir):
+    """Write one shard of a table to its own CSV/Parquet part file or append it to the source database"""
+    if output == 'db':
+        with db.source_engine().begin() as conn:
+            # Shards finish in any order, so children may arrive before their parents
+            if conn.dialect.name == 'mysql':
+                conn.execute(text("SET FOREIGN_KEY_CHECKS = 0"))
+            bulk_load(df, table, conn)
+        return
+    
+    table_dir = os.path.join(output_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+    path = os.path.join(table_dir, f"part-{shard:05d}.{output}")
+    if output == 'csv':
+        df.to_csv(path, index=False)
+    else:
+        df.to_parquet(path, index=False)
+
+def generate_shard(task):
+    """Worker: generate and write the customers, orders and order items of one disjoint id range"""
+    start_time = time.perf_counter()
+    shard = task['shard']
+    
+    # Deterministic per-shard stream: the same seed and shard always produce the same rows
+    rng = np.random.default_rng([task['seed'], shard])
+    # Order frequencies must agree across shards, so they come from the run seed alone
+    customer_rates = customer_order_rates(task['num_customers'], np.random.default_rng(task['seed']))
+    
+    customers_df = generate_customers(task['customer_count'], rng, task['pools'],
+                                      task['first_customer_id'], task['end_date'])
+    write_shard_table(customers_df, 'customers', shard, task['output'], task['output_dir'])
+    del customers_df
+    
+    # Items of order n get ids from ((n - 1) * MAX_ITEMS_PER_ORDER, n * MAX_ITEMS_PER_ORDER],
+    # so shards never collide without knowing each other's item counts
+    first_item_id = (task['first_order_id'] - 1) * MAX_ITEMS_PER_ORDER + 1
+    orders_df, order_items_df = generate_orders(
+        task['order_count'], np.arange(1, task['num_customers'] + 1), task['products_df'], rng,
+        task['end_date'], task['first_order_id'], first_item_id, customer_rates)
+    write_shard_table(orders_df, 'orders', shard, task['output'], task['output_dir'])
+    write_shard_table(order_items_df, 'order_items', shard, task['output'], task['output_dir'])
+    
+    return shard, len(orders_df), len(order_items_df), time.perf_counter() - start_time
+
+def split_range(total, parts):
+    """Split 1..total into `parts` contiguous (first_id, count) ranges"""
+    bounds = np.linspace(0, total, parts + 1).astype(int)
+    return [(int(bounds[i]) + 1, int(bounds[i + 1] - bounds[i])) for i in range(parts)]
+
+def run_sharded_generation(num_customers, num_products, num_orders, seed, end_date,
+                           workers, shard_size, output, output_dir):
+    """Generate the source data in disjoint id-range shards on a process pool, streaming each shard out
+
+    With one worker the shards are generated in this process. Returns the number of order items.
+    """
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+        print(f" Using seed {seed}")
+    end_date = str(pd.Timestamp(end_date or datetime.today()).date())
+    num_shards = max(1, -(-num_orders // shard_size))
+    
+    # Products and the Faker value pools are small and shared by every shard
+    Faker.seed(seed)
+    products_df = generate_products(num_products, np.random.default_rng([seed, num_shards]))
+    pools = build_value_pools()
+    write_shard_table(products_df, 'products', 0, output, output_dir)
+    
+    tasks = []
+    for shard, ((first_customer_id, customer_count), (first_order_id, order_count)) in enumerate(
+            zip(split_range(num_customers, num_shards), split_range(num_orders, num_shards))):
+        tasks.append({
+            'shard': shard, 'seed': seed, 'end_date': end_date,
+            'num_customers': num_customers, 'first_customer_id': first_customer_id, 'customer_count': customer_count,
+            'first_order_id': first_order_id, 'order_count': order_count,
+            'products_df': products_df, 'pools': pools, 'output': output, 'output_dir': output_dir,
+        })
+    
+    print(f" Generating {num_shards} shards on {workers} worker processes...")
+    total_orders = total_items = 0
+    if workers > 1:
+        # Forked workers must not share the parent's pooled connections: each opens its own
+        db.dispose_engines()
+    # One worker needs no pool: its shards (and their memory) stay in this process
+    with Pool(processes=workers) if workers > 1 else nullcontext() as pool:
+        shards = pool.imap_unordered(generate_shard, tasks) if pool else map(generate_shard, tasks)
+        for shard, order_count, item_count, seconds in shards:
+            total_orders += order_count
+            total_items += item_count
+            print(f" Shard {shard}: {order_count} orders, {item_count} items in {seconds:.1f}s "
+                  f"({total_orders}/{num_orders} orders done)")
+    
+    print(f" Generated: {num_customers} customers, {num_products} products, {total_orders} orders, {total_items} order items")
+    return total_items
+
+def main(num_customers=50, num_products=20, num_orders=100, seed=None, end_date=None,
+         workers=1, shard_size=SHARD_SIZE, output='db', output_dir='generated_data'):
+    """Generate the source data; returns True on success (so in-process callers can check it)"""
+    print(" Starting data generation...")
+    
+    if output == 'db':
+        if not check_database_connection():
+            return False
+    
+    if workers > 1 or output != 'db':
+        # SHARDED MODE: each worker streams its own id range straight to files or the database
+        if output == 'db' and not (clear_existing_data() and create_tables()):
+            return False
+        run_sharded_generation(num_customers, num_products, num_orders, seed, end_date,
+                               workers, shard_size, output, output_dir)
+        print(" Data generation completed!")
+        return True
+    
+    # One seed drives Faker and NumPy, so runs are reproducible
+    rng = np.random.default_rng(seed)
+    if seed is not None:
+        Faker.seed(seed)
+        random.seed(seed)
+    
+    # Step 1: Clear existing data
+    if not clear_existing_data():
+        return False
+    
+    # Step 2: Create tables
+    if not create_tables():
+        return False
+    
+    # Step 3: Generate data
+    print(" Generating customers...")
+    customers_df = generate_customers(num_customers, rng, end_date=end_date)
+    
+    print(" Generating products...")
+    products_df = generate_products(num_products, rng)
+    
+    print(" Generating orders and order items...")
+    orders_df, order_items_df = generate_orders(num_orders, customers_df['customer_id'], products_df, rng, end_date)
+    
+    # Step 4: Load to database
+    print(" Loading data to MySQL...")
+    if load_data_to_tables(customers_df, products_df, orders_df, order_items_df):
+        print(" Data generation completed!")
+        print(f" Generated: {len(customers_df)} customers, {len(products_df)} products, {len(orders_df)} orders, {len(order_items_df)} order items")
+        return True
+    else:
+        print(" Data generation failed!")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic e-commerce source data")
+    parser.add_argument('--customers', type=int, default=50, help="number of customers")
+    parser.add_argument('--products', type=int, default=20, help="number of products")
+    parser.add_argument('--orders', type=int, default=100, help="number of orders (about 2.2 items each)")
+    parser.add_argument('--seed', type=int, default=None, help="random seed for reproducible data")
+    parser.add_argument('--end-date', default=None, help="last order date, YYYY-MM-DD (default: today)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f"worker processes for sharded generation (this machine: {os.cpu_count()})")
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help="orders per shard")
+    parser.add_argument('--output', choices=OUTPUT_FORMATS, default='db',
+                        help="write to the source database or to per-shard CSV/Parquet files")
+    parser.add_argument('--output-dir', default='generated_data', help="directory for CSV/Parquet output")
+    db.add_arguments(parser)
+    args = parser.parse_args()
+    db.configure_from_args(args)
+    if not main(args.customers, args.products, args.orders, args.seed, args.end_date,
+                args.workers, args.shard_size, args.output, args.output_dir):
+        sys.exit(1)
\ No newline at end of file
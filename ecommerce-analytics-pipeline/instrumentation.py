@@ -0,0 +1,210 @@
+# instrumentation.py - PER-STAGE METRICS AND PROFILING FOR THE ETL
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+try:
+    import resource
+except ImportError:  # not available on Windows: peak RSS is then reported as None
+    resource = None
+
+# INSTRUMENTATION SETTINGS (override with environment variables or configure(); '' disables an output)
+METRICS_FILE = os.environ.get('ETL_METRICS_FILE', 'etl_metrics.jsonl')  # one JSON line per stage
+PROMETHEUS_FILE = os.environ.get('ETL_PROMETHEUS_FILE', 'etl_metrics.prom')  # node_exporter textfile
+PROFILE_DIR = os.environ.get('ETL_PROFILE_DIR', '')  # set to write a cProfile .pstats dump per stage
+
+RUN_ID = datetime.now().strftime('%Y%m%dT%H%M%S') + f"-{os.getpid()}"
+_totals = {}  # (stage, table) -> its finished records of this run summed, for the Prometheus textfile
+_local = threading.local()  # per-thread stack of running stages (table loads run inside the load stage)
+_write_lock = threading.Lock()  # stages running on several threads share the output files
+_running = 0  # stages running on all threads
+_running_lock = threading.Lock()
+
+def _active_stages():
+    if not hasattr(_local, 'stages'):
+        _local.stages = []
+    return _local.stages
+
+def configure(metrics_file=None, prometheus_file=None, profile_dir=None):
+    """Change where metrics and profiles go for this process"""
+    global METRICS_FILE, PROMETHEUS_FILE, PROFILE_DIR
+    if metrics_file is not None:
+        METRICS_FILE = metrics_file
+    if prometheus_file is not None:
+        PROMETHEUS_FILE = prometheus_file
+    if profile_dir is not None:
+        PROFILE_DIR = profile_dir
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter so the next reading covers one stage (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Peak RSS in MB since the last reset (VmHWM), or of the whole process where it cannot be reset"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1024
+
+def frame_bytes(*frames):
+    """Deep memory usage of some DataFrames in bytes"""
+    return int(sum(df.memory_usage(deep=True).sum() for df in frames if df is not None))
+
+class Stage:
+    """Metrics of one stage: use as a context manager and add the rows/bytes it moved"""
+
+    def __init__(self, name, table=None):
+        self.name = name
+        self.table = table
+        self.rows = 0
+        self.bytes = 0
+        self.peak_rss_mb = None
+        self.failed = False  # set by callers whose failures are reported by return value, not exception
+        self.profiler = None
+        self.result = None
+
+    def record(self, *frames):
+        """Count the rows and bytes of DataFrames this stage produced or moved"""
+        self.rows += sum(len(df) for df in frames if df is not None)
+        self.bytes += frame_bytes(*frames)
+
+    def _update_peak(self):
+        peak = peak_rss_mb()
+        if peak is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, peak)
+
+    def __enter__(self):
+        global _running
+        active = _active_stages()
+        # The parent keeps the peak it reached before this stage resets the counter.
+        # The counter is per process: while a stage runs on another thread it is not reset (that
+        # stage's peak would be lost), so concurrent stages share their peaks
+        if active:
+            active[-1]._update_peak()
+        with _running_lock:
+            if _running == len(active):
+                reset_peak_rss()
+            _running += 1
+        active.append(self)
+        # cProfile allows one active profiler per thread, so only outermost stages are profiled
+        if PROFILE_DIR and len(active) == 1:
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:  # Python 3.12+: another thread's stage is already being profiled
+                self.profiler = None
+        self.started_at = datetime.now()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _running
+        seconds = time.perf_counter() - self.start_time
+        if self.profiler is not None:
+            self.profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profiler.dump_stats(os.path.join(PROFILE_DIR, f"{RUN_ID}-{self.label()}.pstats"))
+        self._update_peak()
+        active = _active_stages()
+        active.pop()
+        with _running_lock:
+            _running -= 1
+        if active and self.peak_rss_mb is not None:
+            parent = active[-1]
+            parent.peak_rss_mb = max(parent.peak_rss_mb or 0.0, self.peak_rss_mb)
+
+        record = {
+            'run_id': RUN_ID,
+            'stage': self.name,
+            'table': self.table,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'seconds': round(seconds, 4),
+            'rows': int(self.rows),
+            'bytes': int(self.bytes),
+            'rows_per_sec': round(self.rows / seconds, 1) if seconds > 0 else 0.0,
+            'peak_rss_mb': round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+            'status': 'failed' if exc_type or self.failed else 'ok',
+        }
+        self.result = record
+        with _write_lock:
+            add_to_totals(record)
+            write_json_line(record)
+            # Once per outermost stage: nested table loads and chunks are only added to the totals
+            if not active:
+                write_prometheus()
+        if self.table is None:
+            peak_text = f"{record['peak_rss_mb']:,.1f} MB" if record['peak_rss_mb'] is not None else "n/a"
+            print(f" STAGE {self.name}: {seconds:.2f}s, {record['rows']:,} rows, "
+                  f"{record['bytes'] / 1e6:,.1f} MB, peak RSS {peak_text}")
+        return False
+
+    def label(self):
+        return f"{self.name}-{self.table}" if self.table else self.name
+
+def stage(name, table=None):
+    """Instrument a block: `with stage('extract') as metrics: ...; metrics.record(df)`"""
+    return Stage(name, table)
+
+def write_json_line(record):
+    """Append one stage record to the JSON lines file"""
+    if not METRICS_FILE:
+        return
+    with open(METRICS_FILE, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def add_to_totals(record):
+    """Add a finished stage to the run totals of its stage/table (repeated loads, e.g. chunks, summed)"""
+    key = (record['stage'], record['table'] or '')
+    if key in _totals:
+        previous = _totals[key]
+        peaks = [peak for peak in (previous['peak_rss_mb'], record['peak_rss_mb']) if peak is not None]
+        record = dict(record, seconds=previous['seconds'] + record['seconds'],
+                      rows=previous['rows'] + record['rows'], bytes=previous['bytes'] + record['bytes'],
+                      peak_rss_mb=max(peaks) if peaks else None,
+                      status='ok' if previous['status'] == record['status'] == 'ok' else 'failed')
+    _totals[key] = record
+
+def write_prometheus():
+    """Rewrite the Prometheus textfile with the totals of every stage/table of this run"""
+    if not PROMETHEUS_FILE:
+        return
+    metrics = [
+        ('etl_stage_duration_seconds', 'gauge', 'Wall time of the stage', lambda r: r['seconds']),
+        ('etl_stage_rows', 'gauge', 'Rows moved by the stage', lambda r: r['rows']),
+        ('etl_stage_bytes', 'gauge', 'In-memory bytes of the data moved by the stage', lambda r: r['bytes']),
+        ('etl_stage_peak_rss_bytes', 'gauge', 'Peak resident set size during the stage',
+         lambda r: r['peak_rss_mb'] * 1024 * 1024 if r['peak_rss_mb'] is not None else None),
+        ('etl_stage_success', 'gauge', '1 if the stage succeeded', lambda r: int(r['status'] == 'ok')),
+    ]
+    lines = []
+    for name, kind, help_text, value in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (stage_name, table), record in _totals.items():
+            if value(record) is not None:
+                lines.append(f'{name}{{stage="{stage_name}",table="{table}"}} {value(record)}')
+    lines.append("# HELP etl_last_run_timestamp_seconds Time the last stage of the last run finished")
+    lines.append("# TYPE etl_last_run_timestamp_seconds gauge")
+    lines.append(f"etl_last_run_timestamp_seconds {time.time():.0f}")
+
+    # Written to a temporary file and renamed, so the collector never reads a half-written file
+    temporary_file = f"{PROMETHEUS_FILE}.{os.getpid()}.tmp"
+    with open(temporary_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temporary_file, PROMETHEUS_FILE)
@@ -0,0 +1,34 @@
+# key_lookup.py - SURROGATE KEY LOOKUP FOR FACT ROWS
+import numpy as np
+import pandas as pd
+
+UNKNOWN_MEMBER_KEY = -1  # dimension row that facts point to when their member is missing
+
+class SurrogateKeyIndex:
+    """Natural key -> surrogate key index kept in two sorted NumPy arrays"""
+
+    def __init__(self, natural_keys, surrogate_keys, unknown_key=UNKNOWN_MEMBER_KEY):
+        natural_keys = np.asarray(natural_keys, dtype=np.int64)
+        order = np.argsort(natural_keys, kind='stable')
+        self.natural_keys = natural_keys[order]
+        self.surrogate_keys = np.asarray(surrogate_keys, dtype=np.int32)[order]
+        self.unknown_key = unknown_key
+
+    def positions(self, natural_keys):
+        """Index of every natural key in the sorted arrays, and whether it is there at all"""
+        natural_keys = pd.Series(natural_keys).fillna(-1).to_numpy(dtype=np.int64)
+        if len(self.natural_keys) == 0:
+            return np.zeros(len(natural_keys), dtype=np.int64), np.zeros(len(natural_keys), dtype=bool)
+        positions = np.searchsorted(self.natural_keys, natural_keys)
+        positions = np.minimum(positions, len(self.natural_keys) - 1)
+        return positions, self.natural_keys[positions] == natural_keys
+
+    def lookup(self, natural_keys):
+        """Surrogate keys for an array of natural keys; unknown members get unknown_key"""
+        positions, found = self.positions(natural_keys)
+        if len(self.natural_keys) == 0:
+            return np.full(len(positions), self.unknown_key, dtype=np.int32)
+        return np.where(found, self.surrogate_keys[positions], self.unknown_key).astype(np.int32)
+
+    def __len__(self):
+        return len(self.natural_keys)
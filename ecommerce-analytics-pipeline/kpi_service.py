@@ -0,0 +1,341 @@
+# kpi_service.py - CACHED KPI QUERIES OVER THE DATA WAREHOUSE
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+import pandas as pd
+from sqlalchemy import text
+import db
+
+# KPI CACHE SETTINGS (override with environment variables or configure())
+CACHE_MAX_ENTRIES = int(os.environ.get('KPI_CACHE_MAX_ENTRIES', 256))
+CACHE_MAX_BYTES = int(os.environ.get('KPI_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # least recently used go first
+CACHE_TTL_SECONDS = float(os.environ.get('KPI_CACHE_TTL', 3600))  # safety net for writes that bypass the ETL
+# etl_pipeline.py rewrites this file after every completed load; a newer file empties the cache
+LOAD_MARKER_FILE = os.environ.get('ETL_LOAD_MARKER', 'warehouse_loaded.json')
+HTTP_HOST = os.environ.get('KPI_HTTP_HOST', '127.0.0.1')
+HTTP_PORT = int(os.environ.get('KPI_HTTP_PORT', 8050))
+
+DATE_RANGE = {'from_date': (int, 0), 'to_date': (int, 99991231)}  # date_key bounds (YYYYMMDD)
+MONTH_RANGE = {'from_month': (int, 0), 'to_month': (int, 999912)}  # month_key bounds (YYYYMM)
+
+# KPI CATALOGUE: name -> query with named parameters as {name: (type, default)}.
+# The additive KPIs read the summary tables; only top_products has to scan fact_sales
+KPI_QUERIES = {
+    'revenue_by_day': {
+        'description': "Revenue, profit, units and order lines per day",
+        'params': DATE_RANGE,
+        'sql': """
+            SELECT date_key, SUM(revenue) AS revenue, SUM(profit) AS profit, SUM(quantity) AS quantity,
+                   SUM(order_lines) AS order_lines
+            FROM agg_sales_daily_category
+            WHERE date_key BETWEEN :from_date AND :to_date
+            GROUP BY date_key
+            ORDER BY date_key
+        """,
+    },
+    'revenue_by_month': {
+        'description': "Revenue, profit, units and order lines per month",
+        'params': MONTH_RANGE,
+        'sql': """
+            SELECT month_key, SUM(revenue) AS revenue, SUM(profit) AS profit, SUM(quantity) AS quantity,
+                   SUM(order_lines) AS order_lines
+            FROM agg_sales_monthly_city
+            WHERE month_key BETWEEN :from_month AND :to_month
+            GROUP BY month_key
+            ORDER BY month_key
+        """,
+    },
+    'revenue_by_category': {
+        'description': "Revenue, profit and units per product category",
+        'params': DATE_RANGE,
+        'sql': """
+            SELECT category, SUM(revenue) AS revenue, SUM(profit) AS profit, SUM(quantity) AS quantity
+            FROM agg_sales_daily_category
+            WHERE date_key BETWEEN :from_date AND :to_date
+            GROUP BY category
+            ORDER BY revenue DESC
+        """,
+    },
+    'revenue_by_city': {
+        'description': "Revenue, profit and units per customer city",
+        'params': MONTH_RANGE,
+        'sql': """
+            SELECT city, SUM(revenue) AS revenue, SUM(profit) AS profit, SUM(quantity) AS quantity
+            FROM agg_sales_monthly_city
+            WHERE month_key BETWEEN :from_month AND :to_month
+            GROUP BY city
+            ORDER BY revenue DESC
+        """,
+    },
+    'top_products': {
+        'description': "Best-selling products of each category by revenue",
+        'params': dict(DATE_RANGE, top_n=(int, 5)),
+        'sql': """
+            SELECT category, product_rank, product_id, product_name, revenue, quantity
+            FROM (
+                SELECT p.category, p.product_id, p.product_name,
+                       SUM(f.line_total) AS revenue, SUM(f.quantity) AS quantity,
+                       ROW_NUMBER() OVER (PARTITION BY p.category ORDER BY SUM(f.line_total) DESC, p.product_id)
+                           AS product_rank
+                FROM fact_sales f
+                JOIN dim_product p ON p.product_key = f.product_key
+                WHERE f.date_key BETWEEN :from_date AND :to_date
+                GROUP BY p.category, p.product_id, p.product_name
+            ) ranked
+            WHERE product_rank <= :top_n
+            ORDER BY category, product_rank
+        """,
+    },
+    'order_status_mix': {
+        'description': "Orders per status",
+        'params': DATE_RANGE,
+        'sql': """
+            SELECT order_status, SUM(order_count) AS order_count
+            FROM agg_orders_daily_status
+            WHERE date_key BETWEEN :from_date AND :to_date
+            GROUP BY order_status
+            ORDER BY order_count DESC
+        """,
+    },
+    'segment_mix': {
+        'description': "Customers and lifetime spend per spend segment",
+        'params': {},
+        'sql': """
+            SELECT customer_segment, COUNT(*) AS customers, SUM(total_spent) AS total_spent
+            FROM dim_customer
+            WHERE customer_key <> -1 AND is_current = 1
+            GROUP BY customer_segment
+            ORDER BY total_spent DESC
+        """,
+    },
+    'rfm_segment_mix': {
+        'description': "Customers, lifetime spend and average CLV per RFM segment",
+        'params': {},
+        'sql': """
+            SELECT rfm_segment, COUNT(*) AS customers, SUM(total_spent) AS total_spent, AVG(clv) AS avg_clv
+            FROM dim_customer
+            WHERE customer_key <> -1 AND is_current = 1
+            GROUP BY rfm_segment
+            ORDER BY total_spent DESC
+        """,
+    },
+    'cohort_retention': {
+        'description': "Retention rate of each acquisition cohort by months since its first order",
+        'params': {},
+        'sql': """
+            SELECT cohort_month, months_since, cohort_size, active_customers, retention_rate, revenue
+            FROM cohort_retention
+            ORDER BY cohort_month, months_since
+        """,
+    },
+}
+
+class KPICache:
+    """LRU result cache bounded by entry count and DataFrame bytes, with a time-to-live per entry"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (result, bytes, expires_at), least recently used first
+        self.bytes = 0
+        # Bumped by clear(): a query that started before an invalidation must not store its old result
+        self.generation = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()  # the HTTP endpoint answers on several threads
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, generation):
+        size = int(result.memory_usage(deep=True).sum())
+        with self.lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (result, size, time.monotonic() + self.ttl_seconds)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.generation += 1
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'generation': self.generation}
+
+cache = KPICache()
+_seen_marker = None  # (mtime_ns, size) of the load marker when the cache was last checked
+
+def configure(max_entries=None, max_bytes=None, ttl_seconds=None, load_marker_file=None):
+    """Change the cache limits and the load marker file (empties the cache)"""
+    global cache, LOAD_MARKER_FILE
+    if load_marker_file is not None:
+        LOAD_MARKER_FILE = load_marker_file
+    cache = KPICache(max_entries if max_entries is not None else cache.max_entries,
+                     max_bytes if max_bytes is not None else cache.max_bytes,
+                     ttl_seconds if ttl_seconds is not None else cache.ttl_seconds)
+
+def marker_version():
+    try:
+        stat = os.stat(LOAD_MARKER_FILE)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def check_load_marker():
+    """Empty the cache when a load completed since the last check (one stat() per request)"""
+    global _seen_marker
+    version = marker_version()
+    if version != _seen_marker:
+        _seen_marker = version
+        cache.clear()
+
+def invalidate_cache(mode='full'):
+    """Record a completed warehouse load: every KPI cache, in this process or another, drops its results"""
+    with open(LOAD_MARKER_FILE + '.tmp', 'w') as f:
+        json.dump({'mode': mode, 'loaded_at': datetime.now().isoformat(timespec='seconds'),
+                   'pid': os.getpid(), 'time_ns': time.time_ns()}, f)
+    os.replace(LOAD_MARKER_FILE + '.tmp', LOAD_MARKER_FILE)
+    cache.clear()
+
+def kpi_params(name, params):
+    """A KPI's parameters with defaults filled in and values converted to their declared types"""
+    if name not in KPI_QUERIES:
+        raise KeyError(f"unknown KPI '{name}' (available: {', '.join(KPI_QUERIES)})")
+    declared = KPI_QUERIES[name]['params']
+    unknown = set(params) - set(declared)
+    if unknown:
+        raise ValueError(f"unknown parameters for {name}: {', '.join(sorted(unknown))}")
+    try:
+        return {param: kind(params[param]) if param in params else default
+                for param, (kind, default) in declared.items()}
+    except ValueError as e:
+        raise ValueError(f"bad parameter for {name}: {e}")
+
+def run_query(name, params):
+    """Run one KPI query against the warehouse"""
+    result = pd.read_sql(text(KPI_QUERIES[name]['sql']), db.dw_engine(), params=params)
+    # MySQL returns DECIMAL sums as Decimal objects
+    for column in result.columns:
+        if result[column].dtype == object and len(result) and isinstance(result[column].iloc[0], Decimal):
+            result[column] = result[column].astype(float)
+    return result
+
+def query_kpi(name, **params):
+    """Answer a KPI from the cache, querying the warehouse only on a miss: (result, was cached)"""
+    params = kpi_params(name, params)
+    check_load_marker()
+    key = (name, tuple(sorted(params.items())))
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    generation = cache.generation
+    result = run_query(name, params)
+    cache.put(key, result, generation)
+    return result, False
+
+def get_kpi(name, **params):
+    """One KPI as a DataFrame, e.g. get_kpi('top_products', top_n=3)"""
+    result, _ = query_kpi(name, **params)
+    return result.copy()  # callers may modify their copy; the cached frame stays intact
+
+def catalogue():
+    return {name: {'description': kpi['description'],
+                   'params': {param: default for param, (kind, default) in kpi['params'].items()}}
+            for name, kpi in KPI_QUERIES.items()}
+
+class KPIRequestHandler(BaseHTTPRequestHandler):
+    """GET /kpis (catalogue), /kpis/<name>?param=value (rows as JSON) and /cache (statistics)"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            if parts == ['kpis']:
+                self.send_json(200, catalogue())
+            elif parts == ['cache']:
+                self.send_json(200, cache.stats())
+            elif len(parts) == 2 and parts[0] == 'kpis':
+                start_time = time.perf_counter()
+                result, cached = query_kpi(parts[1], **dict(parse_qsl(url.query)))
+                self.send_json(200, {'kpi': parts[1], 'cached': cached,
+                                     'seconds': round(time.perf_counter() - start_time, 4),
+                                     'rows': json.loads(result.to_json(orient='records', date_format='iso'))})
+            else:
+                self.send_json(404, {'error': f"no such path: {url.path}"})
+        except KeyError as e:
+            self.send_json(404, {'error': e.args[0]})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': f"KPI query failed: {e}"})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve(host=HTTP_HOST, port=HTTP_PORT):
+    """Answer KPI requests over HTTP until interrupted"""
+    server = ThreadingHTTPServer((host, port), KPIRequestHandler)
+    print(f" KPI service listening on http://{host}:{server.server_port}/kpis")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cached KPI queries over the Data Warehouse")
+    parser.add_argument('kpi', nargs='?', choices=list(KPI_QUERIES), help="print one KPI and exit")
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUE',
+                        help="KPI parameter, e.g. --param top_n=3 (repeatable)")
+    parser.add_argument('--serve', action='store_true', help="run the HTTP endpoint")
+    parser.add_argument('--host', default=HTTP_HOST)
+    parser.add_argument('--port', type=int, default=HTTP_PORT)
+    db.add_arguments(parser)
+    args = parser.parse_args()
+    db.configure_from_args(args)
+
+    if args.serve:
+        serve(args.host, args.port)
+    elif args.kpi:
+        try:
+            print(get_kpi(args.kpi, **dict(param.split('=', 1) for param in args.param)).to_string(index=False))
+        except Exception as e:
+            print(f" KPI QUERY FAILED: {e}")
+    else:
+        for name, kpi in catalogue().items():
+            print(f" {name}: {kpi['description']} {kpi['params'] or ''}")
@@ -0,0 +1,105 @@
+# out_of_core.py - HASH-PARTITIONED SPILL FILES AND A PROCESS POOL FOR TRANSFORMS LARGER THAN RAM
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+from instrumentation import RUN_ID
+
+# OUT-OF-CORE SETTINGS (override with environment variables or configure())
+SPILL_DIR = os.environ.get('ETL_SPILL_DIR', '.etl_spill')
+PARTITIONS = int(os.environ.get('ETL_PARTITIONS', 16))  # memory per partition ~ source size / PARTITIONS
+PROCESSES = int(os.environ.get('ETL_TRANSFORM_PROCESSES', os.cpu_count() or 1))  # partitions transformed at once
+BROADCAST_SUBDIR = 'broadcast'
+SCHEMA_SUBDIR = 'schema'  # an empty frame per spilled table, for partitions that received no rows
+
+_broadcast_cache = {}  # broadcast frames read by this (pool) process, by directory
+
+def configure(spill_dir=None, partitions=None, processes=None):
+    """Change where spill files go and how many partitions and processes a run uses"""
+    global SPILL_DIR, PARTITIONS, PROCESSES
+    if spill_dir:
+        SPILL_DIR = spill_dir
+    if partitions is not None:
+        PARTITIONS = partitions
+    if processes is not None:
+        PROCESSES = processes
+
+def run_spill_dir():
+    return os.path.join(SPILL_DIR, RUN_ID)
+
+def partition_dir(spill_dir, partition):
+    return os.path.join(spill_dir, f"part-{partition:04d}")
+
+def write_frame(df, path):
+    """Uncompressed Arrow IPC, like the checkpoints: fast to write and memory-mapped on read"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    feather.write_feather(df.reset_index(drop=True), path, compression='uncompressed')
+
+def read_frame(path):
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+def hash_partitions(keys, partitions):
+    """Partition number of every key: a hash spreads skewed or clustered ids evenly"""
+    hashes = pd.util.hash_array(np.asarray(keys, dtype=np.int64))
+    return (hashes % np.uint64(partitions)).astype(np.int64)
+
+def spill(df, name, key, spill_dir, partitions, chunk_number):
+    """Append one chunk of a table to the spill files of its key's partitions"""
+    schema_path = os.path.join(spill_dir, SCHEMA_SUBDIR, f"{name}.arrow")
+    if not os.path.exists(schema_path):
+        write_frame(df.iloc[:0], schema_path)
+    if df.empty:
+        return
+    for partition, rows in df.groupby(hash_partitions(df[key], partitions), sort=False):
+        write_frame(rows, os.path.join(partition_dir(spill_dir, partition), f"{name}-{chunk_number:06d}.arrow"))
+
+def read_partition(directory, name):
+    """All spilled chunks of one table in one partition (an empty frame when it received none)"""
+    paths = sorted(os.path.join(directory, file_name) for file_name in os.listdir(directory)
+                   if file_name.startswith(name + '-')) if os.path.isdir(directory) else []
+    if not paths:
+        return read_frame(os.path.join(os.path.dirname(directory), SCHEMA_SUBDIR, f"{name}.arrow"))
+    return pd.concat([read_frame(path) for path in paths], ignore_index=True)
+
+def write_broadcast(spill_dir, frames):
+    """Write the small tables every partition joins against: {name: frame}"""
+    for name, df in frames.items():
+        write_frame(df, os.path.join(spill_dir, BROADCAST_SUBDIR, f"{name}.arrow"))
+
+def read_broadcast(spill_dir, names):
+    """The broadcast tables, read once per process"""
+    key = (spill_dir, tuple(names))
+    if key not in _broadcast_cache:
+        _broadcast_cache.clear()
+        _broadcast_cache[key] = [read_frame(os.path.join(spill_dir, BROADCAST_SUBDIR, f"{name}.arrow"))
+                                 for name in names]
+    return _broadcast_cache[key]
+
+def spilled_partitions(spill_dir):
+    """Partition directories that received rows"""
+    return sorted(os.path.join(spill_dir, name) for name in os.listdir(spill_dir) if name.startswith('part-'))
+
+def map_partitions(function, tasks, processes=None):
+    """Run function over tasks on a process pool, yielding results as partitions finish
+
+    Results should be small (paths, partial aggregates): large outputs belong in spill files.
+    One process runs the tasks in this process, in order.
+    """
+    processes = min(processes or PROCESSES, len(tasks)) or 1
+    if processes == 1:
+        for task in tasks:
+            yield function(task)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(function, task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+def remove_spill(spill_dir):
+    shutil.rmtree(spill_dir, ignore_errors=True)
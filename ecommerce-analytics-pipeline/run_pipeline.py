@@ -1,68 +1,303 @@
-# run_pipeline.py - MASTER SCRIPT (NO EMOJIS)
-import subprocess
-import sys
-import time
-import os
-
-def run_script(script_name):
-    """Run a Python script and check if it succeeds"""
-    print(f"\n{'='*50}")
-    print(f"RUNNING: {script_name}")
-    print(f"{'='*50}")
-    
-    # Check if script exists
-    if not os.path.exists(script_name):
-        print(f"ERROR: Script {script_name} not found!")
-        return False
-    
-    try:
-        result = subprocess.run([sys.executable, script_name], check=True, capture_output=True, text=True)
-        print(result.stdout)  # Print the output of the script
-        
-        if result.stderr:
-            print(f"WARNING: {result.stderr}")
-            
-        if result.returncode == 0:
-            print(f"SUCCESS: {script_name} COMPLETED SUCCESSFULLY!")
-            return True
-        else:
-            print(f"ERROR: {script_name} FAILED!")
-            return False
-            
-    except subprocess.CalledProcessError as e:
-        print(f"ERROR: Error running {script_name}: {e}")
-        print(f"Error output: {e.stderr}")
-        return False
-    except Exception as e:
-        print(f"ERROR: Unexpected error: {e}")
-        return False
-
-def main():
-    print("STARTING SEMI-AUTOMATED PIPELINE")
-    start_time = time.time()
-    
-    # Run all scripts in sequence
-    scripts = [
-        "generate_data.py",
-        "etl_pipeline.py", 
-        "export_for_powerbi.py"
-    ]
-    
-    success_count = 0
-    for script in scripts:
-        if run_script(script):
-            success_count += 1
-        else:
-            print(f"ERROR: PIPELINE STOPPED at {script}")
-            break
-    
-    end_time = time.time()
-    
-    if success_count == len(scripts):
-        print(f"\nSUCCESS: PIPELINE COMPLETED IN {end_time - start_time:.2f} SECONDS!")
-        print("Your Power BI data is ready!")
-    else:
-        print(f"\nWARNING: Pipeline partially completed ({success_count}/{len(scripts)} scripts)")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+# run_pipeline.py - MASTER SCRIPT (NO EMOJIS)
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import pandas as pd
+import generate_data
+import etl_pipeline
+import data_quality
+import db
+import export_for_powerbi
+import kpi_service
+from instrumentation import stage
+
+# PIPELINE SETTINGS
+PIPELINE_WORKERS = 4  # stages that may run at the same time
+STATE_FILE = 'pipeline_state.json'  # completed stages of the last run, for --resume
+LOADED_FRAMES = 'loaded_frames'  # stage output counted in the metrics but not kept in the context
+EXPORT_FORMATS = ['csv', 'parquet', 'none']
+DEFAULT_OPTIONS = {'generate': True, 'customers': 50, 'products': 20, 'orders': 100, 'seed': None,
+                   'lean': False, 'export': 'csv', 'checkpoint': True,
+                   'transform_engine': 'pandas', 'load_workers': 1}
+
+_print_lock = threading.Lock()
+
+def log(message):
+    """Print a timestamped progress line as soon as it happens (stages run on several threads)"""
+    with _print_lock:
+        print(f"[{datetime.now():%H:%M:%S}] {message}", flush=True)
+
+def require(ok, message):
+    """Turn the scripts' True/False results into stage failures"""
+    if not ok:
+        raise RuntimeError(message)
+
+# STAGES: each takes the shared context and the run options, and returns new context entries
+def run_generate(context, options):
+    require(generate_data.main(options['customers'], options['products'], options['orders'], options['seed']),
+            "data generation failed")
+
+def run_read_watermarks(context, options):
+    return {'watermarks': etl_pipeline.read_source_watermarks()}
+
+def run_extract(context, options):
+    # On --resume the extract and transform are reloaded from their checkpoints, not the source
+    engine = options['transform_engine']
+    keys = etl_pipeline.checkpoint_keys(options['lean'], engine) if options['checkpoint'] else None
+    sources = etl_pipeline.extract_sources(options['lean'], keys=keys, engine=engine)
+    require(sources[0] is not None, "extract failed")
+    return dict(zip(['customers_df', 'products_df', 'orders_df', 'order_items_df'], sources), checkpoint_keys=keys)
+
+def run_validate(context, options):
+    sources = [context[name] for name in ['customers_df', 'products_df', 'orders_df', 'order_items_df']]
+    sources = data_quality.validate_sources(sources, source_engine=db.source_engine())
+    require(sources is not None, "data-quality rules violated")
+    # Recomputed on --resume, so the quarantined orders still reach store_watermarks
+    return dict(zip(['customers_df', 'products_df', 'orders_df', 'order_items_df'], sources),
+                quarantined_order_ids=data_quality.take_quarantined_order_ids())
+
+def run_transform(context, options):
+    sources = [context[name] for name in ['customers_df', 'products_df', 'orders_df', 'order_items_df']]
+    sales_detail_df, customer_totals = etl_pipeline.transform_sources(sources, options['lean'],
+                                                                      context['checkpoint_keys'],
+                                                                      options['transform_engine'])
+    require(sales_detail_df is not None, "transform failed")
+    return {'sales_detail_df': sales_detail_df, 'customer_totals': customer_totals}
+
+def run_assign_keys(context, options):
+    dim_customer_data, customer_index, product_index = etl_pipeline.assign_warehouse_keys(
+        context['sales_detail_df'], context['customer_totals'], context['products_df'],
+        context['customers_df'] if options['lean'] else None)
+    return {'dim_customer_data': dim_customer_data, 'customer_index': customer_index, 'product_index': product_index}
+
+def run_create_tables(context, options):
+    require(etl_pipeline.create_data_warehouse_tables(), "Data Warehouse creation failed")
+
+# The loads empty their staging tables first, so one that failed partway reruns cleanly on --resume.
+# They return the frames they loaded, for the stage metrics only
+def run_load_dim_customer(context, options):
+    return {LOADED_FRAMES: etl_pipeline.load_dim_customer(context['dim_customer_data'], context['customer_index'])}
+
+def run_load_dim_product(context, options):
+    return {LOADED_FRAMES: etl_pipeline.load_dim_product(context['products_df'], context['product_index'])}
+
+def run_load_dim_date(context, options):
+    return {LOADED_FRAMES: etl_pipeline.load_dim_date(context['sales_detail_df'])}
+
+def run_load_fact_sales(context, options):
+    return {LOADED_FRAMES: etl_pipeline.load_fact_sales(context['sales_detail_df'], context['customer_index'],
+                                                        context['product_index'], options['load_workers'])}
+
+def run_load_aggregates(context, options):
+    return {LOADED_FRAMES: etl_pipeline.load_summary_tables(context['sales_detail_df'], context['customer_index'],
+                                                          context['product_index'])}
+
+def run_load_cohorts(context, options):
+    return {LOADED_FRAMES: etl_pipeline.load_customer_cohorts(context['sales_detail_df'],
+                                                              context['dim_customer_data'])}
+
+def run_build_indexes(context, options):
+    require(etl_pipeline.build_warehouse_indexes(), "building the warehouse indexes failed")
+
+def run_publish(context, options):
+    require(etl_pipeline.publish_warehouse(), "publishing the staging tables failed")
+    kpi_service.invalidate_cache('full')
+
+def run_store_watermarks(context, options):
+    require(etl_pipeline.store_watermarks(context['watermarks'], context['quarantined_order_ids']), "saving the high-water marks failed")
+
+def run_summary(context, options):
+    etl_pipeline.print_warehouse_summary()
+
+def run_export_parquet(context, options):
+    require(export_for_powerbi.export_columnar_for_powerbi(), "Parquet export failed")
+
+def export_csv_stage(table):
+    def run_export_csv(context, options):
+        export_for_powerbi.export_table_csv(table)
+    return run_export_csv
+
+def build_pipeline(options):
+    """The pipeline as a DAG: stage -> (dependencies, function, pure)
+    
+    Pure stages only compute in memory. On --resume they are recomputed when a stage that still
+    has to run needs their results; stages with side effects that already completed are skipped.
+    """
+    loads = ['load_dim_customer', 'load_dim_product', 'load_dim_date', 'load_fact_sales', 'load_aggregates',
+             'load_cohorts']
+    pipeline = {}
+    if options['generate']:
+        pipeline['generate'] = ([], run_generate, False)
+    pipeline.update({
+        'read_watermarks': (['generate'] if options['generate'] else [], run_read_watermarks, True),
+        'extract': (['read_watermarks'], run_extract, True),
+        'validate': (['extract'], run_validate, True),
+        'transform': (['validate'], run_transform, True),
+        'assign_keys': (['transform'], run_assign_keys, True),
+        # Only drop and recreate the warehouse once the new data is ready
+        'create_tables': (['transform'], run_create_tables, False),
+        # Surrogate keys are pre-assigned, so the dimension and fact loads are independent
+        'load_dim_customer': (['assign_keys', 'create_tables'], run_load_dim_customer, False),
+        'load_dim_product': (['assign_keys', 'create_tables'], run_load_dim_product, False),
+        'load_dim_date': (['create_tables'], run_load_dim_date, False),
+        'load_fact_sales': (['assign_keys', 'create_tables'], run_load_fact_sales, False),
+        'load_aggregates': (['assign_keys', 'create_tables'], run_load_aggregates, False),
+        'load_cohorts': (['assign_keys', 'create_tables'], run_load_cohorts, False),
+        # Secondary indexes and statistics once, after every bulk load into the staging tables
+        'build_indexes': (loads, run_build_indexes, False),
+        # Readers see the previous load until all staging tables are swapped in together
+        'publish': (['build_indexes'], run_publish, False),
+        'store_watermarks': (['publish', 'validate'], run_store_watermarks, False),
+        'summary': (['publish'], run_summary, False),
+    })
+    if options['export'] == 'csv':
+        for table in export_for_powerbi.CSV_TABLES:
+            pipeline[f"export_{table}"] = (['publish'], export_csv_stage(table), False)
+    elif options['export'] == 'parquet':
+        pipeline['export_parquet'] = (['publish'], run_export_parquet, False)
+    return pipeline
+
+def load_state(path=STATE_FILE):
+    """Read the last run's state ({} when there is none)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(state, path=STATE_FILE):
+    """Write the run state atomically after every finished stage"""
+    state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def stages_to_run(pipeline, completed):
+    """Stages that still have side effects to apply, plus the pure stages whose results they need"""
+    to_run = {name for name, (_, _, pure) in pipeline.items() if not pure and name not in completed}
+    pending = list(to_run)
+    while pending:
+        for dependency in pipeline[pending.pop()][0]:
+            if dependency not in to_run and (pipeline[dependency][2] or dependency not in completed):
+                to_run.add(dependency)
+                pending.append(dependency)
+    return to_run
+
+def run_stage(name, run, context, options):
+    """Run one stage under the ETL instrumentation, counting the DataFrames it produced"""
+    with stage(name) as metrics:
+        outputs = run(context, options) or {}
+        loaded_frames = outputs.pop(LOADED_FRAMES, [])
+        metrics.record(*[value for value in outputs.values() if isinstance(value, pd.DataFrame)], *loaded_frames)
+    return outputs
+
+def run_dag(pipeline, options, state, workers=PIPELINE_WORKERS, state_file=STATE_FILE):
+    """Run every stage once its dependencies are done, independent stages concurrently"""
+    completed = set(state.get('completed', []))
+    to_run = stages_to_run(pipeline, completed)
+    done = set(pipeline) - to_run
+    for name in pipeline:
+        if name in done and name in completed:
+            log(f"SKIP: {name} (completed in the previous run)")
+    
+    context = {}
+    running = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            # Start every stage whose dependencies are done (nothing new after a failure)
+            if not failed:
+                for name in pipeline:
+                    dependencies, run, _ = pipeline[name]
+                    if name in to_run and name not in done and name not in running.values() \
+                            and all(dependency in done for dependency in dependencies):
+                        log(f"START: {name}")
+                        running[executor.submit(run_stage, name, run, context, options)] = name
+            if not running:
+                break
+            
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    context.update(future.result())
+                except Exception as e:
+                    failed.append(name)
+                    log(f"ERROR: {name} FAILED: {e}")
+                    continue
+                done.add(name)
+                completed.add(name)
+                log(f"SUCCESS: {name} completed")
+                state['completed'] = sorted(completed)
+                save_state(state, state_file)
+    
+    state['failed'] = failed
+    save_state(state, state_file)
+    return not failed and done == set(pipeline)
+
+def main(options=None, resume=False, workers=PIPELINE_WORKERS, state_file=STATE_FILE):
+    print("STARTING SEMI-AUTOMATED PIPELINE")
+    start_time = time.time()
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    if options['transform_engine'] == 'sql' and data_quality.QUALITY_ACTION == 'quarantine':
+        print("ERROR: --quality quarantine needs the extracted orders: use --transform-engine pandas")
+        return False
+    
+    pipeline = build_pipeline(options)
+    state = load_state(state_file) if resume else {}
+    if resume and state.get('options') != options:
+        if state:
+            print("WARNING: previous run used different options, starting over")
+        state = {}
+    state['options'] = options
+    state.setdefault('completed', [])
+    if resume and state['completed']:
+        print(f"RESUMING after {len(state['completed'])} completed stages")
+    
+    success = run_dag(pipeline, options, state, workers, state_file)
+    end_time = time.time()
+    
+    if success:
+        print(f"\nSUCCESS: PIPELINE COMPLETED IN {end_time - start_time:.2f} SECONDS!")
+        print("Your Power BI data is ready!")
+    else:
+        print(f"\nWARNING: Pipeline partially completed ({len(state['completed'])}/{len(pipeline)} stages)")
+        print("Fix the error and rerun with --resume to continue from the failed stage")
+    return success
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run generate -> ETL -> export as one in-process DAG")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"skip the stages the last run completed (state in {STATE_FILE})")
+    parser.add_argument('--workers', type=int, default=PIPELINE_WORKERS, help="stages run concurrently")
+    parser.add_argument('--no-generate', action='store_true', help="keep the existing source data")
+    parser.add_argument('--customers', type=int, default=DEFAULT_OPTIONS['customers'], help="customers to generate")
+    parser.add_argument('--products', type=int, default=DEFAULT_OPTIONS['products'], help="products to generate")
+    parser.add_argument('--orders', type=int, default=DEFAULT_OPTIONS['orders'], help="orders to generate")
+    parser.add_argument('--seed', type=int, default=None, help="random seed for reproducible data")
+    parser.add_argument('--lean', action='store_true', help="use the lean extract/transform")
+    parser.add_argument('--transform-engine', choices=etl_pipeline.transform_engine.TRANSFORM_ENGINES,
+                        default=DEFAULT_OPTIONS['transform_engine'],
+                        help="pandas: merge the extracted tables; sql: push the joins down to the source")
+    parser.add_argument('--no-checkpoint', action='store_true',
+                        help="always extract and transform from the source instead of reusing checkpoints")
+    parser.add_argument('--load-workers', type=int, default=DEFAULT_OPTIONS['load_workers'],
+                        help="split the fact_sales load into slices loaded on this many connections")
+    parser.add_argument('--quality', choices=data_quality.QUALITY_ACTIONS, default=None,
+                        help="on data-quality violations: warn, quarantine the orders, or fail")
+    parser.add_argument('--export', choices=EXPORT_FORMATS, default=DEFAULT_OPTIONS['export'],
+                        help="csv: one CSV per table; parquet: incremental columnar export; none: skip")
+    db.add_arguments(parser)
+    args = parser.parse_args()
+    db.configure_from_args(args)
+    data_quality.configure(args.quality)
+    options = {'generate': not args.no_generate, 'customers': args.customers, 'products': args.products,
+               'orders': args.orders, 'seed': args.seed, 'lean': args.lean, 'export': args.export,
+               'checkpoint': not args.no_checkpoint, 'transform_engine': args.transform_engine,
+               'load_workers': args.load_workers}
+    if not main(options, args.resume, args.workers):
+        sys.exit(1)
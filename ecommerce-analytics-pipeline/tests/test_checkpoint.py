@@ -0,0 +1,43 @@
+# test_checkpoint.py - CHECKPOINTS ARE REUSED ONLY WHILE THE SOURCE AND THE CODE ARE UNCHANGED
+import pandas as pd
+import data_quality
+import db
+import etl_pipeline
+from conftest import read_warehouse, touch_source
+
+def fact_count():
+    return int(pd.read_sql("SELECT COUNT(*) AS n FROM fact_sales", db.dw_engine())['n'][0])
+
+def test_fingerprint_follows_the_source_and_the_quality_action(source, monkeypatch):
+    extract_key, transform_key = etl_pipeline.checkpoint_keys()
+    assert etl_pipeline.checkpoint_keys() == (extract_key, transform_key)
+
+    # The quarantine rules only change what the transform sees
+    monkeypatch.setattr(data_quality, 'QUALITY_ACTION', 'quarantine')
+    quarantine_keys = etl_pipeline.checkpoint_keys()
+    assert quarantine_keys[0] == extract_key and quarantine_keys[1] != transform_key
+    monkeypatch.undo()
+
+    touch_source("INSERT INTO orders (order_id, customer_id, order_date, total_amount, status, created_at) "
+                 "VALUES (900001, 3, '2030-06-01', 20.0, 'completed', '2030-01-01')")
+    new_extract_key, new_transform_key = etl_pipeline.checkpoint_keys()
+    assert new_extract_key['source'] != extract_key['source']
+    assert new_transform_key != transform_key
+
+def test_rerun_reuses_checkpoints_until_the_source_changes(source, capsys):
+    etl_pipeline.main()
+    loaded = read_warehouse(['dim_customer', 'fact_sales'], ignore=['created_at'])
+    assert "CHECKPOINT hit" not in capsys.readouterr().out
+
+    etl_pipeline.main()
+    assert capsys.readouterr().out.count("CHECKPOINT hit") == 2
+    for table, frame in read_warehouse(['dim_customer', 'fact_sales'], ignore=['created_at']).items():
+        pd.testing.assert_frame_equal(frame, loaded[table], obj=table)
+
+    touch_source("INSERT INTO orders (order_id, customer_id, order_date, total_amount, status, created_at) "
+                 "VALUES (900001, 3, '2030-06-01', 20.0, 'completed', '2030-01-01')")
+    touch_source("INSERT INTO order_items (item_id, order_id, product_id, quantity, unit_price, created_at) "
+                 "VALUES (900001, 900001, 2, 2, 10.0, '2030-01-01')")
+    etl_pipeline.main()
+    assert "CHECKPOINT hit" not in capsys.readouterr().out
+    assert fact_count() == len(loaded['fact_sales']) + 1
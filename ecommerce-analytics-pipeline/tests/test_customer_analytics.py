@@ -0,0 +1,44 @@
+# test_customer_analytics.py - INCREMENTAL RE-SCORING AND COHORTS MATCH A FULL LOAD
+import pandas as pd
+import db
+import etl_pipeline
+from conftest import assert_frames_equal, read_table, touch_source
+
+SCORE_COLUMNS = ['customer_id', 'customer_segment', 'total_spent', 'order_count', 'first_order_date',
+                 'last_order_date', 'cohort_month', 'recency_days', 'r_score', 'f_score', 'm_score',
+                 'rfm_segment', 'clv']
+
+def read_analytics():
+    """Scores of the current customer versions and both cohort tables"""
+    scores = pd.read_sql(f"SELECT {', '.join(SCORE_COLUMNS)} FROM dim_customer "
+                         f"WHERE customer_key <> -1 AND is_current = 1 ORDER BY customer_id", db.dw_engine())
+    scores = scores.assign(first_order_date=pd.to_datetime(scores['first_order_date']),
+                           last_order_date=pd.to_datetime(scores['last_order_date']))
+    return {'scores': scores,
+            'customer_cohort_activity': read_table('customer_cohort_activity', 'customer_id, activity_month'),
+            'cohort_retention': read_table('cohort_retention', 'cohort_month, months_since')}
+
+def test_incremental_rescoring_matches_full_load(source):
+    etl_pipeline.main(checkpoints=False)
+    # A new order in a later month, a bigger line, a status change and an SCD Type 2 city change
+    touch_source("INSERT INTO orders (order_id, customer_id, order_date, total_amount, status, created_at) "
+                 "VALUES (900001, 3, '2030-06-01', 50.0, 'pending', '2030-01-01')")
+    touch_source("INSERT INTO order_items (item_id, order_id, product_id, quantity, unit_price, created_at) "
+                 "VALUES (900001, 900001, 2, 1, 50.0, '2030-01-01')")
+    touch_source("UPDATE order_items SET quantity = 100, created_at = '2030-01-01' WHERE item_id = 1")
+    touch_source("UPDATE orders SET status = 'shipped', created_at = '2030-01-01' WHERE order_id = 7")
+    touch_source("UPDATE customers SET city = 'Elsewhere', created_at = '2030-01-01' WHERE customer_id = 5")
+    etl_pipeline.main(mode='incremental')
+    incremental = read_analytics()
+    assert incremental['scores'].set_index('customer_id').loc[3, 'last_order_date'] == pd.Timestamp('2030-06-01')
+
+    etl_pipeline.main(checkpoints=False)
+    for table, frame in read_analytics().items():
+        assert_frames_equal(incremental[table], frame)
+
+def test_incremental_run_without_changes_keeps_scores(source):
+    etl_pipeline.main(checkpoints=False)
+    loaded = read_analytics()
+    etl_pipeline.main(mode='incremental')
+    for table, frame in read_analytics().items():
+        assert_frames_equal(loaded[table], frame)
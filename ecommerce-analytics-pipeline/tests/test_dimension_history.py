@@ -0,0 +1,51 @@
+# test_dimension_history.py - SCD TYPE 2 VERSIONS AND POINT-IN-TIME FACT KEYS
+import pandas as pd
+import db
+import etl_pipeline
+from conftest import read_table, read_warehouse, touch_source
+
+KEYED_TABLES = ['dim_customer', 'dim_product', 'fact_sales']
+
+def customer_sales(customer_id):
+    """Every sale of one customer with the version it is keyed to"""
+    return pd.read_sql("SELECT f.order_id, f.date_key, c.customer_key, c.city FROM fact_sales f "
+                       "JOIN dim_customer c ON c.customer_key = f.customer_key "
+                       "WHERE c.customer_id = :customer_id ORDER BY f.order_id, f.product_key",
+                       db.dw_engine(), params={'customer_id': customer_id})
+
+def test_unchanged_rerun_keeps_every_version_and_key(source):
+    etl_pipeline.main(checkpoints=False)
+    loaded = read_warehouse(KEYED_TABLES, ignore=['created_at'])
+    etl_pipeline.main(checkpoints=False)
+    for table, frame in read_warehouse(KEYED_TABLES, ignore=['created_at']).items():
+        pd.testing.assert_frame_equal(frame, loaded[table], obj=table)
+
+def test_sales_are_keyed_to_the_version_valid_on_their_order_date(source):
+    etl_pipeline.main(checkpoints=False)
+    first_sales = customer_sales(5)
+    old_city = first_sales['city'][0]
+    touch_source("UPDATE customers SET city = 'Elsewhere', created_at = '2030-01-01' WHERE customer_id = 5")
+
+    # The full reload adds a version, and every sale before the change stays on the closed one
+    etl_pipeline.main(checkpoints=False)
+    versions = read_table('dim_customer', 'customer_key').query("customer_id == 5")
+    assert versions['city'].tolist() == [old_city, 'Elsewhere']
+    assert versions['is_current'].tolist() == [0, 1]
+    assert versions['valid_to'].iloc[0] is not None
+    pd.testing.assert_frame_equal(customer_sales(5), first_sales)
+
+    # A sale after the change is keyed to the new version, by incremental and full loads alike
+    touch_source("INSERT INTO orders (order_id, customer_id, order_date, total_amount, status, created_at) "
+                 "VALUES (900001, 5, '2030-06-01', 20.0, 'completed', '2030-01-02')")
+    touch_source("INSERT INTO order_items (item_id, order_id, product_id, quantity, unit_price, created_at) "
+                 "VALUES (900001, 900001, 3, 2, 10.0, '2030-01-02')")
+    etl_pipeline.main(mode='incremental')
+    keyed = customer_sales(5)
+    assert keyed.query("order_id == 900001")['city'].tolist() == ['Elsewhere']
+    assert set(keyed.query("order_id != 900001")['city']) == {old_city}
+
+    etl_pipeline.main(checkpoints=False)
+    pd.testing.assert_frame_equal(customer_sales(5), keyed)
+    month_key = int(first_sales['date_key'][0]) // 100
+    etl_pipeline.main(mode='reload-months', months=[month_key])
+    pd.testing.assert_frame_equal(customer_sales(5), keyed)
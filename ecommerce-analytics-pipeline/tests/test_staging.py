@@ -0,0 +1,27 @@
+# test_staging.py - FULL LOADS CHANGE THE LIVE WAREHOUSE ONLY AT THE PUBLISH
+import pandas as pd
+import etl_pipeline
+import warehouse_schema
+from conftest import read_warehouse, touch_source
+
+def test_failed_full_load_leaves_the_previous_load_readable(source, monkeypatch):
+    etl_pipeline.main(checkpoints=False)
+    previous = read_warehouse(etl_pipeline.PUBLISHED_TABLES)
+    touch_source("UPDATE products SET category = 'Relabelled' WHERE product_id = 1")
+    touch_source("UPDATE customers SET city = 'Elsewhere' WHERE customer_id = 1")
+    touch_source("DELETE FROM order_items WHERE order_id = 1")
+
+    def fail(engine):
+        raise RuntimeError("simulated failure before the publish")
+    with monkeypatch.context() as patch:
+        patch.setattr(warehouse_schema, 'finish_bulk_load', fail)
+        etl_pipeline.main(checkpoints=False)
+    # Every dimension, fact and summary row is still the previous load's
+    for table, frame in read_warehouse(etl_pipeline.PUBLISHED_TABLES).items():
+        pd.testing.assert_frame_equal(frame, previous[table], obj=table)
+
+    etl_pipeline.main(checkpoints=False)
+    published = read_warehouse(['dim_customer', 'dim_product'])
+    assert published['dim_customer'].query("customer_id == 1 and is_current == 1")['city'].tolist() == ['Elsewhere']
+    assert len(published['dim_customer'].query("customer_id == 1")) == 2
+    assert published['dim_product'].query("product_id == 1 and is_current == 1")['category'].tolist() == ['Relabelled']
@@ -0,0 +1,101 @@
+# transform_engine.py - SQL PUSH-DOWN QUERIES FOR THE TRANSFORM AND BACKEND VALIDATION
+import pandas as pd
+from sqlalchemy import text
+
+# TRANSFORM ENGINES: 'pandas' merges extracted tables, 'sql' runs the joins/groupby in the source database
+TRANSFORM_ENGINES = ['pandas', 'sql']
+
+# Enriched sales columns as (table alias, column), in the column order of the pandas merges
+SALES_DETAIL_COLUMNS = [
+    ('o', 'order_id'), ('o', 'customer_id'), ('o', 'order_date'), ('o', 'total_amount'), ('o', 'status'),
+    ('i', 'item_id'), ('i', 'product_id'), ('i', 'quantity'), ('i', 'unit_price'),
+    ('p', 'product_name'), ('p', 'category'), ('p', 'price'),
+    ('c', 'first_name'), ('c', 'last_name'), ('c', 'city'), ('c', 'registration_date'),
+]
+LEAN_SALES_DETAIL_COLUMNS = [
+    ('o', 'order_id'), ('o', 'customer_id'), ('o', 'order_date'), ('o', 'status'),
+    ('i', 'product_id'), ('i', 'quantity'), ('i', 'unit_price'),
+    ('p', 'category'), ('c', 'city'),
+]
+
+# Per-customer order metrics, aggregated where the orders live
+CUSTOMER_TOTALS_QUERY = text("""
+    SELECT customer_id, SUM(total_amount) AS total_amount, COUNT(*) AS order_count,
+           MIN(order_date) AS first_order_date, MAX(order_date) AS last_order_date
+    FROM orders
+    GROUP BY customer_id
+""")
+
+def sales_detail_query(columns):
+    """Keyset-paged SELECT of enriched sales rows: the same inner/left joins as the pandas path, in SQL
+
+    Plain ANSI joins, so the query runs on MySQL and on embedded engines such as SQLite.
+    """
+    select = [f"{alias}.{column}" for alias, column in columns]
+    # item_id pages the result, also when the (lean) frame does not keep it
+    if ('i', 'item_id') not in columns:
+        select.append('i.item_id')
+    return text(f"""
+        SELECT {', '.join(select)}
+        FROM order_items i
+        JOIN orders o ON o.order_id = i.order_id
+        LEFT JOIN products p ON p.product_id = i.product_id
+        LEFT JOIN customers c ON c.customer_id = o.customer_id
+        WHERE i.item_id > :last_key
+        ORDER BY i.item_id
+        LIMIT :chunk_size
+    """)
+
+def iter_sales_detail(engine, columns, chunk_size):
+    """Yield pages of the enriched sales rows; only the joined result crosses the wire"""
+    query = sales_detail_query(columns)
+    last_key = 0
+    with engine.connect().execution_options(stream_results=True) as conn:
+        while True:
+            page = pd.read_sql(query, conn, params={'last_key': last_key, 'chunk_size': chunk_size})
+            if page.empty:
+                break
+            last_key = int(page['item_id'].iloc[-1])
+            if ('i', 'item_id') not in columns:
+                page = page.drop(columns='item_id')
+            yield page
+            if len(page) < chunk_size:
+                break
+
+def read_customer_totals(engine):
+    """Per-customer total, order count and first/last order date, grouped in the database"""
+    customer_totals = pd.read_sql(CUSTOMER_TOTALS_QUERY, engine)
+    customer_totals['total_amount'] = customer_totals['total_amount'].astype(float).round(2)
+    for column in ['first_order_date', 'last_order_date']:
+        customer_totals[column] = pd.to_datetime(customer_totals[column])
+    return customer_totals
+
+def normalized(df, keys):
+    """A frame in canonical form for comparison: plain (non-categorical) values, sorted by keys"""
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+    return df.sort_values(keys, kind='mergesort').reset_index(drop=True)
+
+def compare_outputs(expected, actual):
+    """Differences between two transform outputs (sales detail, customer totals); [] when identical"""
+    differences = []
+    for name, keys, left, right in [
+            ('sales_detail', None, expected[0], actual[0]),
+            ('customer_totals', ['customer_id'], expected[1], actual[1])]:
+        if list(left.columns) != list(right.columns):
+            differences.append(f"{name}: columns {list(left.columns)} != {list(right.columns)}")
+            continue
+        if len(left) != len(right):
+            differences.append(f"{name}: {len(left)} rows != {len(right)} rows")
+            continue
+        # Sales rows have no unique key in the lean frame, so they are ordered by every column
+        keys = keys or list(left.columns)
+        try:
+            # Same values; dtypes may differ only in category sets and integer widths
+            pd.testing.assert_frame_equal(normalized(left, keys), normalized(right, keys),
+                                          check_dtype=False, check_exact=True)
+        except AssertionError as e:
+            differences.append(f"{name}: {str(e).splitlines()[0]}")
+    return differences
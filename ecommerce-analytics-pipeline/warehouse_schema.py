@@ -0,0 +1,188 @@
+# warehouse_schema.py - WAREHOUSE INDEXES, FACT PARTITIONS AND TABLE STATISTICS
+import time
+import pandas as pd
+from sqlalchemy import inspect, text
+from bulk_loader import bulk_load
+
+# SECONDARY INDEXES: built after bulk loads instead of being maintained row by row during them
+SECONDARY_INDEXES = {
+    'fact_sales': {
+        'idx_fact_sales_date': ['date_key'],
+        'idx_fact_sales_customer': ['customer_key'],
+        'idx_fact_sales_product': ['product_key'],
+        'idx_fact_sales_order': ['order_id'],  # incremental loads replace facts by order
+    },
+    'dim_customer': {'idx_dim_customer_id': ['customer_id']},  # upserts by natural key
+    'dim_product': {'idx_dim_product_id': ['product_id']},
+}
+ANALYZE_TABLES = ['fact_sales', 'dim_customer', 'dim_product', 'dim_date']
+
+# STAGING: full loads build every table as <table>_staging and publish them all with one atomic rename,
+# so readers see the previous load until the new one is complete
+STAGING_SUFFIX = '_staging'
+RETIRED_SUFFIX = '_old'
+
+# FACT PARTITIONING (MySQL): one RANGE partition per month of date_key, created as months arrive.
+# pmax catches dates past the newest month; phistory holds everything before the first one
+FACT_PARTITIONING = "PARTITION BY RANGE (date_key) (PARTITION pmax VALUES LESS THAN MAXVALUE)"
+HISTORY_PARTITION = 'phistory'
+STAGING_TABLE = 'fact_sales_partition_stage'
+
+def is_mysql(connectable):
+    return connectable.dialect.name == 'mysql'
+
+def month_key_range(month_key):
+    """First date_key of a YYYYMM month and the first date_key of the month after it"""
+    year, month = divmod(int(month_key), 100)
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return year * 10000 + month * 100 + 1, next_year * 10000 + next_month * 100 + 1
+
+def partition_name(month_key):
+    return f"p{int(month_key)}"
+
+def staging(table):
+    return table + STAGING_SUFFIX
+
+def index_name(conn, name):
+    """Physical name for a declared index: SQLite index names are database-wide and survive table renames,
+    so a staging table's index takes the next free variant of the name"""
+    if is_mysql(conn):
+        return name
+    inspector = inspect(conn)
+    taken = {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+    candidate, number = name, 1
+    while candidate in taken:
+        number += 1
+        candidate = f"{name}_{number}"
+    return candidate
+
+def create_secondary_indexes(conn, tables=None, suffix=''):
+    """Build the declared secondary indexes that are missing (matched by columns), one sorted pass per index"""
+    created = 0
+    for table in tables or SECONDARY_INDEXES:
+        physical_table = table + suffix
+        indexed = {tuple(index['column_names']) for index in inspect(conn).get_indexes(physical_table)}
+        missing = {name: columns for name, columns in SECONDARY_INDEXES[table].items() if tuple(columns) not in indexed}
+        if not missing:
+            continue
+        if is_mysql(conn):
+            # All of a table's indexes in one ALTER, so InnoDB reads the table once
+            additions = ', '.join(f"ADD INDEX {name} ({', '.join(columns)})" for name, columns in missing.items())
+            conn.execute(text(f"ALTER TABLE {physical_table} {additions}"))
+        else:
+            for name, columns in missing.items():
+                conn.execute(text(f"CREATE INDEX {index_name(conn, name)} ON {physical_table} ({', '.join(columns)})"))
+        created += len(missing)
+    return created
+
+def analyze_tables(conn, tables=ANALYZE_TABLES, suffix=''):
+    """Refresh the optimizer statistics of freshly loaded tables"""
+    if is_mysql(conn):
+        conn.execute(text(f"ANALYZE TABLE {', '.join(table + suffix for table in tables)}"))
+    else:
+        for table in tables:
+            conn.execute(text(f"ANALYZE {table + suffix}"))
+
+def finish_bulk_load(engine, suffix=STAGING_SUFFIX):
+    """Build the secondary indexes of bulk-loaded (staging) tables, then ANALYZE them"""
+    start_time = time.perf_counter()
+    with engine.begin() as conn:
+        created = create_secondary_indexes(conn, suffix=suffix)
+        analyze_tables(conn, suffix=suffix)
+    print(f" Built {created} indexes and analyzed the warehouse in {time.perf_counter() - start_time:.2f}s")
+
+def publish_staging_tables(engine, tables):
+    """Swap every <table>_staging in for <table> in one atomic step, then drop the replaced tables"""
+    with engine.begin() as conn:
+        live = set(inspect(conn).get_table_names())
+        for table in tables:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}{RETIRED_SUFFIX}"))
+        replaced = [table for table in tables if table in live]
+        if is_mysql(conn):
+            # One RENAME TABLE statement swaps all tables atomically; readers block briefly, never see a gap
+            renames = [f"{table} TO {table}{RETIRED_SUFFIX}" for table in replaced]
+            renames += [f"{staging(table)} TO {table}" for table in tables]
+            conn.execute(text(f"RENAME TABLE {', '.join(renames)}"))
+        else:
+            # pysqlite autocommits DDL unless a transaction is open, so open one for the renames
+            if conn.dialect.name == 'sqlite':
+                conn.exec_driver_sql("BEGIN")
+            for table in replaced:
+                conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}{RETIRED_SUFFIX}"))
+            for table in tables:
+                conn.execute(text(f"ALTER TABLE {staging(table)} RENAME TO {table}"))
+        for table in replaced:
+            conn.execute(text(f"DROP TABLE {table}{RETIRED_SUFFIX}"))
+    print(f" Published {len(tables)} staging tables")
+
+def fact_partitions(conn, table='fact_sales'):
+    """Monthly partitions of a fact table as {name: upper date_key bound}, in bound order ({} when not partitioned)"""
+    if not is_mysql(conn):
+        return {}
+    rows = conn.execute(text("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """), {'table': table}).fetchall()
+    return {name: int(bound) for name, bound in rows if bound != 'MAXVALUE'}
+
+def ensure_partitions(engine, month_keys, table='fact_sales'):
+    """Split pmax so every month newer than the existing partitions gets its own (DDL: run outside transactions)"""
+    if not is_mysql(engine):
+        return 0
+    with engine.connect() as conn:
+        partitions = fact_partitions(conn, table)
+        newest_bound = max(partitions.values(), default=None)
+        months = sorted({int(m) for m in month_keys if newest_bound is None or month_key_range(m)[0] >= newest_bound})
+        if not months:
+            return 0
+        definitions = []
+        if newest_bound is None:
+            definitions.append(f"PARTITION {HISTORY_PARTITION} VALUES LESS THAN ({month_key_range(months[0])[0]})")
+        # Months are contiguous from the newest bound up, so each partition is exactly one month
+        month = months[0] if newest_bound is None else newest_bound // 100
+        while month <= months[-1]:
+            definitions.append(f"PARTITION {partition_name(month)} VALUES LESS THAN ({month_key_range(month)[1]})")
+            month = month_key_range(month)[1] // 100
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        conn.execute(text(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})"))
+        print(f" Added {len(definitions) - 1} {table} partitions")
+        return len(definitions) - 1
+
+def replace_partition(engine, month_key, fact_rows):
+    """Replace every fact_sales row of one month with fact_rows
+
+    MySQL loads the month into a staging table and swaps it in with EXCHANGE PARTITION, so readers
+    see the old month or the new one, never a half-loaded one. Without partitions the month is
+    deleted and reinserted in one transaction.
+    """
+    first_key, end_key = month_key_range(month_key)
+    if not is_mysql(engine) or partition_name(month_key) not in fact_partitions_of(engine):
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM fact_sales WHERE date_key >= :first_key AND date_key < :end_key"),
+                         {'first_key': first_key, 'end_key': end_key})
+            bulk_load(fact_rows, 'fact_sales', conn)
+        return 'delete_insert'
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+        conn.execute(text(f"CREATE TABLE {STAGING_TABLE} LIKE fact_sales"))
+        conn.execute(text(f"ALTER TABLE {STAGING_TABLE} REMOVE PARTITIONING"))
+        # New surrogate keys continue after the table's, so sales_key stays unique across partitions
+        next_key = conn.execute(text("SELECT COALESCE(MAX(sales_key), 0) + 1 FROM fact_sales")).scalar()
+        conn.execute(text(f"ALTER TABLE {STAGING_TABLE} AUTO_INCREMENT = {int(next_key)}"))
+        bulk_load(fact_rows, STAGING_TABLE, conn)
+        conn.execute(text(f"ALTER TABLE fact_sales EXCHANGE PARTITION {partition_name(month_key)} "
+                          f"WITH TABLE {STAGING_TABLE}"))
+        next_key = conn.execute(text("SELECT COALESCE(MAX(sales_key), 0) + 1 FROM fact_sales")).scalar()
+        conn.execute(text(f"ALTER TABLE fact_sales AUTO_INCREMENT = {int(next_key)}"))
+        conn.execute(text(f"DROP TABLE {STAGING_TABLE}"))
+    return 'exchange_partition'
+
+def fact_partitions_of(engine):
+    with engine.connect() as conn:
+        return fact_partitions(conn)
+
+def month_keys_of(date_key_values):
+    """Distinct YYYYMM months of some date_keys"""
+    return sorted(set((pd.Series(date_key_values, dtype='int64') // 100).tolist()))